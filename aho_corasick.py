@@ -0,0 +1,71 @@
+from collections import deque
+from typing import Any, Dict, Hashable, Iterator, List, Set, Tuple
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: все вхождения набора подстрок за один проход по тексту"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._values: List[List[Any]] = [[]]
+        self._output_link: List[int] = [-1]
+        self._built = False
+        self.pattern_count = 0
+
+    def add(self, pattern: str, value: Any) -> None:
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._values.append([])
+                self._output_link.append(-1)
+            node = next_node
+        self._values[node].append(value)
+        self.pattern_count += 1
+        self._built = False
+
+    def build(self) -> 'AhoCorasick':
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            self._output_link[node] = -1
+            queue.append(node)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_target = self._goto[fail].get(char, 0)
+                self._fail[child] = fail_target if fail_target != child else 0
+                target = self._fail[child]
+                self._output_link[child] = target if self._values[target] else self._output_link[target]
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, Any]]:
+        """Пары (позиция конца совпадения, значение) в порядке появления в тексте"""
+        if not self._built:
+            self.build()
+        goto, fail, values, output_link = self._goto, self._fail, self._values, self._output_link
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if values[node] else output_link[node]
+            while match > 0:
+                for value in values[match]:
+                    yield position, value
+                match = output_link[match]
+
+    def find_values(self, text: str) -> Set[Hashable]:
+        return {value for _, value in self.iter_matches(text)}
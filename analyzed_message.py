@@ -0,0 +1,123 @@
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+# Разбор токена: (текст токена, лемма, часть речи)
+ParsedToken = Tuple[str, str, Optional[str]]
+
+_FIELDS = ('text', '_cleaned', '_parsed', '_lemmas', '_processed', '_lowered')
+
+
+class AnalyzedMessage:
+    """Разобранное сообщение, общее для всех классификаторов.
+
+    Очистка и морфологический разбор выполняются один раз при первом
+    обращении к производным полям; леммы, вектор TF-IDF и эмбеддинг
+    считаются по требованию и запоминаются. При передаче в другой процесс
+    передаются только уже посчитанные текстовые поля.
+    """
+
+    __slots__ = ('text', '_processor', '_cleaned', '_parsed', '_lemmas', '_kept_lemmas',
+                 '_processed', '_lowered', '_rows', '_embedding')
+
+    def __init__(self, text: str, processor=None):
+        self.text = text or ''
+        self._processor = processor
+        self._cleaned: Optional[str] = None
+        self._parsed: Optional[Tuple[ParsedToken, ...]] = None
+        self._lemmas: Optional[List[str]] = None
+        self._kept_lemmas: Dict[FrozenSet[str], List[str]] = {}
+        self._processed: Optional[str] = None
+        self._lowered: Optional[str] = None
+        # Строки TF-IDF по векторизатору: модель намерений может смениться при горячей перезагрузке
+        self._rows: List[Tuple[Any, Any]] = []
+        self._embedding: Optional[np.ndarray] = None
+
+    @property
+    def cleaned(self) -> str:
+        if self._cleaned is None:
+            self._cleaned = self._processor.clear_phrase(self.text)
+        return self._cleaned
+
+    @property
+    def lowered(self) -> str:
+        """Исходный текст в нижнем регистре для поиска ключевых слов"""
+        if self._lowered is None:
+            self._lowered = self.text.lower()
+        return self._lowered
+
+    @property
+    def parsed(self) -> Tuple[ParsedToken, ...]:
+        if self._parsed is None:
+            self._parsed = self._processor.parse_cleaned(self.cleaned)
+        return self._parsed
+
+    @property
+    def tokens(self) -> List[str]:
+        return [token for token, _, _ in self.parsed]
+
+    @property
+    def pos_tags(self) -> List[Optional[str]]:
+        return [pos for _, _, pos in self.parsed]
+
+    @property
+    def lemmas(self) -> List[str]:
+        """Значимые леммы без стоп-слов, как у TextProcessor.lemmatize_text"""
+        if self._lemmas is None:
+            self._lemmas = self._processor.select_lemmas(self.parsed)
+        return self._lemmas
+
+    def lemmas_keeping(self, words: FrozenSet[str]) -> List[str]:
+        """Значимые леммы, среди которых оставлены слова words (например, отрицания)"""
+        if not words:
+            return self.lemmas
+        lemmas = self._kept_lemmas.get(words)
+        if lemmas is None:
+            lemmas = self._processor.select_lemmas(self.parsed, words)
+            self._kept_lemmas[words] = lemmas
+        return lemmas
+
+    @property
+    def processed(self) -> str:
+        """Леммы через пробел: вход модели намерений"""
+        if self._processed is None:
+            self._processed = ' '.join(self.lemmas)
+        return self._processed
+
+    def ensure_cleaned(self) -> 'AnalyzedMessage':
+        """Выполнить очистку сейчас, а не при первом обращении к полям"""
+        self.cleaned
+        return self
+
+    def ensure_parsed(self) -> 'AnalyzedMessage':
+        """Выполнить очистку, морфологический разбор и отбор лемм сейчас"""
+        self.lemmas
+        return self
+
+    def tfidf_row(self, vectorizer) -> Any:
+        """Разреженная строка признаков сообщения для данного векторизатора"""
+        for owner, row in self._rows:
+            if owner is vectorizer:
+                return row
+        row = vectorizer.transform([self.processed])
+        self._rows.append((vectorizer, row))
+        return row
+
+    @property
+    def embedding(self) -> Optional[np.ndarray]:
+        """Средний вектор лемм из эмбеддингов Natasha; None, если ни одно слово не известно"""
+        if self._embedding is None:
+            vectors = [vector for vector in map(self._processor.emb.get, self.lemmas) if vector is not None]
+            if vectors:
+                self._embedding = np.mean(vectors, axis=0)
+        return self._embedding
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in _FIELDS}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        # Недостающие поля досчитываются общим для процесса TextProcessor
+        from nlp_resources import get_text_processor
+        self.__init__(state['text'], get_text_processor())
+        for name in _FIELDS[1:]:
+            setattr(self, name, state[name])
@@ -0,0 +1,200 @@
+import io
+import struct
+import subprocess
+import wave
+from typing import Optional, Union
+
+from config import VOICE_CONFIG
+
+AudioBuffer = Union[bytes, bytearray, memoryview]
+
+SAMPLE_WIDTH = 2
+
+# Битрейты MPEG Layer III, кбит/с: для MPEG-1 и для MPEG-2/2.5
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+class AudioDecodeError(Exception):
+    """Аудио не удалось разобрать или перекодировать"""
+
+
+class PCMAudio:
+    """Несжатый звук: 16-битные отсчёты little-endian"""
+
+    __slots__ = ('data', 'sample_rate', 'channels')
+
+    def __init__(self, data: bytes, sample_rate: int, channels: int = 1):
+        self.data = data
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    @property
+    def duration(self) -> float:
+        return len(self.data) / (self.sample_rate * self.channels * SAMPLE_WIDTH)
+
+    def to_wav(self) -> bytes:
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as wav:
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(SAMPLE_WIDTH)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(self.data)
+        return output.getvalue()
+
+
+def _ffmpeg(data: AudioBuffer, input_args: list, output_args: list) -> bytes:
+    """Прогнать данные через ffmpeg по каналам stdin/stdout, не касаясь диска"""
+    command = [VOICE_CONFIG['ffmpeg_path'], '-hide_banner', '-loglevel', 'error', '-nostdin',
+               *input_args, '-i', 'pipe:0', *output_args, 'pipe:1']
+    try:
+        process = subprocess.run(command, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 timeout=VOICE_CONFIG['decode_timeout'])
+    except FileNotFoundError:
+        raise AudioDecodeError(f"ffmpeg не найден: {VOICE_CONFIG['ffmpeg_path']}")
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError("ffmpeg не уложился в отведённое время")
+    if process.returncode != 0:
+        raise AudioDecodeError(process.stderr.decode('utf-8', 'replace').strip() or "ffmpeg завершился с ошибкой")
+    return process.stdout
+
+
+def _wav_chunks(data: AudioBuffer):
+    """Чанки RIFF/WAVE: (идентификатор, смещение данных, размер)"""
+    view = memoryview(data)
+    if len(view) < 12 or view[:4] != b'RIFF' or view[8:12] != b'WAVE':
+        raise AudioDecodeError("Не WAV-файл")
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        size, = struct.unpack_from('<I', view, offset + 4)
+        yield chunk_id, offset + 8, min(size, len(view) - offset - 8)
+        offset += 8 + size + (size & 1)
+
+
+def _read_wav(data: AudioBuffer) -> PCMAudio:
+    view = memoryview(data)
+    fmt = None
+    for chunk_id, offset, size in _wav_chunks(view):
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack_from('<HHIIHH', view, offset)
+        elif chunk_id == b'data' and fmt:
+            audio_format, channels, sample_rate, _, _, bits = fmt
+            if audio_format != 1 or bits != 16:
+                raise AudioDecodeError("Поддерживается только 16-битный PCM")
+            return PCMAudio(bytes(view[offset:offset + size]), sample_rate, channels)
+    raise AudioDecodeError("В WAV нет данных")
+
+
+def decode_to_pcm(data: AudioBuffer, input_format: str = 'ogg', sample_rate: int = None,
+                  channels: int = 1) -> PCMAudio:
+    """Декодировать сжатый звук из памяти в PCM с нужной частотой и числом каналов"""
+    sample_rate = sample_rate or VOICE_CONFIG['sample_rate']
+    if input_format == 'wav':
+        try:
+            audio = _read_wav(data)
+        except AudioDecodeError:
+            audio = None
+        # WAV в нужном формате не требует запуска ffmpeg
+        if audio and audio.sample_rate == sample_rate and audio.channels == channels:
+            return audio
+    pcm = _ffmpeg(data, ['-f', input_format],
+                  ['-f', 's16le', '-acodec', 'pcm_s16le', '-ac', str(channels), '-ar', str(sample_rate)])
+    return PCMAudio(pcm, sample_rate, channels)
+
+
+def encode(data: AudioBuffer, input_format: str, output_format: str) -> bytes:
+    """Перекодировать звук между форматами через каналы ffmpeg"""
+    if output_format == 'wav':
+        return decode_to_pcm(data, input_format).to_wav()
+    return _ffmpeg(data, ['-f', input_format], ['-f', output_format])
+
+
+def encode_opus(data: AudioBuffer, input_format: str, bitrate: str = None) -> bytes:
+    """Сжать звук в Opus внутри Ogg — формат голосовых сообщений Telegram"""
+    bitrate = bitrate or VOICE_CONFIG['tts_opus_bitrate']
+    return _ffmpeg(data, ['-f', input_format],
+                   ['-ac', '1', '-c:a', 'libopus', '-b:a', bitrate, '-application', 'voip', '-f', 'ogg'])
+
+
+def _ogg_duration(view: memoryview) -> Optional[float]:
+    if len(view) < 28 or view[:4] != b'OggS':
+        return None
+    segments = view[26]
+    payload = 27 + segments
+    if view[payload:payload + 8] == b'OpusHead':
+        pre_skip, = struct.unpack_from('<H', view, payload + 10)
+        rate = 48000
+    elif view[payload:payload + 7] == b'\x01vorbis':
+        pre_skip = 0
+        rate, = struct.unpack_from('<I', view, payload + 12)
+    else:
+        return None
+    # Страница Ogg не длиннее 65307 байт, последняя целиком лежит в этом хвосте
+    tail_start = max(0, len(view) - 65307 - 27)
+    last_page = bytes(view[tail_start:]).rfind(b'OggS')
+    if last_page < 0:
+        return None
+    granule, = struct.unpack_from('<q', view, tail_start + last_page + 6)
+    return max(granule - pre_skip, 0) / rate
+
+
+def _wav_duration(view: memoryview) -> Optional[float]:
+    byte_rate = None
+    for chunk_id, offset, size in _wav_chunks(view):
+        if chunk_id == b'fmt ':
+            byte_rate, = struct.unpack_from('<I', view, offset + 8)
+        elif chunk_id == b'data' and byte_rate:
+            return size / byte_rate
+    return None
+
+
+def _mp3_duration(view: memoryview) -> Optional[float]:
+    offset = 0
+    if view[:3] == b'ID3' and len(view) >= 10:
+        size = view[6] << 21 | view[7] << 14 | view[8] << 7 | view[9]
+        offset = 10 + size
+    duration = 0.0
+    frames = 0
+    while offset + 4 <= len(view):
+        header, = struct.unpack_from('>I', view, offset)
+        version = (header >> 19) & 3
+        layer = (header >> 17) & 3
+        bitrate_index = (header >> 12) & 15
+        rate_index = (header >> 10) & 3
+        if (header >> 21) & 0x7FF != 0x7FF or version == 1 or layer != 1 \
+                or bitrate_index in (0, 15) or rate_index == 3:
+            # Не заголовок кадра Layer III: конец потока или мусор в конце файла
+            break
+        bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+        rate = _MP3_SAMPLE_RATES[version][rate_index]
+        samples = 1152 if version == 3 else 576
+        padding = (header >> 9) & 1
+        frame_length = samples // 8 * bitrate // rate + padding
+        # Первый кадр может быть служебным (Xing/Info от LAME) и звука не содержит
+        first_frame = bytes(view[offset:offset + frame_length]) if frames == 0 else b''
+        if b'Xing' not in first_frame and b'Info' not in first_frame:
+            duration += samples / rate
+        offset += frame_length
+        frames += 1
+    return duration if frames else None
+
+
+def get_duration(data: AudioBuffer, audio_format: str) -> float:
+    """Длительность по заголовкам контейнера; декодирование — только если формат не разобран"""
+    view = memoryview(data)
+    parsers = {'ogg': _ogg_duration, 'oga': _ogg_duration, 'opus': _ogg_duration,
+               'wav': _wav_duration, 'mp3': _mp3_duration}
+    parser = parsers.get(audio_format)
+    duration = None
+    if parser:
+        try:
+            duration = parser(view)
+        except (AudioDecodeError, struct.error, IndexError):
+            duration = None
+    if duration is None:
+        duration = decode_to_pcm(view, audio_format).duration
+    return duration
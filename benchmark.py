@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from dialogue_index import parse_dialogues
+from perfume_bot import PerfumeBot
+
+# Голосовой модуль не импортируется: бенчмарк проверяет только текстовый путь
+# и работает без сети, микрофона и ffmpeg.
+
+RENDER_METHODS = [
+    'show_catalog', 'show_prices', 'recommend_by_gender', 'show_promotions',
+    'show_brand', 'recommend_by_criteria', 'process_purchase_intent'
+]
+
+
+class StageTimer:
+    """Оборачивает методы объектов и копит время выполнения по этапам"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap(self, obj: Any, method_name: str, stage: str):
+        original = getattr(obj, method_name)
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - started)
+
+        setattr(obj, method_name, timed)
+
+    def reset(self):
+        for samples in self.samples.values():
+            samples.clear()
+
+
+def instrument(bot: PerfumeBot) -> StageTimer:
+    timer = StageTimer()
+    timer.wrap(bot.text_processor, 'clear_phrase', 'clear_phrase')
+    timer.wrap(bot.text_processor, 'parse_cleaned', 'lemmatize_text')
+    timer.wrap(bot.sentiment_analyzer, 'analyze_message', 'sentiment')
+    timer.wrap(bot.topic_classifier, 'get_main_topic_from_lemmas', 'topic')
+    timer.wrap(bot.intent_classifier, 'predict_message', 'intent')
+    timer.wrap(bot, '_search_in_dialogues', 'dialogue_search')
+    for method_name in RENDER_METHODS:
+        timer.wrap(bot.perfume_service, method_name, 'render')
+    return timer
+
+
+def load_corpus(intents_path: str, dialogues_path: str) -> List[str]:
+    with open(intents_path, 'r', encoding='utf-8') as f:
+        intents = json.load(f)
+    messages = [example for data in intents.values() for example in data.get('examples', [])]
+    if os.path.exists(dialogues_path):
+        with open(dialogues_path, 'r', encoding='utf-8') as f:
+            messages.extend(question for question, _ in parse_dialogues(f.read()))
+    return messages
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {'calls': 0}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'calls': len(samples),
+        'total_ms': float(values.sum()),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(values.max())
+    }
+
+
+def run_benchmark(messages: List[str], iterations: int, warmup: bool, cold_cache: bool) -> Dict[str, Any]:
+    started = time.perf_counter()
+    bot = PerfumeBot()
+    startup = time.perf_counter() - started
+    timer = instrument(bot)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if warmup:
+            for i, message in enumerate(messages):
+                bot.process_message(message, f"warmup_{i % 50}")
+        timer.reset()
+
+        latencies: List[float] = []
+        total_started = time.perf_counter()
+        for iteration in range(iterations):
+            if cold_cache:
+                bot.text_processor.lemma_cache.clear()
+                bot.text_processor.normal_form_cache.clear()
+            for i, message in enumerate(messages):
+                message_started = time.perf_counter()
+                bot.process_message(message, f"user_{i % 50}")
+                latencies.append(time.perf_counter() - message_started)
+        total_elapsed = time.perf_counter() - total_started
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'messages': len(messages),
+        'iterations': iterations,
+        'warmup': warmup,
+        'cold_cache': cold_cache,
+        'startup_s': startup,
+        'throughput_msg_s': len(latencies) / total_elapsed if total_elapsed else 0.0,
+        'latency': summarize(latencies),
+        'stages': {stage: summarize(samples) for stage, samples in sorted(timer.samples.items())},
+        'caches': bot.text_processor.get_cache_stats()
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Список регрессий p95 относительно сохранённого прогона"""
+    regressions = []
+    pairs = [('latency', current['latency'], baseline.get('latency', {}))]
+    pairs += [(stage, stats, baseline.get('stages', {}).get(stage, {}))
+              for stage, stats in current['stages'].items()]
+    for name, stats, base in pairs:
+        if not base.get('p95_ms') or not stats.get('p95_ms'):
+            continue
+        ratio = stats['p95_ms'] / base['p95_ms']
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: p95 {base['p95_ms']:.3f} -> {stats['p95_ms']:.3f} мс (x{ratio:.2f})")
+    return regressions
+
+
+def print_report(result: Dict[str, Any]):
+    latency = result['latency']
+    print(f"Сообщений: {result['messages']} x {result['iterations']}, "
+          f"пропускная способность {result['throughput_msg_s']:.1f} сообщ./с")
+    print(f"Задержка: p50 {latency['p50_ms']:.2f} мс | p95 {latency['p95_ms']:.2f} мс | "
+          f"p99 {latency['p99_ms']:.2f} мс")
+    print(f"{'Этап':<18}{'вызовов':>9}{'всего, мс':>12}{'p50, мс':>10}{'p95, мс':>10}")
+    for stage, stats in result['stages'].items():
+        if not stats['calls']:
+            continue
+        print(f"{stage:<18}{stats['calls']:>9}{stats['total_ms']:>12.1f}"
+              f"{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк текстового пути PerfumeBot")
+    parser.add_argument('--intents', default='intents.json')
+    parser.add_argument('--dialogues', default='dialogues.txt')
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--no-warmup', action='store_true')
+    parser.add_argument('--cold-cache', action='store_true', help="очищать кэши лемматизации перед каждым проходом")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="JSON предыдущего прогона для сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="допустимый рост p95, доля")
+    args = parser.parse_args(argv)
+
+    messages = load_corpus(args.intents, args.dialogues)
+    result = run_benchmark(messages, args.iterations, not args.no_warmup, args.cold_cache)
+    print_report(result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("Обнаружены регрессии:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("Регрессий относительно базового прогона нет")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
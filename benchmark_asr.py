@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from audio_codec import PCMAudio, decode_to_pcm
+from benchmark import summarize
+from config import VOICE_CONFIG
+from speech_backends import BACKENDS, create_recognizer
+
+AUDIO_EXTENSIONS = ('.ogg', '.oga', '.opus', '.wav', '.mp3')
+
+
+def find_clips(paths: List[str]) -> List[str]:
+    clips = []
+    for path in paths:
+        if os.path.isdir(path):
+            clips.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            clips.append(path)
+    return clips
+
+
+def load_clip(path: str) -> Tuple[PCMAudio, float, Optional[str]]:
+    """PCM клипа, его длительность и эталонная расшифровка из файла .txt рядом, если есть"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    audio_format = os.path.splitext(path)[1].lstrip('.').lower()
+    pcm = decode_to_pcm(data, 'ogg' if audio_format in ('oga', 'opus') else audio_format)
+    reference_path = os.path.splitext(path)[0] + '.txt'
+    reference = None
+    if os.path.exists(reference_path):
+        with open(reference_path, 'r', encoding='utf-8') as f:
+            reference = f.read().strip()
+    return pcm, pcm.duration, reference
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def run_backend(name: str, clips: List[Tuple[str, PCMAudio, float, Optional[str]]],
+                concurrency: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    recognizer = create_recognizer(name)
+    recognizer.load()
+    load_time = time.perf_counter() - started
+
+    def recognize(clip):
+        path, pcm, duration, reference = clip
+        clip_started = time.perf_counter()
+        text, status = recognizer.recognize(pcm)
+        return path, time.perf_counter() - clip_started, duration, reference, text, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(recognize, clips))
+    wall_time = time.perf_counter() - started
+
+    latencies = [latency for _, latency, _, _, _, _ in results]
+    audio_seconds = sum(duration for _, _, duration, _, _, _ in results)
+    errors = [word_error_rate(reference, text or '') for _, _, _, reference, text, _ in results if reference]
+    return {
+        'backend': name,
+        'load_s': load_time,
+        'clips': len(results),
+        'failed': sum(1 for *_, status in results if status != 'success'),
+        'concurrency': concurrency,
+        'latency': summarize(latencies),
+        'real_time_factor': sum(latencies) / audio_seconds if audio_seconds else 0.0,
+        'throughput_audio_s_per_s': audio_seconds / wall_time if wall_time else 0.0,
+        'wer': sum(errors) / len(errors) if errors else None,
+        'transcripts': {path: text for path, _, _, _, text, _ in results}
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'Движок':<10}{'загрузка, с':>13}{'p50, мс':>10}{'p95, мс':>10}{'RTF':>8}"
+          f"{'аудио-с/с':>11}{'WER':>7}{'ошибок':>8}")
+    for result in results:
+        latency = result['latency']
+        wer = f"{result['wer']:.2f}" if result['wer'] is not None else '—'
+        print(f"{result['backend']:<10}{result['load_s']:>13.2f}{latency.get('p50_ms', 0):>10.0f}"
+              f"{latency.get('p95_ms', 0):>10.0f}{result['real_time_factor']:>8.2f}"
+              f"{result['throughput_audio_s_per_s']:>11.1f}{wer:>7}{result['failed']:>8}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение движков распознавания речи на голосовых клипах")
+    parser.add_argument('clips', nargs='+', help="аудиофайлы или каталоги; эталон — одноимённый .txt")
+    parser.add_argument('--backends', default=','.join(BACKENDS), help="через запятую")
+    parser.add_argument('--concurrency', type=int, default=VOICE_CONFIG['asr_max_concurrency'])
+    parser.add_argument('--output', default='benchmark_asr_results.json')
+    args = parser.parse_args(argv)
+
+    clips = [(path, *load_clip(path)) for path in find_clips(args.clips)]
+    if not clips:
+        print("Не найдено ни одного аудиофайла")
+        return 1
+    print(f"Клипов: {len(clips)}, всего {sum(clip[2] for clip in clips):.1f} с аудио")
+
+    results = []
+    for name in args.backends.split(','):
+        try:
+            results.append(run_backend(name.strip(), clips, args.concurrency))
+        except Exception as e:
+            print(f"Движок {name} пропущен: {e}")
+    print_report(results)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from aho_corasick import AhoCorasick
+
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'brand': 2.0,
+    'notes': 1.0,
+    'description': 1.0,
+    'season': 1.0,
+    'occasion': 1.0,
+    'gender': 1.0
+}
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _field_texts(perfume: Dict[str, Any], field: str) -> Iterable[str]:
+    value = perfume.get(field)
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [item for items in value.values() for item in items]
+    return list(value)
+
+
+class CatalogIndex:
+    """Индекс каталога: токены по полям и автоматы для поиска упоминаний ароматов"""
+
+    def __init__(self, catalog: Dict[str, Dict[str, Any]]):
+        self.catalog = catalog
+        self.order = {perfume_id: position for position, perfume_id in enumerate(catalog)}
+
+        self.name_matcher = AhoCorasick()
+        self.name_matcher_exact = AhoCorasick()
+        self.brand_word_matcher = AhoCorasick()
+        self.name_word_matcher = AhoCorasick()
+        postings: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+        for perfume_id, perfume in catalog.items():
+            self.name_matcher.add(perfume['name'].lower(), perfume_id)
+            self.name_matcher_exact.add(perfume['name'], perfume_id)
+            for word in set(perfume['brand'].lower().split()):
+                self.brand_word_matcher.add(word, perfume_id)
+            for word in set(perfume['name'].lower().split()):
+                if len(word) > 3:
+                    self.name_word_matcher.add(word, perfume_id)
+            for field, weight in FIELD_WEIGHTS.items():
+                for text in _field_texts(perfume, field):
+                    for token in tokenize(text):
+                        postings[token][perfume_id] += weight
+
+        for matcher in (self.name_matcher, self.name_matcher_exact,
+                        self.brand_word_matcher, self.name_word_matcher):
+            matcher.build()
+        self.postings = {token: dict(docs) for token, docs in postings.items()}
+        self.tokens = sorted(self.postings)
+
+    def _in_catalog_order(self, perfume_ids: Iterable[str]) -> List[str]:
+        return sorted(perfume_ids, key=self.order.__getitem__)
+
+    def find_mentions(self, text: str, case_sensitive: bool = False) -> List[str]:
+        """Ароматы, название которых встречается в тексте, в порядке каталога"""
+        if case_sensitive:
+            return self._in_catalog_order(self.name_matcher_exact.find_values(text))
+        return self._in_catalog_order(self.name_matcher.find_values(text.lower()))
+
+    def extract_perfume(self, text: str) -> Optional[str]:
+        """Первый аромат по полному названию или по сочетанию бренда и слова из названия"""
+        text_lower = text.lower()
+        mentioned = self.find_mentions(text_lower)
+        if mentioned:
+            return mentioned[0]
+        by_brand = self.brand_word_matcher.find_values(text_lower)
+        if not by_brand:
+            return None
+        candidates = by_brand & self.name_word_matcher.find_values(text_lower)
+        if candidates:
+            return self._in_catalog_order(candidates)[0]
+        return None
+
+    def _expand(self, term: str) -> List[str]:
+        """Токены индекса, начинающиеся с term"""
+        start = bisect_left(self.tokens, term)
+        expanded = []
+        for token in self.tokens[start:]:
+            if not token.startswith(term):
+                break
+            expanded.append(token)
+        return expanded
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """Ранжированный поиск: сначала совпавшие по большему числу слов запроса, затем по весу полей"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        scores: Dict[str, float] = defaultdict(float)
+        matched_terms: Dict[str, int] = defaultdict(int)
+        for term in terms:
+            term_scores: Dict[str, float] = {}
+            for token in self._expand(term):
+                # Полное совпадение слова весит больше, чем совпадение по префиксу
+                boost = 1.0 if token == term else 0.5
+                for perfume_id, weight in self.postings[token].items():
+                    term_scores[perfume_id] = max(term_scores.get(perfume_id, 0.0), weight * boost)
+            for perfume_id, score in term_scores.items():
+                scores[perfume_id] += score
+                matched_terms[perfume_id] += 1
+
+        ranked = sorted(scores, key=lambda perfume_id: (-matched_terms[perfume_id], -scores[perfume_id],
+                                                        self.order[perfume_id]))
+        return ranked[:limit] if limit else ranked
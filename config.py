@@ -21,12 +21,174 @@ THRESHOLDS = {
 VOICE_CONFIG = {
     'language': 'ru',
     'timeout': 5,
-    'phrase_time_limit': 10
+    'phrase_time_limit': 10,
+    # 'google' — облачный сервис, 'vosk' — локальная модель из vosk_model_path
+    'asr_backend': 'google',
+    'vosk_model_path': 'models/vosk-model-small-ru-0.22',
+    'sample_rate': 16000,
+    # Сколько распознаваний одновременно выполняется в процессе
+    'asr_max_concurrency': 2,
+    'ffmpeg_path': 'ffmpeg',
+    'decode_timeout': 20,
+    # 'gtts' — облачный синтез, 'espeak' — локальный espeak-ng
+    'tts_backend': 'gtts',
+    'espeak_path': 'espeak-ng',
+    'espeak_voice': '',
+    'espeak_speed': 160,
+    # Голосовые ответы хранятся и отправляются в Opus, как голосовые сообщения Telegram
+    'tts_format': 'opus',
+    'tts_opus_bitrate': '32k',
+    'tts_cache_enabled': True,
+    'tts_cache_dir': 'tts_cache',
+    'tts_cache_max_bytes': 200 * 1024 * 1024,
+    # Недописанные .tmp старше этого срока остались от упавших процессов и удаляются при старте
+    'tts_cache_stale_tmp_seconds': 3600
 }
 
 HIST_THEME_LEN = 15
 
 SENTIMENT_CONFIG = {
     'positive_threshold': 0.1,
-    'negative_threshold': -0.1
+    'negative_threshold': -0.1,
+    'lexicon_path': 'sentiment_lexicon.tsv',
+    # Отрицание меняет знак оценки слов в пределах окна после него
+    'negators': ['не', 'нет', 'ни'],
+    'negation_window': 3,
+    'negation_factor': -1.0
+}
+
+SESSION_CONFIG = {
+    'max_sessions': 10000,
+    'ttl_seconds': 6 * 60 * 60,
+    'snapshot_path': 'sessions.json',
+    # Где хранится состояние диалогов: 'memory' (до перезапуска) или 'sqlite'
+    'backend': 'sqlite',
+    'state_path': 'sessions.db',
+    # Изменения сессий копятся в памяти и пишутся одной транзакцией раз в интервал
+    'flush_interval': 0.3,
+    'busy_timeout': 5.0
+}
+
+DIALOGUE_INDEX_CONFIG = {
+    'path': 'dialogues.txt',
+    'ngram_size': 3,
+    'top_k': 20,
+    'max_postings': 20000,
+    'check_interval': 2.0
+}
+
+EXECUTOR_CONFIG = {
+    'nlp_mode': 'process',
+    'nlp_workers': 2,
+    'dialog_workers': 4,
+    'voice_workers': 4,
+    'max_pending_messages': 64,
+    'max_pending_voice': 16,
+    'queue_timeout': 2.0,
+    'update_timeout': 30.0,
+    'concurrent_updates': 32,
+    'lag_check_interval': 0.1
+}
+
+VOICE_PIPELINE_CONFIG = {
+    # Голосовых сообщений в обработке одновременно, включая скачивание; сверх лимита — отказ
+    'max_in_flight': 32,
+    # Длина очереди перед каждой стадией
+    'stage_queue_size': 16,
+    # None — по числу ядер: ffmpeg работает в отдельных процессах
+    'decode_workers': None,
+    'asr_workers': VOICE_CONFIG['asr_max_concurrency'],
+    'nlp_workers': 8,
+    'tts_workers': 4,
+    'job_timeout': 60.0
+}
+
+WEBHOOK_CONFIG = {
+    # 'polling' — один процесс с опросом getUpdates, 'webhook' — маршрутизатор и процессы-воркеры
+    'mode': 'polling',
+    'listen': '0.0.0.0',
+    'port': 8443,
+    'path': '/telegram',
+    # Внешний адрес, который сообщается Telegram через setWebhook; пустой — вебхук уже настроен
+    'public_url': '',
+    'secret_token': '',
+    'workers': 2,
+    # Воркеры уже параллельны между собой, поэтому анализ внутри них идёт в потоках
+    'worker_nlp_mode': 'thread',
+    # Адрес Bot API; переопределяется для локального fake_telegram.py
+    'api_base_url': None,
+    'api_file_url': None
+}
+
+UPDATE_QUEUE_CONFIG = {
+    'enabled': True,
+    # В режиме вебхука у каждого воркера свой файл: updates.<номер>.db
+    'path': 'updates.db',
+    # NORMAL в режиме WAL переживает падение процесса; FULL — ещё и отключение питания
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5.0,
+    'batch_size': 64,
+    'concurrency': EXECUTOR_CONFIG['concurrent_updates'],
+    'poll_interval': 0.5,
+    # Долгий опрос getUpdates: offset подтверждается следующим запросом после записи пачки в журнал
+    'get_updates_timeout': 10,
+    'get_updates_limit': 100,
+    # Сколько раз выдавать обновление, которое так и не подтвердилось, прежде чем пропустить
+    'max_attempts': 3,
+    # Пауза перед повтором упавшего обновления, удваивается с каждой попыткой
+    'retry_delay': 1.0,
+    'retention_seconds': 24 * 60 * 60
+}
+
+METRICS_CONFIG = {
+    'enabled': True,
+    # Эндпоинт /metrics слушает только локальный интерфейс
+    'host': '127.0.0.1',
+    'port': 9108,
+    # Границы корзин гистограмм времени этапов, секунды
+    'buckets': [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+    # Доля сообщений, для которых пишется структурированный лог анализа
+    'log_sample_rate': 0.01
+}
+
+INTENT_BATCH_CONFIG = {
+    'enabled': False,
+    'max_batch_size': 64,
+    'max_delay_ms': 3
+}
+
+INCREMENTAL_CONFIG = {
+    # Модель намерений, которая дообучается на лету при add_intent/remove_intent.
+    # При nlp_mode='process' у каждого воркера своя модель: до них доходят только правки
+    # intents.json (CONTENT_CONFIG['hot_reload']), а вызовы add_intent в главном процессе — нет
+    'enabled': False,
+    'n_features': 2 ** 15,
+    'alpha': 0.1
+}
+
+CONTENT_CONFIG = {
+    # Горячая перезагрузка intents.json, dialogues.txt, каталога и keyword_rules.json без перезапуска
+    'hot_reload': True,
+    'poll_interval': 1.0,
+    'catalog_path': 'perfumes_data.py'
+}
+
+KEYWORD_ROUTER_CONFIG = {
+    # Ключевые фразы ответов и алиасы брендов; правила перечитываются вместе с остальным контентом
+    'rules_path': 'keyword_rules.json'
+}
+
+TEXT_CACHE_CONFIG = {
+    'lemma_cache_size': 20000,
+    'normal_form_cache_size': 100000,
+    # Вклад отдельной леммы в баллы тем
+    'topic_lemma_cache_size': 50000
+}
+
+REPLAY_CONFIG = {
+    'workers': 2,
+    'chunk_size': 1000,
+    'chunks_in_flight': 2,
+    'part_rows': 100000,
+    'text_field': 'text'
 }
@@ -0,0 +1,133 @@
+import json
+import os
+import runpy
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import CONTENT_CONFIG, KEYWORD_ROUTER_CONFIG
+from keyword_router import load_keyword_rules
+from perfume_service import CatalogSnapshot
+
+
+def load_intents(path: str) -> Dict[str, Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        intents = json.load(f)
+    if not isinstance(intents, dict) or not all(isinstance(data, dict) for data in intents.values()):
+        raise ValueError("ожидается объект вида {намерение: {examples, responses, ...}}")
+    return intents
+
+
+def load_catalog(path: str, version: int = 1) -> CatalogSnapshot:
+    """Выполнить модуль с данными каталога и собрать из него снимок с индексом"""
+    namespace = runpy.run_path(path)
+    return CatalogSnapshot(namespace['PERFUMES_CATALOG'], namespace['RECOMMENDATIONS'],
+                           namespace['PROMOTIONS'], version)
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class _Source:
+    def __init__(self, name: str, path: str, load: Callable[[str], Any], apply: Callable[[Any], None]):
+        self.name = name
+        self.path = path
+        self.load = load
+        self.apply = apply
+        self.signature = _file_signature(path)
+        self.failed_signature: Optional[Tuple[int, int]] = None
+        self.version = 1
+        self.errors = 0
+
+
+class ContentWatcher:
+    """Следит за файлами контента и подменяет данные бота новыми версиями.
+
+    Новая версия полностью загружается в фоновом потоке и только затем
+    публикуется; если файл не разобрался, остаётся предыдущая версия.
+    """
+
+    def __init__(self, poll_interval: float = None):
+        self.poll_interval = poll_interval or CONTENT_CONFIG['poll_interval']
+        self._sources: Dict[str, _Source] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._check_lock = threading.Lock()
+
+    def watch(self, name: str, path: str, load: Callable[[str], Any], apply: Callable[[Any], None]):
+        """Считать текущее содержимое файла загруженным и следить за его изменениями"""
+        self._sources[name] = _Source(name, path, load, apply)
+
+    def check(self) -> Dict[str, int]:
+        """Перезагрузить изменившиеся файлы; возвращает новые версии обновлённых источников"""
+        updated = {}
+        with self._check_lock:
+            for source in self._sources.values():
+                signature = _file_signature(source.path)
+                if signature is None or signature in (source.signature, source.failed_signature):
+                    continue
+                try:
+                    value = source.load(source.path)
+                    source.apply(value)
+                except Exception as e:
+                    # Файл мог быть прочитан на середине записи: попробуем снова при следующем изменении
+                    source.failed_signature = signature
+                    source.errors += 1
+                    print(f"Не удалось обновить {source.name} из {source.path}: {e}")
+                    continue
+                source.signature = signature
+                source.failed_signature = None
+                source.version += 1
+                updated[source.name] = source.version
+                print(f"Обновлено: {source.name}, версия {source.version}")
+        return updated
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='content-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: {'version': source.version, 'errors': source.errors}
+                for name, source in self._sources.items()}
+
+
+def watch_bot_content(bot, start: bool = True) -> ContentWatcher:
+    """Подключить к боту горячую перезагрузку намерений, диалогов, каталога и ключевых фраз"""
+    watcher = ContentWatcher()
+    watcher.watch('intents', bot.config.path, load_intents, bot.config.replace_intents)
+
+    # Индекс диалогов перестраивается здесь, а не в потоке обработки сообщений
+    dialogue_index = bot.dialogue_index
+    dialogue_index.watch = False
+    watcher.watch('dialogues', dialogue_index.path, lambda path: path, lambda path: dialogue_index.reload())
+
+    service = bot.perfume_service
+
+    def apply_catalog(snapshot: CatalogSnapshot):
+        service.load_snapshot(snapshot)
+        # Названия ароматов входят в автомат ключевых фраз
+        bot.reload_keyword_rules()
+
+    watcher.watch('catalog', CONTENT_CONFIG['catalog_path'],
+                  lambda path: load_catalog(path, service.snapshot.version + 1), apply_catalog)
+    watcher.watch('keyword_rules', KEYWORD_ROUTER_CONFIG['rules_path'], load_keyword_rules, bot.reload_keyword_rules)
+    if start:
+        watcher.start()
+    return watcher
@@ -0,0 +1,185 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+from config import DIALOGUE_INDEX_CONFIG
+
+
+def normalize_for_dialogue(text: str) -> str:
+    text = text.lower()
+    text = re.sub(r'[\W_]+', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def parse_dialogues(content: str) -> List[Tuple[str, str]]:
+    """Парсинг файла диалогов"""
+    dialogues = []
+    lines = content.strip().split('\n')
+
+    current_question = None
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith('Q:'):
+            current_question = line[2:].strip()
+        elif (line.startswith('A:') or line.startswith('А:')) and current_question:
+            dialogues.append((current_question, line[2:].strip()))
+            current_question = None
+
+    return dialogues
+
+
+def char_ngrams(text: str, n: int) -> List[str]:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return [padded]
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+
+class _DialogueData:
+    """Неизменяемый снимок индекса; заменяется целиком при перезагрузке"""
+
+    __slots__ = ('questions', 'answers', 'exact', 'postings', 'idf', 'norms', 'mtime', 'size')
+
+    def __init__(self, dialogues: List[Tuple[str, str]], ngram_size: int, mtime: float, size: int):
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.exact: Dict[str, int] = {}
+        self.mtime = mtime
+        self.size = size
+
+        postings = defaultdict(list)
+        for question, answer in dialogues:
+            norm_q = normalize_for_dialogue(question)
+            doc_id = len(self.questions)
+            self.questions.append(norm_q)
+            self.answers.append(answer)
+            self.exact.setdefault(norm_q, doc_id)
+            for gram in set(char_ngrams(norm_q, ngram_size)):
+                postings[gram].append(doc_id)
+
+        total = max(len(self.questions), 1)
+        self.postings: Dict[str, List[int]] = dict(postings)
+        self.idf: Dict[str, float] = {
+            gram: math.log(1 + total / len(docs)) for gram, docs in self.postings.items()
+        }
+        norms = [0.0] * len(self.questions)
+        for gram, docs in self.postings.items():
+            weight = self.idf[gram] ** 2
+            for doc_id in docs:
+                norms[doc_id] += weight
+        self.norms = [math.sqrt(value) or 1.0 for value in norms]
+
+
+class DialogueIndex:
+    """Предрассчитанный индекс вопросов из dialogues.txt для быстрого поиска ответа"""
+
+    def __init__(self, path: str = None, ngram_size: int = None, top_k: int = None,
+                 max_postings: int = None, check_interval: float = None):
+        self.path = path or DIALOGUE_INDEX_CONFIG['path']
+        self.ngram_size = ngram_size or DIALOGUE_INDEX_CONFIG['ngram_size']
+        self.top_k = top_k or DIALOGUE_INDEX_CONFIG['top_k']
+        self.max_postings = max_postings or DIALOGUE_INDEX_CONFIG['max_postings']
+        self.check_interval = (check_interval if check_interval is not None
+                               else DIALOGUE_INDEX_CONFIG['check_interval'])
+        self._data: Optional[_DialogueData] = None
+        self._last_check = 0.0
+        # False, если файл отслеживает внешний наблюдатель (content_store)
+        self.watch = True
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    def __len__(self) -> int:
+        data = self._data
+        return len(data.questions) if data else 0
+
+    def reload(self, force: bool = False) -> bool:
+        """Перестроить индекс, если файл изменился; возвращает True при перестроении"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._data = None
+            return False
+
+        data = self._data
+        if not force and data and data.mtime == stat.st_mtime and data.size == stat.st_size:
+            return False
+
+        with self._reload_lock:
+            data = self._data
+            if not force and data and data.mtime == stat.st_mtime and data.size == stat.st_size:
+                return False
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            self._data = _DialogueData(parse_dialogues(content), self.ngram_size,
+                                       stat.st_mtime, stat.st_size)
+            return True
+
+    def _maybe_reload(self):
+        if not self.watch:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        self.reload()
+
+    def _candidates(self, data: _DialogueData, norm_user: str) -> List[int]:
+        grams = [gram for gram in set(char_ngrams(norm_user, self.ngram_size)) if gram in data.postings]
+        # Редкие n-граммы самые информативные; частые добираем, пока не
+        # исчерпан бюджет просмотренных записей, чтобы время поиска не росло с корпусом
+        grams.sort(key=lambda gram: len(data.postings[gram]))
+        scores: Dict[int, float] = defaultdict(float)
+        touched = 0
+        for gram in grams:
+            docs = data.postings[gram]
+            if touched and touched + len(docs) > self.max_postings:
+                break
+            touched += len(docs)
+            weight = data.idf[gram]
+            for doc_id in docs:
+                scores[doc_id] += weight
+
+        best = heapq.nlargest(self.top_k, scores.items(),
+                              key=lambda item: item[1] / data.norms[item[0]])
+        return sorted(doc_id for doc_id, _ in best)
+
+    def search(self, text: str) -> Optional[str]:
+        self._maybe_reload()
+        data = self._data
+        if not data or not data.questions:
+            return None
+
+        norm_user = normalize_for_dialogue(text)
+        if not norm_user:
+            return None
+
+        exact_id = data.exact.get(norm_user)
+        if exact_id is not None:
+            return data.answers[exact_id]
+
+        candidates = self._candidates(data, norm_user)
+        for doc_id in candidates:
+            norm_q = data.questions[doc_id]
+            if norm_user in norm_q or norm_q in norm_user:
+                return data.answers[doc_id]
+
+        threshold = 0.45 if len(norm_user) > 20 else 0.35
+        best_match = None
+        best_score = 0.0
+        for doc_id in candidates:
+            similarity = SequenceMatcher(None, norm_user, data.questions[doc_id]).ratio()
+            if similarity > best_score and similarity > threshold:
+                best_score = similarity
+                best_match = data.answers[doc_id]
+        return best_match
@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from benchmark import summarize
+
+BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': 'АроматБот', 'username': 'fake_perfume_bot'}
+
+
+class FakeTelegram:
+    """Локальная замена Bot API для проверки вебхука и опроса без сети.
+
+    Отвечает на методы, которые вызывает бот, запоминает отправленные
+    сообщения и умеет слать боту сгенерированные обновления.
+    """
+
+    def __init__(self):
+        self.sent: List[Dict[str, Any]] = []
+        self.files: Dict[str, bytes] = {}
+        self._message_ids = itertools.count(1)
+        # update_id растут между запусками, как у настоящего Telegram: журнал бота отбрасывает повторы
+        self._update_ids = itertools.count(int(time.time() * 1000))
+        self._reply_waiters: Dict[int, float] = {}
+        # Обновления для getUpdates; Telegram хранит их, пока бот не подтвердит offset
+        self.pending_updates: List[Dict[str, Any]] = []
+        self._updates_added = asyncio.Event()
+        self.reply_latencies: List[float] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ''
+
+    def _message(self, chat_id: int, **fields) -> Dict[str, Any]:
+        return {'message_id': next(self._message_ids), 'date': int(time.time()), 'from': BOT_USER,
+                'chat': {'id': chat_id, 'type': 'private'}, **fields}
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        result: Any = True
+        if method == 'getMe':
+            result = BOT_USER
+        elif method == 'getUpdates':
+            result = await self._get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0),
+                                             int(params.get('limit') or 100))
+        elif method in ('sendMessage', 'sendVoice'):
+            chat_id = int(params['chat_id'])
+            fields = {'text': params.get('text', '')} if method == 'sendMessage' else {'voice': {
+                'file_id': 'voice', 'file_unique_id': 'voice', 'duration': 1}}
+            self.sent.append({'method': method, 'chat_id': chat_id, **fields})
+            # Задержка до первого ответа в чат считается от отправки обновления
+            started = self._reply_waiters.pop(chat_id, None)
+            if started is not None:
+                self.reply_latencies.append(time.perf_counter() - started)
+            result = self._message(chat_id, **fields)
+        elif method == 'getFile':
+            file_id = params['file_id']
+            result = {'file_id': file_id, 'file_unique_id': file_id,
+                      'file_size': len(self.files.get(file_id, b'')), 'file_path': f'voice/{file_id}.oga'}
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _get_updates(self, offset: int, timeout: float, limit: int) -> List[Dict[str, Any]]:
+        if offset:
+            self.pending_updates = [update for update in self.pending_updates if update['update_id'] >= offset]
+        if not self.pending_updates and timeout:
+            self._updates_added.clear()
+            try:
+                await asyncio.wait_for(self._updates_added.wait(), min(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return self.pending_updates[:limit]
+
+    def queue_updates(self, updates: List[Dict[str, Any]]):
+        """Отдать обновления боту через getUpdates, как при опросе"""
+        for update in updates:
+            self._reply_waiters.setdefault(update['message']['chat']['id'], time.perf_counter())
+        self.pending_updates.extend(updates)
+        self._updates_added.set()
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        file_id = request.match_info['path'].rsplit('/', 1)[-1].split('.')[0]
+        if file_id not in self.files:
+            return web.Response(status=404)
+        return web.Response(body=self.files[file_id])
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081):
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        app.router.add_get('/file/bot{token}/{path:.+}', self.handle_file)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.base_url = f'http://{host}:{port}'
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def text_update(self, chat_id: int, text: str) -> Dict[str, Any]:
+        update_id = next(self._update_ids)
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'}
+        message = {'message_id': update_id, 'date': int(time.time()), 'from': user,
+                   'chat': {'id': chat_id, 'type': 'private'}, 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+
+    def voice_update(self, chat_id: int, audio: bytes) -> Dict[str, Any]:
+        update = self.text_update(chat_id, '')
+        file_id = f"voice{update['update_id']}"
+        self.files[file_id] = audio
+        del update['message']['text']
+        update['message']['voice'] = {'file_id': file_id, 'file_unique_id': file_id, 'duration': 1,
+                                      'mime_type': 'audio/ogg', 'file_size': len(audio)}
+        return update
+
+    async def send_updates(self, webhook_url: str, updates: List[Dict[str, Any]], concurrency: int = 32,
+                           secret_token: str = '') -> Dict[str, int]:
+        """Доставить обновления на вебхук так же, как Telegram: POST с JSON, повтор при ошибке"""
+        statuses: Dict[int, int] = {}
+        semaphore = asyncio.Semaphore(concurrency)
+        headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token else {}
+
+        async with aiohttp.ClientSession() as session:
+            async def deliver(update):
+                async with semaphore:
+                    chat_id = update['message']['chat']['id']
+                    self._reply_waiters.setdefault(chat_id, time.perf_counter())
+                    for attempt in range(5):
+                        async with session.post(webhook_url, json=update, headers=headers) as response:
+                            statuses[response.status] = statuses.get(response.status, 0) + 1
+                            if response.status == 200:
+                                return
+                        await asyncio.sleep(0.5 * (attempt + 1))
+
+            await asyncio.gather(*(deliver(update) for update in updates))
+        return statuses
+
+    async def wait_for_replies(self, count: int, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if sum(1 for item in self.sent if item['method'] == 'sendMessage') >= count:
+                return True
+            await asyncio.sleep(0.05)
+        return False
+
+
+async def _run(args):
+    fake = FakeTelegram()
+    await fake.start(port=args.port)
+    print(f"Fake Bot API: {fake.base_url}/bot  (api_base_url), {fake.base_url}/file/bot  (api_file_url)")
+    if not args.load:
+        await asyncio.Event().wait()
+
+    messages = ["привет", "покажи каталог", "сколько стоит шанель", "хочу купить", "что посоветуешь на лето"]
+    # Каждый чат пишет одно сообщение, чтобы задержка считалась до его единственного ответа
+    updates = [fake.text_update(100 + i, messages[i % len(messages)]) for i in range(args.load)]
+    started = time.perf_counter()
+    if args.polling:
+        fake.queue_updates(updates)
+        statuses = {}
+    else:
+        statuses = await fake.send_updates(args.webhook, updates, args.concurrency, args.secret_token)
+    delivered = time.perf_counter() - started
+    complete = await fake.wait_for_replies(len(updates), args.timeout)
+    elapsed = time.perf_counter() - started
+    latency = summarize(fake.reply_latencies)
+    print(json.dumps({
+        'updates': len(updates), 'http_statuses': statuses, 'all_replied': complete,
+        'delivery_s': round(delivered, 2), 'total_s': round(elapsed, 2),
+        'updates_per_s': round(len(updates) / elapsed, 1),
+        'reply_p50_ms': round(latency.get('p50_ms', 0)), 'reply_p95_ms': round(latency.get('p95_ms', 0))
+    }, ensure_ascii=False))
+    await fake.stop()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Локальный Bot API и генератор нагрузки для вебхук-режима")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--load', type=int, default=0, help="сколько обновлений отправить на вебхук")
+    parser.add_argument('--webhook', default='http://127.0.0.1:8443/telegram')
+    parser.add_argument('--polling', action='store_true', help="отдать обновления через getUpdates, а не вебхук")
+    parser.add_argument('--secret-token', default='')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    asyncio.run(_run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
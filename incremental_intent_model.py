@@ -0,0 +1,156 @@
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from config import INCREMENTAL_CONFIG, ML_CONFIG
+
+# Параметры TfidfVectorizer, которые имеют смысл для хэширующего векторизатора
+_HASHING_PARAMS = ('analyzer', 'ngram_range', 'lowercase', 'token_pattern')
+# Столбцов в буфере классов не меньше этого числа
+_MIN_CAPACITY = 8
+
+
+def make_vectorizer(n_features: int) -> HashingVectorizer:
+    params = {name: value for name, value in ML_CONFIG['vectorizer_params'].items() if name in _HASHING_PARAMS}
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None, **params)
+
+
+class _ClassBuffer:
+    """Общие для цепочки моделей счётчики и логарифмы вероятностей признаков.
+
+    Каждому варианту класса выделяется новый столбец, уже занятые столбцы
+    не перезаписываются: модели, созданные раньше, продолжают читать свои.
+    Когда свободные столбцы кончаются, живые классы переносятся в новый
+    буфер с запасом, так что правка класса в среднем стоит O(n_features).
+    """
+
+    def __init__(self, n_features: int, capacity: int):
+        self.counts = np.zeros((capacity, n_features))
+        # (признаки x классы): умножение разреженной матрицы на неё читает только строки встретившихся признаков
+        self.log_prob = np.zeros((n_features, capacity))
+        self.used = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.counts.shape[0]
+
+    def compact(self, slots: np.ndarray, extra: int) -> Tuple['_ClassBuffer', np.ndarray]:
+        """Новый буфер со столбцами slots в начале и местом ещё на extra классов"""
+        buffer = _ClassBuffer(self.counts.shape[1], max(2 * (len(slots) + extra), _MIN_CAPACITY))
+        buffer.counts[:len(slots)] = self.counts[slots]
+        buffer.log_prob[:, :len(slots)] = self.log_prob[:, slots]
+        buffer.used = len(slots)
+        return buffer, np.arange(len(slots))
+
+
+class IncrementalIntentModel:
+    """Мультиномиальный наивный Байес на хэшированных признаках.
+
+    Модель неизменяема: partial_fit и remove_classes возвращают новую модель,
+    поэтому её можно подменять в работающем боте одним присваиванием.
+    Модели одной цепочки правок делят _ClassBuffer, и правка одного класса
+    не копирует данные остальных.
+    """
+
+    def __init__(self, n_features: int = None, alpha: float = None, vectorizer: HashingVectorizer = None):
+        self.n_features = n_features or INCREMENTAL_CONFIG['n_features']
+        self.alpha = INCREMENTAL_CONFIG['alpha'] if alpha is None else alpha
+        self.vectorizer = vectorizer or make_vectorizer(self.n_features)
+        self.classes_ = np.array([], dtype=str)
+        self.class_counts = np.zeros(0)
+        self.class_log_prior = np.zeros(0)
+        # Столбец буфера для каждого класса
+        self.slots = np.zeros(0, dtype=np.intp)
+        self._buffer = _ClassBuffer(self.n_features, 0)
+
+    def _derive(self, classes: np.ndarray, class_counts: np.ndarray, slots: np.ndarray,
+                buffer: _ClassBuffer) -> 'IncrementalIntentModel':
+        model = IncrementalIntentModel(self.n_features, self.alpha, self.vectorizer)
+        model.classes_ = classes
+        model.class_counts = class_counts
+        model.slots = slots
+        model._buffer = buffer
+        total = class_counts.sum()
+        model.class_log_prior = np.log(class_counts / total) if total else class_counts
+        return model
+
+    @property
+    def feature_counts(self) -> np.ndarray:
+        """Счётчики признаков (классы x признаки)"""
+        return self._buffer.counts[self.slots]
+
+    @property
+    def feature_log_prob(self) -> np.ndarray:
+        """Логарифмы вероятностей признаков (признаки x классы)"""
+        return self._buffer.log_prob[:, self.slots]
+
+    def transform(self, texts: List[str]) -> sparse.csr_matrix:
+        return self.vectorizer.transform(texts)
+
+    def partial_fit(self, texts: Sequence[str], labels: Sequence[str]) -> 'IncrementalIntentModel':
+        """Новая модель, дообученная на примерах; незнакомые метки становятся новыми классами.
+
+        Копируются только строки изменившихся классов, а не вся матрица модели.
+        """
+        if not texts:
+            return self
+        classes = list(self.classes_)
+        positions = {label: i for i, label in enumerate(classes)}
+        for label in labels:
+            if label not in positions:
+                positions[label] = len(classes)
+                classes.append(label)
+        added = len(classes) - len(self.classes_)
+        slots = np.concatenate([self.slots, np.full(added, -1, dtype=np.intp)])
+        class_counts = np.concatenate([self.class_counts, np.zeros(added)])
+
+        rows = np.array([positions[label] for label in labels])
+        changed, local_rows = np.unique(rows, return_inverse=True)
+        X = self.transform(list(texts))
+        # Суммы признаков по изменившимся классам: индикаторная матрица на матрицу примеров
+        indicator = sparse.csr_matrix((np.ones(len(rows)), (local_rows, np.arange(len(rows)))),
+                                      shape=(len(changed), len(rows)))
+        deltas = sparse.csr_matrix(indicator @ X)
+        class_counts += np.bincount(rows, minlength=len(classes))
+
+        buffer = self._buffer
+        if buffer.used + len(changed) > buffer.capacity:
+            live = slots >= 0
+            buffer, slots[live] = buffer.compact(slots[live], len(changed))
+        smoothing = self.alpha * self.n_features
+        for local, row in enumerate(changed):
+            slot = buffer.used
+            buffer.used += 1
+            counts = buffer.counts[slot]
+            if slots[row] >= 0:
+                counts[:] = buffer.counts[slots[row]]
+            start, end = deltas.indptr[local], deltas.indptr[local + 1]
+            counts[deltas.indices[start:end]] += deltas.data[start:end]
+            buffer.log_prob[:, slot] = np.log(counts + self.alpha) - np.log(counts.sum() + smoothing)
+            slots[row] = slot
+        return self._derive(np.array(classes), class_counts, slots, buffer)
+
+    def remove_classes(self, labels: Iterable[str]) -> 'IncrementalIntentModel':
+        labels = set(labels)
+        keep = np.array([label not in labels for label in self.classes_], dtype=bool)
+        if keep.all():
+            return self
+        return self._derive(self.classes_[keep], self.class_counts[keep], self.slots[keep], self._buffer)
+
+    def predict_proba(self, X: sparse.csr_matrix) -> np.ndarray:
+        if not len(self.classes_):
+            return np.zeros((X.shape[0], 0))
+        # Умножение на весь буфер дешевле, чем выборка столбцов модели из него
+        scores = np.asarray(X @ self._buffer.log_prob)[:, self.slots] + self.class_log_prior
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'classes': len(self.classes_),
+            'examples': int(self.class_counts.sum()),
+            'n_features': self.n_features
+        }
@@ -0,0 +1,58 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from config import INTENT_BATCH_CONFIG
+
+
+class IntentMicroBatcher:
+    """Собирает запросы, пришедшие в пределах нескольких миллисекунд, в один вызов predict_batch"""
+
+    def __init__(self, intent_classifier, max_batch_size: int = None, max_delay_ms: float = None):
+        self.intent_classifier = intent_classifier
+        self.max_batch_size = max_batch_size or INTENT_BATCH_CONFIG['max_batch_size']
+        self.max_delay = (max_delay_ms if max_delay_ms is not None
+                          else INTENT_BATCH_CONFIG['max_delay_ms']) / 1000
+        self._queue: 'queue.Queue[Tuple[str, Future]]' = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name='intent-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, processed_text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((processed_text, future))
+        return future
+
+    def predict(self, processed_text: str) -> Tuple[Optional[str], float]:
+        return self.submit(processed_text).result()
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                predictions = self.intent_classifier.predict_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), prediction in zip(batch, predictions):
+                future.set_result(prediction)
@@ -1,5 +1,6 @@
 import pickle
 import os
+import threading
 from typing import Dict, List, Optional, Tuple, Any
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -7,17 +8,24 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 import numpy as np
 from text_processor import TextProcessor
+from nlp_resources import get_text_processor
 from config import ML_CONFIG
 from intents_config import PerfumeBotConfig
+from model_artifact import ArtifactError, CompiledIntentModel, export_model
+from incremental_intent_model import IncrementalIntentModel
 
 class IntentClassifier:
 
-    def __init__(self):
-        self.text_processor = TextProcessor()
+    def __init__(self, text_processor: TextProcessor = None):
+        self.text_processor = text_processor or get_text_processor()
         self.vectorizer = TfidfVectorizer(**ML_CONFIG['vectorizer_params'])
         self.classifier = MultinomialNB()
+        self.compiled_model: Optional[CompiledIntentModel] = None
+        self.incremental_model: Optional[IncrementalIntentModel] = None
+        self._update_lock = threading.Lock()
         self.is_trained = False
         self.model_path = 'intent_model.pkl'
+        self.artifact_path = 'intent_model.bin'
         self.load_model()
 
     def prepare_training_data(self, bot_config: PerfumeBotConfig) -> Tuple[List[str], List[str]]:
@@ -85,6 +93,7 @@ class IntentClassifier:
             print(classification_report(y_test, y_pred, zero_division=0))
 
         self.is_trained = True
+        self.compiled_model = None
         self.save_model()
 
         return {
@@ -101,17 +110,95 @@ class IntentClassifier:
         if not processed_text:
             return None, 0.0
 
-        try:
-            X = self.vectorizer.transform([processed_text])
-            intent = self.classifier.predict(X)[0]
+        return self.predict_batch([processed_text])[0]
 
-            probabilities = self.classifier.predict_proba(X)[0]
-            confidence = np.max(probabilities)
+    def predict_message(self, message) -> Tuple[Optional[str], float]:
+        """Намерение разобранного сообщения; строка TF-IDF остаётся в сообщении"""
+        if not self.is_trained or not message.processed:
+            return None, 0.0
 
-            return intent, float(confidence)
+        vectorizer, classifier = self._current_model()
+        try:
+            probabilities = classifier.predict_proba(message.tfidf_row(vectorizer))[0]
         except Exception as e:
             print(f"Ошибка предсказания намерения: {e}")
             return None, 0.0
+        best = int(np.argmax(probabilities))
+        return str(classifier.classes_[best]), float(probabilities[best])
+
+    def _current_model(self) -> Tuple[Any, Any]:
+        """Векторизатор и классификатор, которыми сейчас предсказываются намерения"""
+        model = self.incremental_model if self.incremental_model is not None else self.compiled_model
+        if model is not None:
+            return model, model
+        return self.vectorizer, self.classifier
+
+    def predict_batch(self, processed_texts: List[str]) -> List[Tuple[Optional[str], float]]:
+        """Намерение и уверенность для списка предобработанных текстов за один проход модели"""
+        return [top[0] if top else (None, 0.0) for top in self.predict_top_k_batch(processed_texts, 1)]
+
+    def predict_top_k_batch(self, processed_texts: List[str], k: int = 3) -> List[List[Tuple[str, float]]]:
+        """k наиболее вероятных намерений для каждого текста, по убыванию уверенности"""
+        results: List[List[Tuple[str, float]]] = [[] for _ in processed_texts]
+        if not self.is_trained:
+            return results
+
+        positions = [i for i, text in enumerate(processed_texts) if text]
+        if not positions:
+            return results
+
+        vectorizer, classifier = self._current_model()
+        try:
+            X = vectorizer.transform([processed_texts[i] for i in positions])
+            probabilities = classifier.predict_proba(X)
+            classes = classifier.classes_
+        except Exception as e:
+            print(f"Ошибка предсказания намерения: {e}")
+            return results
+
+        k = min(k, len(classes))
+        top_indices = np.argsort(-probabilities, axis=1, kind='stable')[:, :k]
+        for row, position in enumerate(positions):
+            results[position] = [
+                (str(classes[index]), float(probabilities[row, index])) for index in top_indices[row]
+            ]
+        return results
+
+    def enable_incremental(self, bot_config: PerfumeBotConfig) -> Dict[str, Any]:
+        """Перейти на дообучаемую модель и следить за изменениями намерений в bot_config"""
+        X_text, y = self.prepare_training_data(bot_config)
+        with self._update_lock:
+            self.incremental_model = IncrementalIntentModel().partial_fit(X_text, y)
+            self.is_trained = True
+        bot_config.subscribe(self.on_intents_changed)
+        return self.incremental_model.get_stats()
+
+    def on_intents_changed(self, changes: Dict[str, Optional[Dict]]):
+        """Заменить изменённые классы: новая модель собирается целиком и подменяется одним присваиванием"""
+        if self.incremental_model is None:
+            # Без дообучаемой модели правки намерений действуют только после train_intent_model.py
+            return
+        texts: List[str] = []
+        labels: List[str] = []
+        for intent_name, intent_data in changes.items():
+            for example in (intent_data or {}).get('examples', []):
+                texts.append(self.text_processor.preprocess_for_ml(example))
+                labels.append(intent_name)
+        with self._update_lock:
+            model = self.incremental_model.remove_classes(list(changes))
+            self.incremental_model = model.partial_fit(texts, labels)
+
+    def learn_examples(self, intent_name: str, examples: List[str]):
+        """Дообучить модель на новых примерах существующего или нового намерения.
+
+        Требует enable_incremental. В режиме nlp_mode='process' дообучается только
+        модель текущего процесса: воркеры NLP её не видят.
+        """
+        if self.incremental_model is None:
+            raise RuntimeError("Дообучение выключено: включите INCREMENTAL_CONFIG['enabled']")
+        texts = [self.text_processor.preprocess_for_ml(example) for example in examples]
+        with self._update_lock:
+            self.incremental_model = self.incremental_model.partial_fit(texts, [intent_name] * len(texts))
 
     def save_model(self):
         try:
@@ -125,8 +212,27 @@ class IntentClassifier:
             print("Модель сохранена!")
         except Exception as e:
             print(f"Ошибка сохранения модели: {e}")
+        self.export_artifact()
+
+    def export_artifact(self) -> bool:
+        """Сохранить модель в бинарный формат, который загружается без pickle"""
+        try:
+            export_model(self.vectorizer, self.classifier, self.artifact_path)
+            self.compiled_model = CompiledIntentModel(self.artifact_path)
+            return True
+        except Exception as e:
+            print(f"Ошибка экспорта модели: {e}")
+            return False
 
     def load_model(self):
+        if os.path.exists(self.artifact_path):
+            try:
+                self.compiled_model = CompiledIntentModel(self.artifact_path)
+                self.is_trained = True
+                print("Модель загружена!")
+                return
+            except (ArtifactError, OSError, ValueError) as e:
+                print(f"Артефакт модели не загружен ({e}), используется {self.model_path}")
         try:
             if os.path.exists(self.model_path):
                 with open(self.model_path, 'rb') as f:
@@ -1,8 +1,9 @@
 import json
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 
 class IntentsConfig:
     def __init__(self, path: str = 'intents.json'):
+        self.path = path
         with open(path, 'r', encoding='utf-8') as f:
             self.intents: Dict[str, Dict] = json.load(f)
         self.failure_phrases: List[str] = [
@@ -11,6 +12,20 @@ class IntentsConfig:
             'Хм, интересно... А можете объяснить по-другому? ',
             'Давайте начнем сначала. Что именно вы ищете? '
         ]
+        self._listeners: List[Callable[[Dict[str, Optional[Dict]]], None]] = []
+
+    def subscribe(self, listener: Callable[[Dict[str, Optional[Dict]]], None]) -> None:
+        """listener({имя: данные}) вызывается один раз на изменение; у удалённых намерений данные — None"""
+        self._listeners.append(listener)
+
+    def _notify(self, changes: Dict[str, Optional[Dict]]) -> None:
+        if not changes:
+            return
+        for listener in self._listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                print(f"Ошибка обработчика изменения намерений {sorted(changes)}: {e}")
 
     def get_intents(self) -> Dict[str, Dict]:
         return self.intents
@@ -20,10 +35,20 @@ class IntentsConfig:
 
     def add_intent(self, intent_name: str, intent_data: dict) -> None:
         self.intents[intent_name] = intent_data
+        self._notify({intent_name: intent_data})
 
     def remove_intent(self, intent_name: str) -> None:
         if intent_name in self.intents:
             del self.intents[intent_name]
+            self._notify({intent_name: None})
+
+    def replace_intents(self, intents: Dict[str, Dict]) -> None:
+        """Подменить все намерения разом и одним оповещением сообщить подписчикам о различиях"""
+        previous = self.intents
+        changes: Dict[str, Optional[Dict]] = {name: None for name in previous if name not in intents}
+        changes.update((name, data) for name, data in intents.items() if previous.get(name) != data)
+        self.intents = intents
+        self._notify(changes)
 
     def get_intent_info(self, intent_name: str) -> Optional[Dict]:
         return self.intents.get(intent_name, None)
@@ -0,0 +1,108 @@
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aho_corasick import AhoCorasick
+from config import KEYWORD_ROUTER_CONFIG
+
+
+class KeywordRule:
+    """Правило: набор ключевых фраз и то, что делать при совпадении"""
+
+    __slots__ = ('rule_id', 'group', 'priority', 'patterns', 'action', 'responses', 'intent', 'catalog_brand')
+
+    def __init__(self, rule_id: str, data: Dict[str, Any]):
+        self.rule_id = rule_id
+        self.group = data.get('group', 'reply')
+        self.priority = int(data.get('priority', 0))
+        self.patterns: List[str] = list(dict.fromkeys(pattern.lower() for pattern in data.get('patterns', [])
+                                                      if pattern))
+        self.action: Optional[str] = data.get('action')
+        self.responses: List[str] = data.get('responses', [])
+        self.intent: Optional[str] = data.get('intent')
+        # Названия ароматов этого бренда из каталога добавляются к фразам правила
+        self.catalog_brand: Optional[str] = data.get('catalog_brand')
+
+
+def load_keyword_rules(path: str) -> List[KeywordRule]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not all(isinstance(rule, dict) for rule in data.values()):
+        raise ValueError("ожидается объект вида {правило: {group, priority, patterns, ...}}")
+    rules = [KeywordRule(rule_id, rule) for rule_id, rule in data.items()]
+    for rule in rules:
+        if rule.group == 'reply' and not rule.action and not rule.responses:
+            raise ValueError(f"Правило '{rule.rule_id}' не содержит ни responses, ни action")
+    return rules
+
+
+class KeywordMatch:
+    """Совпадения одного текста; держит ссылку на свой автомат, чтобы пережить его замену"""
+
+    __slots__ = ('router', 'hits')
+
+    def __init__(self, router: 'KeywordRouter', hits: Dict[int, int]):
+        self.router = router
+        self.hits = hits
+
+    def best(self, group: str) -> Optional[KeywordRule]:
+        return self.router.resolve(self.hits, group)
+
+    def rule_ids(self) -> List[str]:
+        return [self.router.rules[index].rule_id for index in self.hits]
+
+
+class KeywordRouter:
+    """Все ключевые фразы, алиасы брендов и названия из каталога в одном автомате.
+
+    Текст просматривается один раз, сколько бы фраз ни было в правилах.
+    Для каждого правила считается число разных совпавших фраз, а победитель
+    группы выбирается по приоритету, затем по числу совпадений; при полном
+    равенстве двух правил группа считается неоднозначной.
+    """
+
+    def __init__(self, rules: List[KeywordRule], catalog: Dict[str, Dict[str, Any]] = None):
+        self.rules = rules
+        self._matcher = AhoCorasick()
+        self._groups: Dict[str, List[int]] = {}
+        for rule_index, rule in enumerate(rules):
+            self._groups.setdefault(rule.group, []).append(rule_index)
+            patterns = list(rule.patterns)
+            if rule.catalog_brand and catalog:
+                patterns.extend(perfume['name'].lower() for perfume in catalog.values()
+                                if perfume.get('brand') == rule.catalog_brand)
+            for pattern_index, pattern in enumerate(dict.fromkeys(patterns)):
+                self._matcher.add(pattern, (rule_index, pattern_index))
+        self._matcher.build()
+
+    @classmethod
+    def from_file(cls, path: str = None, catalog: Dict[str, Dict[str, Any]] = None) -> 'KeywordRouter':
+        return cls(load_keyword_rules(path or KEYWORD_ROUTER_CONFIG['rules_path']), catalog)
+
+    @property
+    def pattern_count(self) -> int:
+        return self._matcher.pattern_count
+
+    def match(self, text: str) -> KeywordMatch:
+        """Все сработавшие правила за один проход; text уже в нижнем регистре"""
+        matched: Set[Tuple[int, int]] = set(value for _, value in self._matcher.iter_matches(text))
+        # Число разных совпавших фраз по индексу правила
+        hits: Dict[int, int] = {}
+        for rule_index, _ in matched:
+            hits[rule_index] = hits.get(rule_index, 0) + 1
+        return KeywordMatch(self, hits)
+
+    def resolve(self, hits: Dict[int, int], group: str) -> Optional[KeywordRule]:
+        """Правило группы с наибольшим приоритетом и числом совпадений"""
+        ranked = sorted(((self.rules[index].priority, hits[index], index)
+                         for index in self._groups.get(group, ()) if index in hits), reverse=True)
+        if not ranked:
+            return None
+        if len(ranked) > 1 and ranked[0][:2] == ranked[1][:2]:
+            return None
+        return self.rules[ranked[0][2]]
+
+    def route(self, text: str, group: str) -> Optional[KeywordRule]:
+        return self.match(text).best(group)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'rules': len(self.rules), 'patterns': self.pattern_count}
@@ -0,0 +1,73 @@
+import time
+from typing import Any, Dict
+
+from text_processor import TextProcessor
+from sentiment_analyzer import SentimentAnalyzer
+from topic_classifier import TopicClassifier
+from config import INTENT_BATCH_CONFIG, INCREMENTAL_CONFIG
+from intents_config import PerfumeBotConfig
+from intent_classifier import IntentClassifier
+from intent_batcher import IntentMicroBatcher
+from nlp_resources import get_text_processor
+import metrics
+
+analysis_log = metrics.SampledLogger('perfumebot.analysis')
+
+
+class MessageAnalyzer:
+    """NLP-часть бота: только то, что нужно для analyze, без сессий, каталога и диалогов.
+
+    Процессы-воркеры NLP создают лишь этот объект, а не целый PerfumeBot.
+    """
+
+    def __init__(self, text_processor: TextProcessor = None, intents_config: PerfumeBotConfig = None,
+                 sentiment_analyzer: SentimentAnalyzer = None):
+        self.text_processor = text_processor or get_text_processor()
+        self.config = intents_config or PerfumeBotConfig()
+        self.intent_classifier = IntentClassifier(self.text_processor)
+        if INCREMENTAL_CONFIG['enabled']:
+            self.intent_classifier.enable_incremental(self.config)
+        self.sentiment_analyzer = sentiment_analyzer or SentimentAnalyzer()
+        self.topic_classifier = TopicClassifier(self.text_processor)
+        self.intent_batcher = (IntentMicroBatcher(self.intent_classifier)
+                               if INTENT_BATCH_CONFIG['enabled'] else None)
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """NLP-анализ сообщения без обращения к состоянию диалога"""
+        started = time.perf_counter()
+        message = self.text_processor.analyze(text)
+        # Поля разбора ленивые: этапы выполняются явно, чтобы время очистки и лемматизации считалось отдельно
+        message.ensure_cleaned()
+        cleaned = time.perf_counter()
+        message.ensure_parsed()
+        lemmatized = time.perf_counter()
+
+        sentiment = self.sentiment_analyzer.analyze_message(message)
+        sentiment_done = time.perf_counter()
+        topic, topic_score = self.topic_classifier.get_main_topic_from_lemmas(message.lemmas)
+        topic_done = time.perf_counter()
+        if self.intent_batcher and message.processed:
+            intent, confidence = self.intent_batcher.predict(message.processed)
+        else:
+            intent, confidence = self.intent_classifier.predict_message(message)
+        intent_done = time.perf_counter()
+
+        analysis_log.log('analysis', text=text, intent=intent, confidence=round(confidence, 3),
+                         topic=topic, topic_score=topic_score, sentiment=sentiment['label'])
+
+        return {
+            'message': message,
+            'sentiment': sentiment,
+            'topic': topic,
+            'topic_score': topic_score,
+            'intent': intent,
+            'confidence': confidence,
+            # Анализ может идти в процессе-воркере: время этапов учитывается там, где строится ответ
+            'timings': {
+                'cleaning': cleaned - started,
+                'lemmatization': lemmatized - cleaned,
+                'sentiment': sentiment_done - lemmatized,
+                'topic': topic_done - sentiment_done,
+                'intent': intent_done - topic_done
+            }
+        }
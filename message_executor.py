@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import EXECUTOR_CONFIG
+
+logger = logging.getLogger(__name__)
+
+_worker_analyzer = None
+
+
+def _init_nlp_worker():
+    """Инициализация процесса-воркера: модели загружаются один раз на процесс.
+
+    Воркеру нужны только модели анализа: сессии, каталог и индекс диалогов
+    остаются в основном процессе.
+    """
+    global _worker_analyzer
+    from message_analyzer import MessageAnalyzer
+    from config import CONTENT_CONFIG, INCREMENTAL_CONFIG
+    _worker_analyzer = MessageAnalyzer()
+    _worker_analyzer.text_processor.resources.preload()
+    if CONTENT_CONFIG['hot_reload'] and INCREMENTAL_CONFIG['enabled']:
+        # Правки intents.json дообучают модель и в воркере
+        from content_store import ContentWatcher, load_intents
+        watcher = ContentWatcher()
+        watcher.watch('intents', _worker_analyzer.config.path, load_intents,
+                      _worker_analyzer.config.replace_intents)
+        watcher.start()
+
+
+def _analyze_in_worker(text: str) -> Dict[str, Any]:
+    return _worker_analyzer.analyze(text)
+
+
+class BusyError(Exception):
+    """Очередь обработки переполнена, запрос отклонён"""
+
+
+class _Slots:
+    """Ограничение числа задач в работе и в очереди для одного пула"""
+
+    def __init__(self, limit: int, wait_timeout: float):
+        self.limit = limit
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise BusyError()
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+class LoopLagMonitor:
+    """Измеряет, насколько event loop опаздывает с пробуждением таймера"""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or EXECUTOR_CONFIG['lag_check_interval']
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.total_blocked = 0.0
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - started - self.interval, 0.0)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.total_blocked += lag
+            self.samples += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'last_lag_ms': self.last_lag * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+            'avg_lag_ms': (self.total_blocked / self.samples * 1000) if self.samples else 0.0,
+            'total_blocked_s': self.total_blocked
+        }
+
+
+class MessageExecutor:
+    """Выносит блокирующую обработку сообщений из event loop в пулы исполнителей"""
+
+    def __init__(self, perfume_bot, voice_processor, config: Dict[str, Any] = None):
+        self.config = config or EXECUTOR_CONFIG
+        self.perfume_bot = perfume_bot
+        self.voice_processor = voice_processor
+
+        self.voice_pool = ThreadPoolExecutor(
+            max_workers=self.config['voice_workers'], thread_name_prefix='voice'
+        )
+        self.dialog_pool = ThreadPoolExecutor(
+            max_workers=self.config['dialog_workers'], thread_name_prefix='dialog'
+        )
+        if self.config['nlp_mode'] == 'process':
+            self.nlp_pool: Executor = ProcessPoolExecutor(
+                max_workers=self.config['nlp_workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_nlp_worker
+            )
+            self._analyze: Callable = _analyze_in_worker
+            perfume_bot.config.subscribe(self._warn_local_intents)
+        else:
+            self.nlp_pool = ThreadPoolExecutor(
+                max_workers=self.config['nlp_workers'], thread_name_prefix='nlp'
+            )
+            self._analyze = perfume_bot.analyze_message
+
+        self.message_slots = _Slots(self.config['max_pending_messages'], self.config['queue_timeout'])
+        self.voice_slots = _Slots(self.config['max_pending_voice'], self.config['queue_timeout'])
+        self.timeout = self.config['update_timeout']
+        self.lag_monitor = LoopLagMonitor()
+
+    def _warn_local_intents(self, changes: Dict[str, Optional[Dict]]):
+        # Воркеры NLP держат свои модели: изменения в главном процессе до них не доходят
+        logger.warning(f"Намерения {sorted(changes)} изменены только в главном процессе: воркеры NLP "
+                       f"подхватят их из {self.perfume_bot.config.path} при горячей перезагрузке "
+                       f"или при nlp_mode='thread'")
+
+    async def _run(self, pool: Executor, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, func, *args)
+
+    async def process_message(self, text: str, user_id: str = None) -> str:
+        async with self.message_slots.acquire():
+            return await asyncio.wait_for(self._process_message(text, user_id), self.timeout)
+
+    async def _process_message(self, text: str, user_id: str = None) -> str:
+        if not text or not text.strip():
+            return await self._run(self.dialog_pool, self.perfume_bot.process_message, text, user_id)
+        analysis = await self._run(self.nlp_pool, self._analyze, text)
+        return await self._run(self.dialog_pool, self.perfume_bot.respond, text, analysis, user_id)
+
+    async def recognize_speech(self, audio_data: bytes, input_format: str = 'ogg') -> Tuple[Optional[str], str]:
+        async with self.voice_slots.acquire():
+            return await asyncio.wait_for(
+                self._run(self.voice_pool, self.voice_processor.recognize_speech_from_audio,
+                          audio_data, input_format),
+                self.timeout
+            )
+
+    async def text_to_speech(self, text: str) -> Tuple[Optional[bytes], str]:
+        async with self.voice_slots.acquire():
+            return await asyncio.wait_for(
+                self._run(self.voice_pool, self.voice_processor.text_to_speech, text),
+                self.timeout
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            'messages_in_flight': self.message_slots.in_flight,
+            'messages_rejected': self.message_slots.rejected,
+            'voice_in_flight': self.voice_slots.in_flight,
+            'voice_rejected': self.voice_slots.rejected
+        }
+        stats.update(self.lag_monitor.snapshot())
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self.voice_pool.shutdown(wait=wait)
+        self.dialog_pool.shutdown(wait=wait)
+        self.nlp_pool.shutdown(wait=wait)
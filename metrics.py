@@ -0,0 +1,265 @@
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import METRICS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Сэмпл: (имя метрики, метки, значение)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами в секундах, по одной на набор меток"""
+
+    def __init__(self, name: str, documentation: str, label_name: str, buckets: Iterable[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.bounds = sorted(buckets)
+        self._children: Dict[str, _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> _HistogramChild:
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(value, _HistogramChild(self.bounds))
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for value, child in sorted(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + [float('inf')], counts):
+                cumulative += count
+                labels = _format_labels({self.label_name: value, 'le': _format_value(float(bound))})
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels({self.label_name: value})
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Набор метрик для отдачи в текстовом формате Prometheus.
+
+    Гистограммы наполняются по ходу обработки. Счётчики и очереди, которые
+    компоненты уже ведут сами, снимаются коллекторами только в момент запроса
+    метрик и ничего не стоят на пути обработки сообщений.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Sample]]]] = []
+
+    def histogram(self, name: str, documentation: str, label_name: str,
+                  buckets: Iterable[float] = None) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, documentation, label_name,
+                                              buckets or METRICS_CONFIG['buckets'])
+        return self.histograms[name]
+
+    def collector(self, name: str, metric_type: str, documentation: str,
+                  collect: Callable[[], Iterable[Sample]]):
+        """collect() возвращает сэмплы семейства name; metric_type — counter или gauge"""
+        self._collectors.append((name, metric_type, documentation, collect))
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+        for name, metric_type, documentation, collect in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.warning(f"Ошибка сбора метрики {name}: {e}")
+                continue
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(f'{sample_name}{_format_labels(labels)} {_format_value(value)}'
+                         for sample_name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('perfumebot_stage_seconds', 'Время выполнения этапа обработки', 'stage')
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_many(timings: Optional[Dict[str, float]]):
+    """Учесть время этапов, измеренное в другом потоке или процессе"""
+    if timings:
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+class SampledLogger:
+    """Структурированный лог в JSON для доли событий: полная запись каждого сообщения слишком дорога"""
+
+    def __init__(self, name: str, sample_rate: float = None):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = METRICS_CONFIG['log_sample_rate'] if sample_rate is None else sample_rate
+
+    def log(self, event: str, **fields):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        fields['event'] = event
+        fields['sample_rate'] = self.sample_rate
+        self.logger.info(json.dumps(fields, ensure_ascii=False, default=str))
+
+
+def _stats_samples(name: str, label_name: str, stats: Dict[str, Dict[str, float]],
+                   field: str) -> List[Sample]:
+    return [(name, {label_name: key}, values[field]) for key, values in stats.items() if field in values]
+
+
+def register_bot_collectors(bot, executor=None, voice_pipeline=None, voice_processor=None,
+                            registry: Registry = None):
+    """Счётчики ответов, попадания в кэши и глубина очередей компонентов бота"""
+    registry = registry or REGISTRY
+
+    registry.collector('perfumebot_responses_total', 'counter', 'Ответы бота по способу получения',
+                       lambda: [('perfumebot_responses_total', {'kind': kind}, count)
+                                for kind, count in bot.get_stats().items()])
+
+    def cache_stats() -> Dict[str, Dict[str, float]]:
+        # В режиме процессов кэши лемм живут в воркерах, а анализатор в главном процессе не создаётся
+        stats = {}
+        if bot.analyzer_loaded:
+            stats = {f'text_{name}': values for name, values in bot.text_processor.get_cache_stats().items()}
+            stats['topic_lemma'] = bot.topic_classifier._lemma_cache.stats()
+        stats['render'] = bot.perfume_service.get_cache_stats()
+        if voice_processor is not None and voice_processor.tts_cache is not None:
+            stats['tts'] = voice_processor.tts_cache.get_stats()
+        return stats
+
+    registry.collector('perfumebot_cache_hits_total', 'counter', 'Попадания в кэш',
+                       lambda: _stats_samples('perfumebot_cache_hits_total', 'cache', cache_stats(), 'hits'))
+    registry.collector('perfumebot_cache_misses_total', 'counter', 'Промахи кэша',
+                       lambda: _stats_samples('perfumebot_cache_misses_total', 'cache', cache_stats(), 'misses'))
+
+    if executor is not None:
+        registry.collector('perfumebot_executor_in_flight', 'gauge', 'Задачи в работе и в очереди пула',
+                           lambda: [('perfumebot_executor_in_flight', {'pool': 'messages'},
+                                     executor.message_slots.in_flight),
+                                    ('perfumebot_executor_in_flight', {'pool': 'voice'},
+                                     executor.voice_slots.in_flight)])
+        registry.collector('perfumebot_executor_rejected_total', 'counter', 'Задачи, отклонённые из-за перегрузки',
+                           lambda: [('perfumebot_executor_rejected_total', {'pool': 'messages'},
+                                     executor.message_slots.rejected),
+                                    ('perfumebot_executor_rejected_total', {'pool': 'voice'},
+                                     executor.voice_slots.rejected)])
+        registry.collector('perfumebot_event_loop_lag_seconds', 'gauge', 'Последняя задержка event loop',
+                           lambda: [('perfumebot_event_loop_lag_seconds', {}, executor.lag_monitor.last_lag)])
+
+    if voice_pipeline is not None:
+        def stage_samples(name: str, field: str) -> List[Sample]:
+            return _stats_samples(name, 'stage', voice_pipeline.get_stats()['stages'], field)
+
+        registry.collector('perfumebot_voice_queue_depth', 'gauge', 'Голосовые задания в очереди стадии',
+                           lambda: stage_samples('perfumebot_voice_queue_depth', 'queued'))
+        registry.collector('perfumebot_voice_busy_workers', 'gauge', 'Занятые обработчики стадии',
+                           lambda: stage_samples('perfumebot_voice_busy_workers', 'busy'))
+        registry.collector('perfumebot_voice_in_flight', 'gauge', 'Голосовые сообщения в обработке',
+                           lambda: [('perfumebot_voice_in_flight', {}, voice_pipeline.slots.in_flight)])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics в фоновом потоке"""
+
+    def __init__(self, host: str = None, port: int = None, registry: Registry = None):
+        handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry or REGISTRY})
+        self.server = ThreadingHTTPServer((host or METRICS_CONFIG['host'],
+                                           METRICS_CONFIG['port'] if port is None else port), handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
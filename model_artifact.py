@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from config import ML_CONFIG
+
+MAGIC = b'PRFMINTENT'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct('<10sII')
+
+
+class ArtifactError(Exception):
+    """Файл модели повреждён, устарел или имеет неподдерживаемый формат"""
+
+
+def config_hash(config: Dict[str, Any] = None) -> str:
+    payload = json.dumps(config or ML_CONFIG, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _classifier_weights(classifier) -> Tuple[str, np.ndarray, np.ndarray]:
+    """Линейные веса классификатора и способ получения вероятностей из них"""
+    name = type(classifier).__name__
+    if name == 'MultinomialNB':
+        return 'softmax', classifier.feature_log_prob_, classifier.class_log_prior_
+    if name == 'LogisticRegression':
+        if len(classifier.classes_) == 2:
+            return 'binary', classifier.coef_, classifier.intercept_
+        multi_class = getattr(classifier, 'multi_class', 'auto')
+        if multi_class == 'ovr' or (multi_class == 'auto' and classifier.solver == 'liblinear'):
+            return 'ovr', classifier.coef_, classifier.intercept_
+        return 'softmax', classifier.coef_, classifier.intercept_
+    raise ArtifactError(f"Классификатор {name} не поддерживается форматом артефакта")
+
+
+def _idf_vector(vectorizer) -> np.ndarray:
+    try:
+        return np.asarray(vectorizer.idf_)
+    except AttributeError:
+        # Модели из старых версий scikit-learn хранят idf в диагональной матрице
+        return np.asarray(vectorizer._tfidf._idf_diag.diagonal())
+
+
+def export_model(vectorizer, classifier, path: str) -> Dict[str, Any]:
+    """Записать обученные TfidfVectorizer и классификатор в бинарный артефакт"""
+    unsupported = [param for param in ('preprocessor', 'tokenizer', 'stop_words', 'strip_accents')
+                   if getattr(vectorizer, param, None) is not None]
+    if vectorizer.analyzer != 'word' or unsupported:
+        raise ArtifactError(f"Параметры векторизатора не поддерживаются: {unsupported or vectorizer.analyzer}")
+
+    proba_mode, weights, bias = _classifier_weights(classifier)
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    order = np.argsort(np.array(terms))
+    columns = np.array([vectorizer.vocabulary_[terms[i]] for i in order])
+
+    arrays = {
+        'vocabulary': np.array([terms[i] for i in order]),
+        'idf': np.ascontiguousarray(_idf_vector(vectorizer)[columns], dtype=np.float64)
+               if vectorizer.use_idf else np.ones(len(terms), dtype=np.float64),
+        'weights': np.ascontiguousarray(np.asarray(weights)[:, columns], dtype=np.float64),
+        'bias': np.ascontiguousarray(bias, dtype=np.float64)
+    }
+
+    layout = {}
+    data = bytearray()
+    for name, array in arrays.items():
+        offset = _align(len(data))
+        data.extend(b'\0' * (offset - len(data)))
+        data.extend(array.tobytes())
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config_hash': config_hash(),
+        'checksum': hashlib.sha256(data).hexdigest(),
+        'classifier': type(classifier).__name__,
+        'proba_mode': proba_mode,
+        'classes': [str(label) for label in classifier.classes_],
+        'vectorizer': {
+            'lowercase': vectorizer.lowercase,
+            'token_pattern': vectorizer.token_pattern,
+            'ngram_range': list(vectorizer.ngram_range),
+            'norm': vectorizer.norm,
+            'sublinear_tf': vectorizer.sublinear_tf,
+            'binary': vectorizer.binary
+        },
+        'arrays': layout
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_offset = _align(_PREFIX.size + len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * (data_offset - _PREFIX.size - len(header_bytes)))
+        f.write(data)
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int]:
+    with open(path, 'rb') as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) != _PREFIX.size:
+            raise ArtifactError("Файл модели обрезан")
+        magic, version, header_len = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ArtifactError("Файл не является артефактом модели намерений")
+        if version != FORMAT_VERSION:
+            raise ArtifactError(f"Неподдерживаемая версия формата: {version}")
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    return header, _align(_PREFIX.size + header_len)
+
+
+class CompiledIntentModel:
+    """TF-IDF и линейный классификатор поверх отображённых в память массивов"""
+
+    def __init__(self, path: str, verify: bool = True, expected_config_hash: Optional[str] = None):
+        header, data_offset = read_header(path)
+        expected = expected_config_hash or config_hash()
+        if header['config_hash'] != expected:
+            raise ArtifactError("Артефакт собран с другим ML_CONFIG, нужно переобучить модель")
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            arrays[name] = np.memmap(path, mode='r', dtype=np.dtype(spec['dtype']),
+                                     offset=data_offset + spec['offset'], shape=tuple(spec['shape']))
+        if verify:
+            data_size = max(spec['offset'] + arrays[name].nbytes for name, spec in header['arrays'].items())
+            region = np.memmap(path, mode='r', dtype=np.uint8, offset=data_offset, shape=(data_size,))
+            if hashlib.sha256(region).hexdigest() != header['checksum']:
+                raise ArtifactError("Контрольная сумма артефакта не совпадает")
+
+        self.path = path
+        self.header = header
+        self.classes_ = np.array(header['classes'])
+        self.vocabulary = arrays['vocabulary']
+        self.idf = arrays['idf']
+        self.weights = arrays['weights']
+        self.bias = arrays['bias']
+        self.proba_mode = header['proba_mode']
+
+        params = header['vectorizer']
+        self.lowercase = params['lowercase']
+        self.token_pattern = re.compile(params['token_pattern'])
+        self.min_n, self.max_n = params['ngram_range']
+        self.norm = params['norm']
+        self.sublinear_tf = params['sublinear_tf']
+        self.binary = params['binary']
+
+    @property
+    def n_features(self) -> int:
+        return len(self.vocabulary)
+
+    def _terms(self, text: str) -> List[str]:
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+        if self.max_n == 1:
+            return tokens
+        # Повторяет TfidfVectorizer._word_ngrams
+        terms = list(tokens) if self.min_n == 1 else []
+        min_n = max(self.min_n, 2)
+        for n in range(min_n, min(self.max_n + 1, len(tokens) + 1)):
+            for i in range(len(tokens) - n + 1):
+                terms.append(' '.join(tokens[i:i + n]))
+        return terms
+
+    def transform(self, texts: List[str]) -> sparse.csr_matrix:
+        rows: List[int] = []
+        terms: List[str] = []
+        for row, text in enumerate(texts):
+            doc_terms = self._terms(text)
+            terms.extend(doc_terms)
+            rows.extend([row] * len(doc_terms))
+
+        shape = (len(texts), self.n_features)
+        if not terms:
+            return sparse.csr_matrix(shape, dtype=np.float64)
+
+        query = np.array(terms)
+        positions = np.searchsorted(self.vocabulary, query)
+        positions = np.minimum(positions, self.n_features - 1)
+        known = self.vocabulary[positions] == query
+        keys = np.asarray(rows, dtype=np.int64)[known] * self.n_features + positions[known]
+        if not len(keys):
+            return sparse.csr_matrix(shape, dtype=np.float64)
+
+        keys, counts = np.unique(keys, return_counts=True)
+        row_ids = keys // self.n_features
+        col_ids = keys % self.n_features
+        values = np.ones(len(counts)) if self.binary else counts.astype(np.float64)
+        if self.sublinear_tf:
+            values = np.log(values) + 1
+        values *= self.idf[col_ids]
+        if self.norm == 'l2':
+            norms = np.sqrt(np.bincount(row_ids, weights=values ** 2, minlength=len(texts)))
+            values /= norms[row_ids]
+        elif self.norm == 'l1':
+            norms = np.bincount(row_ids, weights=np.abs(values), minlength=len(texts))
+            values /= norms[row_ids]
+        return sparse.csr_matrix((values, (row_ids, col_ids)), shape=shape)
+
+    def predict_proba(self, X: sparse.csr_matrix) -> np.ndarray:
+        scores = np.asarray(X @ self.weights.T) + self.bias
+        if self.proba_mode == 'binary':
+            positive = 1 / (1 + np.exp(-scores[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        if self.proba_mode == 'ovr':
+            probabilities = 1 / (1 + np.exp(-scores))
+            return probabilities / probabilities.sum(axis=1, keepdims=True)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+
+if __name__ == "__main__":
+    import pickle
+
+    source = sys.argv[1] if len(sys.argv) > 1 else 'intent_model.pkl'
+    target = sys.argv[2] if len(sys.argv) > 2 else 'intent_model.bin'
+    print(f"Экспорт {source} -> {target}")
+    with open(source, 'rb') as f:
+        model_data = pickle.load(f)
+    header = export_model(model_data['vectorizer'], model_data['classifier'], target)
+    print(f"Готово: {len(header['classes'])} классов, {header['arrays']['vocabulary']['shape'][0]} признаков")
@@ -0,0 +1,78 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from natasha import Segmenter, MorphVocab, NewsEmbedding, NewsMorphTagger
+import pymorphy2
+
+
+class NLPResources:
+    """Общие для процесса NLP-модели, загружаемые при первом обращении"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._resources: Dict[str, Any] = {}
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        resource = self._resources.get(name)
+        if resource is None:
+            with self._lock:
+                resource = self._resources.get(name)
+                if resource is None:
+                    resource = factory()
+                    self._resources[name] = resource
+        return resource
+
+    @property
+    def segmenter(self) -> Segmenter:
+        return self._get('segmenter', Segmenter)
+
+    @property
+    def morph_vocab(self) -> MorphVocab:
+        return self._get('morph_vocab', MorphVocab)
+
+    @property
+    def embedding(self) -> NewsEmbedding:
+        return self._get('embedding', NewsEmbedding)
+
+    @property
+    def morph_tagger(self) -> NewsMorphTagger:
+        return self._get('morph_tagger', lambda: NewsMorphTagger(self.embedding))
+
+    @property
+    def morph(self) -> pymorphy2.MorphAnalyzer:
+        return self._get('morph', pymorphy2.MorphAnalyzer)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._resources
+
+    def preload(self):
+        """Загрузить все модели заранее, например перед приёмом сообщений"""
+        self.segmenter
+        self.morph_vocab
+        self.morph_tagger
+        self.morph
+
+
+_shared_resources: Optional[NLPResources] = None
+_shared_text_processor = None
+_registry_lock = threading.RLock()
+
+
+def get_nlp_resources() -> NLPResources:
+    global _shared_resources
+    if _shared_resources is None:
+        with _registry_lock:
+            if _shared_resources is None:
+                _shared_resources = NLPResources()
+    return _shared_resources
+
+
+def get_text_processor():
+    """Общий для процесса экземпляр TextProcessor"""
+    global _shared_text_processor
+    if _shared_text_processor is None:
+        from text_processor import TextProcessor
+        with _registry_lock:
+            if _shared_text_processor is None:
+                _shared_text_processor = TextProcessor()
+    return _shared_text_processor
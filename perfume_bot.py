@@ -1,22 +1,29 @@
 import random
 import pickle
 import os
+import threading
 from typing import Dict, List, Optional, Tuple, Any
 from sklearn.linear_model import LogisticRegression
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 import numpy as np
-from difflib import SequenceMatcher
 
 from text_processor import TextProcessor
-from sentiment_analyzer import SentimentAnalyzer
-from topic_classifier import TopicClassifier
-from perfumes_data import PERFUMES_CATALOG, RECOMMENDATIONS, PROMOTIONS
-from config import ML_CONFIG
+from analyzed_message import AnalyzedMessage
+from config import ML_CONFIG, CONTENT_CONFIG
 from intents_config import PerfumeBotConfig
 from perfume_service import PerfumeService
+from message_analyzer import MessageAnalyzer
+from sentiment_analyzer import SentimentAnalyzer
+from topic_classifier import TopicClassifier
 from intent_classifier import IntentClassifier
+from intent_batcher import IntentMicroBatcher
+from session_store import SessionStore, UserSession
+from dialogue_index import DialogueIndex
+from keyword_router import KeywordMatch, KeywordRouter, KeywordRule
+from content_store import watch_bot_content
+import metrics
 
 class PerfumeBot:
     """Основной класс чат-бота для продажи духов"""
@@ -31,70 +38,106 @@ class PerfumeBot:
         'smalltalk_mood', 'smalltalk_compliment', 'smalltalk_gratitude', 'smalltalk_activity',
         'location_question', 'abilities', 'age_question', 'inspiration', 'weather', 'recommendation_unsure'
     }
-    RECOMMEND_KEYWORDS = ['порекомендуй', 'посоветуй', 'подскажи', 'что выбрать', 'помоги выбрать']
-    PURCHASE_KEYWORDS = ['купить', 'заказать', 'приобрести', 'взять']
-    CATALOG_KEYWORDS = ['каталог', 'что есть', 'покажи', 'ассортимент']
-    PRICE_KEYWORDS = ['цена', 'стоит', 'стоимость', 'цены', 'прайс']
-    MALE_KEYWORDS = ['мужск', 'для мужчины', 'парню', 'для него']
-    FEMALE_KEYWORDS = ['женск', 'для женщины', 'девушке', 'для неё']
-    FRIENDLY_KEYWORDS = ['как дела', 'что посоветуешь']
-
 
-    def __init__(self):
+    def __init__(self, text_processor: TextProcessor = None, sessions: SessionStore = None):
         self.config = PerfumeBotConfig()
-        self.text_processor = TextProcessor()
-        self.intent_classifier = IntentClassifier()
+        # Модели NLP создаются при первом обращении: в режиме процессов анализ идёт в воркерах,
+        # и главному процессу они не нужны. Эмоциональные фразы ответа берутся из лексикона здесь
+        self._text_processor = text_processor
+        self._analyzer: Optional[MessageAnalyzer] = None
+        self._analyzer_lock = threading.Lock()
         self.sentiment_analyzer = SentimentAnalyzer()
-        self.topic_classifier = TopicClassifier()
         self.perfume_service = PerfumeService()
-        self.user_preferences = {}
-        self.theme_history = []
-        self.conversation_stage = 'casual'
-        self.message_count = 0
-        self.casual_message_count = 0
-        self.casual_topics_discussed = set()
-        self.last_casual_response = None
+        self.keyword_router = KeywordRouter.from_file(catalog=self.perfume_service.catalog)
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self.dialogue_index = DialogueIndex()
+        self.content_watcher = watch_bot_content(self) if CONTENT_CONFIG['hot_reload'] else None
         self.casual_messages_threshold = 4
-        self.offer_made = False
         self.stats = {'intent': 0, 'generate': 0, 'failure': 0, 'casual': 0}
-        if not self.intent_classifier.is_trained:
-            print("Внимание: ML-модель не обучена! Запустите train_intent_model.py для обучения.")
+
+    @property
+    def analyzer(self) -> MessageAnalyzer:
+        if self._analyzer is None:
+            with self._analyzer_lock:
+                if self._analyzer is None:
+                    analyzer = MessageAnalyzer(self._text_processor, self.config, self.sentiment_analyzer)
+                    if not analyzer.intent_classifier.is_trained:
+                        print("Внимание: ML-модель не обучена! Запустите train_intent_model.py для обучения.")
+                    self._analyzer = analyzer
+        return self._analyzer
+
+    @property
+    def analyzer_loaded(self) -> bool:
+        return self._analyzer is not None
+
+    @property
+    def text_processor(self) -> TextProcessor:
+        return self.analyzer.text_processor
+
+    @property
+    def intent_classifier(self) -> IntentClassifier:
+        return self.analyzer.intent_classifier
+
+    @property
+    def topic_classifier(self) -> TopicClassifier:
+        return self.analyzer.topic_classifier
+
+    @property
+    def intent_batcher(self) -> Optional[IntentMicroBatcher]:
+        return self.analyzer.intent_batcher
 
     def process_message(self, text: str, user_id: str = None) -> str:
         if not text or not text.strip():
             return random.choice(self.config.failure_phrases)
+        return self.respond(text, self.analyze_message(text), user_id)
 
-        self.message_count += 1
+    def analyze_message(self, text: str) -> Dict[str, Any]:
+        """NLP-анализ сообщения без обращения к состоянию диалога"""
+        return self.analyzer.analyze(text)
 
-        cleaned_text = self.text_processor.clear_phrase(text)
-        lemmas = self.text_processor.lemmatize_text(cleaned_text)
-        processed_for_ml = ' '.join(lemmas)
-
-        sentiment = self.sentiment_analyzer.analyze_sentiment_from_lemmas(lemmas)
-        topic, topic_score = self.topic_classifier.get_main_topic_from_lemmas(lemmas)
-        intent, confidence = self.intent_classifier.predict_intent_from_processed(processed_for_ml)
+    def respond(self, text: str, analysis: Dict[str, Any], user_id: str = None) -> str:
+        """Ответ на сообщение по готовому результату analyze_message"""
+        metrics.observe_many(analysis.get('timings'))
+        if not text or not text.strip():
+            return random.choice(self.config.failure_phrases)
 
-        print(f"[DEBUG] text: '{text}' | intent: {intent} | confidence: {confidence:.3f} | topic: {topic} | topic_score: {topic_score}")
+        session = self.sessions.get(user_id)
+        # Без готового разбора сообщение разбирается здесь; поля считаются, только если понадобятся
+        message = analysis.get('message') or self.text_processor.analyze(text)
+        try:
+            return self._respond(session, message, analysis)
+        finally:
+            # Хранилище откладывает запись и объединяет её с изменениями других сессий
+            self.sessions.save(session)
 
+    def _respond(self, session: UserSession, message: AnalyzedMessage, analysis: Dict[str, Any]) -> str:
+        text = message.text
+        session.message_count += 1
 
+        sentiment = analysis['sentiment']
+        topic = analysis['topic']
+        intent = analysis['intent']
+        confidence = analysis['confidence']
 
         if intent is not None and confidence >= 0.1:
             if self._is_casual_intent(intent):
-                self.casual_message_count += 1
+                session.casual_message_count += 1
             elif self._is_business_intent(intent):
-                self.casual_message_count = 0
-            response = self._generate_contextual_response(text, intent, confidence, sentiment, topic)
+                session.casual_message_count = 0
+            response = self._generate_contextual_response(session, text, intent, confidence, sentiment, topic)
             return response
 
-        keyword_response = self._handle_keywords(text)
+        # Ключевые фразы и бренды находятся за один проход, дальше только выбор правила
+        keywords = self.keyword_router.match(message.lowered)
+        keyword_response = self._handle_keywords(keywords, text, sentiment)
         if keyword_response:
             return keyword_response
 
-        fallback_intent = self._detect_brand_fallback(text)
+        fallback_intent = self._detect_brand_fallback(keywords)
         if fallback_intent:
             intent = fallback_intent
             confidence = 0.8
-            response = self._generate_contextual_response(text, intent, confidence, sentiment, topic)
+            response = self._generate_contextual_response(session, text, intent, confidence, sentiment, topic)
             return response
 
         if (intent is None or confidence < 0.1):
@@ -105,25 +148,25 @@ class PerfumeBot:
 
         return random.choice(self.config.failure_phrases)
 
-    def _generate_contextual_response(self, text: str, intent: str, confidence: float,
-                                    sentiment: Dict, topic: str) -> str:
+    def _generate_contextual_response(self, session: UserSession, text: str, intent: str,
+                                    confidence: float, sentiment: Dict, topic: str) -> str:
 
         if self._is_business_intent(intent):
-            self.conversation_stage = 'business'
+            session.conversation_stage = 'business'
             return self._generate_business_response(text, intent, confidence, sentiment, topic)
 
         if self._is_casual_intent(intent):
             if intent == 'goodbye':
-                self.reset_conversation()
-            response = self._generate_casual_response(text, intent, confidence, sentiment, topic)
+                session.reset()
+            response = self._generate_casual_response(session, text, intent, confidence, sentiment, topic)
 
-            if (self.casual_message_count >= self.casual_messages_threshold and
-                not self.offer_made and
-                self.conversation_stage == 'casual'):
+            if (session.casual_message_count >= self.casual_messages_threshold and
+                not session.offer_made and
+                session.conversation_stage == 'casual'):
 
                 response += self._add_natural_transition()
-                self.conversation_stage = 'warming_up'
-                self.offer_made = True
+                session.conversation_stage = 'warming_up'
+                session.offer_made = True
 
             return response
 
@@ -184,10 +227,10 @@ class PerfumeBot:
                     return random.choice(responses)
         return "С удовольствием!"
 
-    def _generate_casual_response(self, text: str, intent: str, confidence: float,
-                                sentiment: Dict, topic: str) -> str:
+    def _generate_casual_response(self, session: UserSession, text: str, intent: str,
+                                confidence: float, sentiment: Dict, topic: str) -> str:
         self.stats['casual'] += 1
-        self.casual_topics_discussed.add(intent)
+        session.casual_topics_discussed.add(intent)
 
         intent_data = self.config.intents.get(intent, {})
         responses = intent_data.get('responses', [])
@@ -195,7 +238,7 @@ class PerfumeBot:
         if responses and confidence > 0.1:
             response = random.choice(responses)
 
-            if intent == 'greeting' and self.message_count > 1:
+            if intent == 'greeting' and session.message_count > 1:
                 follow_up = [
                     " Как прошел день?", " Что интересного?",
                     " Как настроение?", " Что нового?"
@@ -221,36 +264,17 @@ class PerfumeBot:
         ]
         return random.choice(transitions)
 
-    def _detect_brand_fallback(self, text: str) -> Optional[str]:
-        text_lower = text.lower()
-
-        chanel_keywords = ['chanel', 'шанель', 'коко', 'coco', 'номер 5', 'no 5', 'chance', 'bleu', 'gabrielle', 'allure']
-        dior_keywords = ['dior', 'диор', 'miss', 'sauvage', 'jadore', 'j\'adore', 'poison', 'fahrenheit', 'joy', 'addict']
-
-        chanel_matches = sum(1 for keyword in chanel_keywords if keyword in text_lower)
-        dior_matches = sum(1 for keyword in dior_keywords if keyword in text_lower)
-
-        if chanel_matches > dior_matches and chanel_matches > 0:
-            return 'brand_chanel'
-        elif dior_matches > chanel_matches and dior_matches > 0:
-            return 'brand_dior'
-
-        return None
+    def _detect_brand_fallback(self, keywords: KeywordMatch) -> Optional[str]:
+        rule = keywords.best('brand')
+        return rule.intent if rule else None
 
     def get_stats(self) -> Dict[str, int]:
         return self.stats.copy()
 
-    def reset_conversation(self):
-        self.conversation_history = []
-        self.user_preferences = {}
-        self.current_theme = None
-        self.theme_history = []
-
-        self.conversation_stage = 'casual'
-        self.message_count = 0
-        self.casual_message_count = 0
-        self.casual_topics_discussed = set()
-        self.offer_made = False
+    def reset_conversation(self, user_id: str = None):
+        session = self.sessions.get(user_id)
+        session.reset()
+        self.sessions.save(session)
 
     @staticmethod
     def _is_business_intent(intent: str) -> bool:
@@ -260,89 +284,27 @@ class PerfumeBot:
     def _is_casual_intent(intent: str) -> bool:
         return intent in PerfumeBot.CASUAL_INTENTS
 
-    def _handle_keywords(self, text: str) -> Optional[str]:
-        text_lower = text.lower()
-        if any(word in text_lower for word in self.RECOMMEND_KEYWORDS):
-            return "С удовольствием помогу с выбором! \n\nРасскажите:\n• Для кого аромат?\n• На какой случай?\n• Какие ароматы нравятся?"
-        if any(word in text_lower for word in self.PURCHASE_KEYWORDS):
-            return "🛒 Замечательно! Какой именно аромат вас заинтересовал?\nИли хотите, чтобы я что-то порекомендовал? "
-        if any(word in text_lower for word in self.CATALOG_KEYWORDS):
-            return self.perfume_service.show_catalog()
-        if any(word in text_lower for word in self.PRICE_KEYWORDS):
-            return self.perfume_service.show_prices()
-        if any(word in text_lower for word in self.MALE_KEYWORDS):
-            return self.perfume_service.recommend_by_gender('мужской')
-        if any(word in text_lower for word in self.FEMALE_KEYWORDS):
-            return self.perfume_service.recommend_by_gender('женский')
-        if any(word in text_lower for word in self.FRIENDLY_KEYWORDS):
-            friendly_responses = [
-                "Отлично! Готов помочь вам с выбором прекрасных ароматов! ",
-                "Прекрасно! Давайте подберем вам идеальный аромат! ",
-                "Замечательно! Расскажите, что вас интересует в мире парфюмерии? "
-            ]
-            return random.choice(friendly_responses)
-        return None
+    def _handle_keywords(self, keywords: KeywordMatch, text: str, sentiment: Dict) -> Optional[str]:
+        rule = keywords.best('reply')
+        if rule is None:
+            return None
+        if rule.action:
+            return self._execute_action(rule.action, text, sentiment)
+        return random.choice(rule.responses)
 
-    def _normalize_for_dialogue(self, text: str) -> str:
-        import re
-        text = text.lower()
-        text = re.sub(r'[\W_]+', ' ', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+    def reload_keyword_rules(self, rules: List[KeywordRule] = None):
+        """Пересобрать автомат ключевых фраз с новыми правилами или после смены каталога"""
+        self.keyword_router = KeywordRouter(rules if rules is not None else self.keyword_router.rules,
+                                            self.perfume_service.catalog)
 
     def _search_in_dialogues(self, text: str) -> Optional[str]:
         try:
-            dialogue_file = 'dialogues.txt'
-            if not os.path.exists(dialogue_file):
-                return None
-            with open(dialogue_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            dialogues = self._parse_dialogues(content)
-            if not isinstance(dialogues, list):
-                return None
-            dialogues = [tuple(item) for item in dialogues if isinstance(item, (list, tuple)) and len(item) == 2]
-            if not dialogues:
-                return None
-            best_match = None
-            best_score = 0.0
-            norm_user = self._normalize_for_dialogue(text)
-            threshold = 0.45 if len(norm_user) > 20 else 0.35
-            for question, answer in dialogues:
-                norm_q = self._normalize_for_dialogue(question)
-                if norm_user == norm_q or norm_user in norm_q or norm_q in norm_user:
-                    return answer
-                similarity = SequenceMatcher(None, norm_user, norm_q).ratio()
-                if similarity > best_score and similarity > threshold:
-                    best_score = similarity
-                    best_match = answer
-            return best_match
+            with metrics.timed('dialogue_search'):
+                return self.dialogue_index.search(text)
         except Exception as e:
             print(f"Ошибка при поиске в диалогах: {e}")
             return None
 
-    def _parse_dialogues(self, content: str) -> List[Tuple[str, str]]:
-        """Парсинг файла диалогов"""
-        dialogues = []
-        lines = content.strip().split('\n')
-
-        current_question = None
-        current_answer = None
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            if line.startswith('Q:'):
-                current_question = line[2:].strip()
-            elif (line.startswith('A:') or line.startswith('А:')) and current_question:
-                current_answer = line[2:].strip()
-                dialogues.append((current_question, current_answer))
-                current_question = None
-                current_answer = None
-
-        return dialogues
-
     def _handle_topic(self, topic: str, text: str, sentiment: Dict) -> str:
         topic_responses = {
             'perfume_interest': [
@@ -1,7 +1,31 @@
 from perfumes_data import PERFUMES_CATALOG, RECOMMENDATIONS, PROMOTIONS
-from typing import List, Optional, Dict, Any
+from catalog_index import CatalogIndex
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import random
 
+import metrics
+
+
+class CatalogSnapshot:
+    """Версия данных каталога вместе с индексом и кэшем готовых ответов.
+
+    Снимок не меняется после публикации: новая версия каталога собирается
+    целиком в новом снимке и подменяет старый одним присваиванием.
+    """
+
+    def __init__(self, catalog: Dict[str, Dict[str, Any]], recommendations: Dict[str, Dict[str, List[str]]],
+                 promotions: Dict[str, Dict[str, Any]], version: int = 1):
+        self.catalog = catalog
+        self.recommendations = recommendations
+        self.promotions = promotions
+        self.version = version
+        self.index = CatalogIndex(catalog)
+        self.render_cache: Dict[Tuple, str] = {}
+
+    def rebuilt(self) -> 'CatalogSnapshot':
+        return CatalogSnapshot(self.catalog, self.recommendations, self.promotions, self.version + 1)
+
+
 class PerfumeService:
     """Сервис для работы с каталогом парфюмерии и бизнес-логикой"""
 
@@ -35,94 +59,164 @@ class PerfumeService:
         'email': 'order@perfume-shop.ru'
     }
 
+    def __init__(self, snapshot: CatalogSnapshot = None):
+        self._snapshot = snapshot or CatalogSnapshot(PERFUMES_CATALOG, RECOMMENDATIONS, PROMOTIONS)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.warm_up()
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    @property
+    def catalog(self) -> Dict[str, Dict[str, Any]]:
+        return self._snapshot.catalog
+
+    @property
+    def catalog_index(self) -> CatalogIndex:
+        return self._snapshot.index
+
+    def _cached(self, key: Tuple, builder: Callable[[CatalogSnapshot], str],
+                data: CatalogSnapshot = None) -> str:
+        # Снимок читается один раз: ответ целиком строится по одной версии каталога
+        data = data or self._snapshot
+        response = data.render_cache.get(key)
+        if response is None:
+            self.cache_misses += 1
+            with metrics.timed('render'):
+                response = builder(data)
+            data.render_cache[key] = response
+        else:
+            self.cache_hits += 1
+        return response
+
+    def load_snapshot(self, snapshot: CatalogSnapshot):
+        """Прогреть новую версию каталога и атомарно подменить текущую"""
+        self.warm_up(snapshot)
+        self._snapshot = snapshot
+
+    def invalidate_cache(self):
+        """Пересобрать индекс и готовые ответы после изменения данных каталога на месте"""
+        self.load_snapshot(self._snapshot.rebuilt())
+
+    def warm_up(self, data: CatalogSnapshot = None):
+        """Заранее построить все статичные представления каталога"""
+        data = data or self._snapshot
+        self._cached(('catalog',), self._render_catalog, data)
+        self._cached(('prices',), self._render_prices, data)
+        self._cached(('promotions',), self._render_promotions, data)
+        for gender in data.recommendations['by_gender']:
+            self._cached(('gender', gender), lambda d, g=gender: self._render_gender(d, g), data)
+        for brand in {perfume['brand'] for perfume in data.catalog.values()}:
+            self._cached(('brand', brand), lambda d, b=brand: self._render_brand(d, b), data)
+        for criteria in list(self._get_criteria_mapping()) + list(data.recommendations['by_season']) \
+                + list(data.recommendations['by_occasion']):
+            self._cached(('criteria', criteria), lambda d, c=criteria: self._render_criteria(d, c), data)
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        return {'size': len(self._snapshot.render_cache), 'hits': self.cache_hits,
+                'misses': self.cache_misses, 'version': self._snapshot.version}
+
     def show_catalog(self) -> str:
         """Показать полный каталог ароматов"""
-        response = self.RESPONSE_TEMPLATES['catalog_header']
-        for perfume_id, perfume in PERFUMES_CATALOG.items():
-            response += self._format_perfume_brief(perfume)
-        response += self.RESPONSE_TEMPLATES['catalog_footer']
-        return response
+        return self._cached(('catalog',), self._render_catalog)
 
     def show_prices(self) -> str:
         """Показать цены на ароматы, отсортированные по возрастанию"""
-        response = self.RESPONSE_TEMPLATES['price_header']
-        sorted_perfumes = self._get_sorted_perfumes_by_price()
-        for perfume_id, perfume in sorted_perfumes:
-            response += f"• {perfume['name']}: **{perfume['price']:,} руб.**\n"
-        response += self.RESPONSE_TEMPLATES['price_footer']
-        return response
+        return self._cached(('prices',), self._render_prices)
 
     def recommend_by_gender(self, gender: str) -> str:
         """Рекомендации ароматов по полу"""
-        recommendations = self._get_perfumes_by_gender(gender)
-        if not recommendations:
-            return self.RESPONSE_TEMPLATES['no_perfumes'].format(category=gender)
-        response = self.RESPONSE_TEMPLATES['recommendation_header'].format(category=gender)
-        for perfume_id in recommendations:
-            if perfume_id in PERFUMES_CATALOG:
-                perfume = PERFUMES_CATALOG[perfume_id]
-                response += self._format_perfume_recommendation(perfume)
-        response += self.RESPONSE_TEMPLATES['recommendation_footer']
-        return response
+        return self._cached(('gender', gender), lambda data: self._render_gender(data, gender))
 
     def show_promotions(self) -> str:
         """Показать акции и специальные предложения"""
-        response = self.RESPONSE_TEMPLATES['promotion_header']
-        for promo_id, promo in PROMOTIONS.items():
-            response += self._format_promotion(promo)
-        response += self.RESPONSE_TEMPLATES['promotion_footer']
-        return response
+        return self._cached(('promotions',), self._render_promotions)
 
     def show_brand(self, brand: str) -> str:
         """Показать ароматы определенного бренда"""
-        brand_perfumes = self._get_perfumes_by_brand(brand)
-        if not brand_perfumes:
-            return self.RESPONSE_TEMPLATES['no_brand'].format(brand=brand)
-        response = self.RESPONSE_TEMPLATES['brand_header'].format(brand=brand)
-        for perfume_id, perfume in brand_perfumes:
-            response += self._format_perfume_full(perfume)
-        response += self.RESPONSE_TEMPLATES['brand_footer'].format(brand=brand)
-        return response
+        return self._cached(('brand', brand), lambda data: self._render_brand(data, brand))
 
     def recommend_by_criteria(self, criteria: str) -> str:
         """Рекомендации по критериям (сезон, повод)"""
+        return self._cached(('criteria', criteria), lambda data: self._render_criteria(data, criteria))
+
+    def _render_catalog(self, data: CatalogSnapshot) -> str:
+        parts = [self.RESPONSE_TEMPLATES['catalog_header']]
+        parts.extend(self._format_perfume_brief(perfume) for perfume in data.catalog.values())
+        parts.append(self.RESPONSE_TEMPLATES['catalog_footer'])
+        return ''.join(parts)
+
+    def _render_prices(self, data: CatalogSnapshot) -> str:
+        parts = [self.RESPONSE_TEMPLATES['price_header']]
+        parts.extend(f"• {perfume['name']}: **{perfume['price']:,} руб.**\n"
+                     for perfume_id, perfume in self._get_sorted_perfumes_by_price(data))
+        parts.append(self.RESPONSE_TEMPLATES['price_footer'])
+        return ''.join(parts)
+
+    def _render_gender(self, data: CatalogSnapshot, gender: str) -> str:
+        recommendations = self._get_perfumes_by_gender(data, gender)
+        if not recommendations:
+            return self.RESPONSE_TEMPLATES['no_perfumes'].format(category=gender)
+        parts = [self.RESPONSE_TEMPLATES['recommendation_header'].format(category=gender)]
+        parts.extend(self._format_perfume_recommendation(data.catalog[perfume_id])
+                     for perfume_id in recommendations if perfume_id in data.catalog)
+        parts.append(self.RESPONSE_TEMPLATES['recommendation_footer'])
+        return ''.join(parts)
+
+    def _render_promotions(self, data: CatalogSnapshot) -> str:
+        parts = [self.RESPONSE_TEMPLATES['promotion_header']]
+        parts.extend(self._format_promotion(promo) for promo in data.promotions.values())
+        parts.append(self.RESPONSE_TEMPLATES['promotion_footer'])
+        return ''.join(parts)
+
+    def _render_brand(self, data: CatalogSnapshot, brand: str) -> str:
+        brand_perfumes = self._get_perfumes_by_brand(data, brand)
+        if not brand_perfumes:
+            return self.RESPONSE_TEMPLATES['no_brand'].format(brand=brand)
+        parts = [self.RESPONSE_TEMPLATES['brand_header'].format(brand=brand)]
+        parts.extend(self._format_perfume_full(perfume) for perfume_id, perfume in brand_perfumes)
+        parts.append(self.RESPONSE_TEMPLATES['brand_footer'].format(brand=brand))
+        return ''.join(parts)
+
+    def _render_criteria(self, data: CatalogSnapshot, criteria: str) -> str:
         criteria_mapping = self._get_criteria_mapping()
         mapped_criteria = criteria_mapping.get(criteria, criteria)
-        season_recs = RECOMMENDATIONS['by_season'].get(mapped_criteria, [])
+        season_recs = data.recommendations['by_season'].get(mapped_criteria, [])
         if season_recs:
-            return self.format_recommendations(season_recs, f"для {mapped_criteria}")
-        occasion_recs = RECOMMENDATIONS['by_occasion'].get(mapped_criteria, [])
+            return self.format_recommendations(season_recs, f"для {mapped_criteria}", data)
+        occasion_recs = data.recommendations['by_occasion'].get(mapped_criteria, [])
         if occasion_recs:
-            return self.format_recommendations(occasion_recs, f"для {mapped_criteria}")
+            return self.format_recommendations(occasion_recs, f"для {mapped_criteria}", data)
         return f"🔍 Подбираю ароматы для '{mapped_criteria}'..."
 
-    def format_recommendations(self, perfume_ids: List[str], context: str) -> str:
+    def format_recommendations(self, perfume_ids: List[str], context: str, data: CatalogSnapshot = None) -> str:
         """Форматирование рекомендаций"""
-        response = f"✨ **Идеальные ароматы {context}:**\n\n"
-        for perfume_id in perfume_ids:
-            if perfume_id in PERFUMES_CATALOG:
-                perfume = PERFUMES_CATALOG[perfume_id]
-                response += self._format_perfume_recommendation(perfume)
-        response += "Что-то приглянулось? Расскажу подробнее! 😊"
-        return response
+        catalog = (data or self._snapshot).catalog
+        parts = [f"✨ **Идеальные ароматы {context}:**\n\n"]
+        parts.extend(self._format_perfume_recommendation(catalog[perfume_id])
+                     for perfume_id in perfume_ids if perfume_id in catalog)
+        parts.append("Что-то приглянулось? Расскажу подробнее! 😊")
+        return ''.join(parts)
 
     def process_purchase_intent(self, text: str) -> str:
         """Обработка намерения покупки"""
-        mentioned_perfume = self.extract_perfume_from_text(text)
+        data = self._snapshot
+        mentioned_perfume = data.index.extract_perfume(text)
         if mentioned_perfume:
-            return self._format_purchase_response(mentioned_perfume)
+            return self._cached(('purchase', mentioned_perfume),
+                                lambda d: self._render_purchase(d, mentioned_perfume), data)
         return self.RESPONSE_TEMPLATES['purchase_no_perfume']
 
     def extract_perfume_from_text(self, text: str) -> Optional[str]:
         """Извлечение упоминания парфюма из текста"""
-        text_lower = text.lower()
-        for perfume_id, perfume in PERFUMES_CATALOG.items():
-            if perfume['name'].lower() in text_lower:
-                return perfume_id
-        for perfume_id, perfume in PERFUMES_CATALOG.items():
-            if self._check_perfume_keywords(text_lower, perfume):
-                return perfume_id
-        return None
+        return self.catalog_index.extract_perfume(text)
+
+    def find_mentioned_perfumes(self, text: str) -> List[Dict[str, Any]]:
+        """Ароматы, названия которых встречаются в тексте с учётом регистра"""
+        data = self._snapshot
+        return [data.catalog[perfume_id] for perfume_id in data.index.find_mentions(text, case_sensitive=True)]
 
     def _format_perfume_brief(self, perfume: Dict[str, Any]) -> str:
         return (f"**{perfume['name']}** ({perfume['brand']})\n"
@@ -153,7 +247,10 @@ class PerfumeService:
         return response
 
     def _format_purchase_response(self, perfume_id: str) -> str:
-        perfume = PERFUMES_CATALOG[perfume_id]
+        return self._cached(('purchase', perfume_id), lambda data: self._render_purchase(data, perfume_id))
+
+    def _render_purchase(self, data: CatalogSnapshot, perfume_id: str) -> str:
+        perfume = data.catalog[perfume_id]
         response = f"🛒 **Отличный выбор!**\n\n"
         response += f"✨ {perfume['name']}\n"
         response += f"💰 {perfume['price']:,} руб.\n\n"
@@ -163,14 +260,14 @@ class PerfumeService:
         response += "🎁 Не забудьте про наши акции!"
         return response
 
-    def _get_sorted_perfumes_by_price(self) -> List[tuple]:
-        return sorted(PERFUMES_CATALOG.items(), key=lambda x: x[1]['price'])
+    def _get_sorted_perfumes_by_price(self, data: CatalogSnapshot) -> List[tuple]:
+        return sorted(data.catalog.items(), key=lambda x: x[1]['price'])
 
-    def _get_perfumes_by_gender(self, gender: str) -> List[str]:
-        return RECOMMENDATIONS['by_gender'].get(gender, [])
+    def _get_perfumes_by_gender(self, data: CatalogSnapshot, gender: str) -> List[str]:
+        return data.recommendations['by_gender'].get(gender, [])
 
-    def _get_perfumes_by_brand(self, brand: str) -> List[tuple]:
-        return [(pid, p) for pid, p in PERFUMES_CATALOG.items() if p['brand'].lower() == brand.lower()]
+    def _get_perfumes_by_brand(self, data: CatalogSnapshot, brand: str) -> List[tuple]:
+        return [(pid, p) for pid, p in data.catalog.items() if p['brand'].lower() == brand.lower()]
 
     def _get_criteria_mapping(self) -> Dict[str, str]:
         return {
@@ -182,28 +279,13 @@ class PerfumeService:
             'winter': 'зима'
         }
 
-    def _check_perfume_keywords(self, text_lower: str, perfume: Dict[str, Any]) -> bool:
-        brand_words = perfume['brand'].lower().split()
-        name_words = perfume['name'].lower().split()
-        for brand_word in brand_words:
-            if brand_word in text_lower:
-                for name_word in name_words:
-                    if name_word in text_lower and len(name_word) > 3:
-                        return True
-        return False
-
     def get_perfume_details(self, perfume_id: str) -> Optional[str]:
-        if perfume_id not in PERFUMES_CATALOG:
+        catalog = self._snapshot.catalog
+        if perfume_id not in catalog:
             return None
-        perfume = PERFUMES_CATALOG[perfume_id]
+        perfume = catalog[perfume_id]
         return self._format_perfume_full(perfume)
 
-    def search_perfumes(self, query: str) -> List[str]:
-        query_lower = query.lower()
-        results = []
-        for perfume_id, perfume in PERFUMES_CATALOG.items():
-            if (query_lower in perfume['name'].lower() or
-                query_lower in perfume['brand'].lower() or
-                query_lower in perfume['description'].lower()):
-                results.append(perfume_id)
-        return results
+    def search_perfumes(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """Поиск ароматов по словам запроса с ранжированием по релевантности"""
+        return self.catalog_index.search(query, limit)
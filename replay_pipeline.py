@@ -0,0 +1,301 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import REPLAY_CONFIG
+
+# Поля исходной записи, которые переносятся в результат без изменений
+PASSTHROUGH_FIELDS = ('user_id', 'chat_id', 'message_id', 'timestamp')
+
+_worker_models = None
+
+
+def _init_worker():
+    """Модели загружаются один раз на процесс и переиспользуются для всех чанков"""
+    global _worker_models
+    from intent_classifier import IntentClassifier
+    from nlp_resources import get_text_processor
+    from sentiment_analyzer import SentimentAnalyzer
+    from topic_classifier import TopicClassifier
+
+    text_processor = get_text_processor()
+    _worker_models = (
+        text_processor,
+        IntentClassifier(text_processor),
+        SentimentAnalyzer(),
+        TopicClassifier(text_processor)
+    )
+
+
+def analyze_chunk(records: List[Tuple[int, Dict[str, Any]]], text_field: str) -> Dict[str, list]:
+    """Предсказания для чанка записей в виде колонок"""
+    if _worker_models is None:
+        _init_worker()
+    text_processor, intent_classifier, sentiment_analyzer, topic_classifier = _worker_models
+
+    texts = [str(record.get(text_field) or '') for _, record in records]
+    messages = [text_processor.analyze(text) for text in texts]
+    intents = intent_classifier.predict_batch([message.processed for message in messages])
+    sentiment_scores, sentiment_confidences = sentiment_analyzer.score_batch(
+        [message.lemmas_keeping(sentiment_analyzer.negator_set) for message in messages])
+    topics = topic_classifier.get_main_topics_batch([message.lemmas for message in messages])
+
+    columns: Dict[str, list] = {'line': [line for line, _ in records]}
+    for field in PASSTHROUGH_FIELDS:
+        columns[field] = [None if record.get(field) is None else str(record[field]) for _, record in records]
+    columns.update({
+        'text': texts,
+        'intent': [intent for intent, _ in intents],
+        'intent_confidence': [confidence for _, confidence in intents],
+        'sentiment_score': sentiment_scores.tolist(),
+        'sentiment_label': sentiment_analyzer.label_batch(sentiment_scores).tolist(),
+        'sentiment_confidence': sentiment_confidences.tolist(),
+        'topic': [topic for topic, _ in topics],
+        'topic_score': [score for _, score in topics]
+    })
+    return columns
+
+
+def line_offset(path: str, line: int) -> int:
+    """Смещение в байтах начала строки line; нужно только для старых контрольных точек без смещения"""
+    offset = 0
+    with open(path, 'rb') as f:
+        for raw in islice(f, line):
+            offset += len(raw)
+    return offset
+
+
+def iter_records(path: str, start_line: int = 0,
+                 start_offset: int = 0) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+    """Записи JSONL с позиции start_offset, где начинается строка start_line: (строка, смещение после неё, запись).
+
+    Битые строки пропускаются.
+    """
+    with open(path, 'rb') as f:
+        if start_offset:
+            # Продолжение ровно с начала строки: иначе файл изменился после контрольной точки
+            f.seek(start_offset - 1)
+            if f.read(1) != b'\n':
+                raise ValueError(f"Смещение {start_offset} не указывает на начало строки в {path}")
+        offset = start_offset
+        for line_number, raw in enumerate(f, start_line):
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                print(f"Строка {line_number} пропущена: {e}")
+                continue
+            if isinstance(record, dict):
+                yield line_number, offset, record
+
+
+def iter_chunks(path: str, start_line: int, start_offset: int,
+                chunk_size: int) -> Iterator[Tuple[Tuple[int, int], List[Tuple[int, Dict[str, Any]]]]]:
+    """Чанки записей и позиция (строка, смещение), с которой начнётся следующий чанк"""
+    chunk = []
+    position = (start_line, start_offset)
+    for line_number, offset, record in iter_records(path, start_line, start_offset):
+        chunk.append((line_number, record))
+        position = (line_number + 1, offset)
+        if len(chunk) >= chunk_size:
+            yield position, chunk
+            chunk = []
+    if chunk:
+        yield position, chunk
+
+
+class Checkpoint:
+    """Позиция во входном файле и номер следующей части результата.
+
+    Позиция хранится и номером строки, и смещением в байтах: продолжение
+    переходит к смещению через seek, не перечитывая обработанную часть.
+    """
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.next_line = 0
+        self.next_offset = 0
+        self.next_part = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('input') != self.input_path:
+            raise ValueError(f"Контрольная точка {self.path} относится к другому файлу: {data.get('input')}")
+        self.next_line = data['next_line']
+        self.next_part = data['next_part']
+        next_offset = data.get('next_offset')
+        self.next_offset = next_offset if next_offset is not None else line_offset(self.input_path, self.next_line)
+        return True
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'input': self.input_path, 'next_line': self.next_line, 'next_offset': self.next_offset,
+                       'next_part': self.next_part,
+                       'updated': time.strftime('%Y-%m-%dT%H:%M:%S')}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def _schema():
+    import pyarrow as pa
+
+    # Схема задана явно: в чанке, где поле всегда пустое, pyarrow вывел бы тип null
+    fields = [('line', pa.int64())]
+    fields += [(field, pa.string()) for field in PASSTHROUGH_FIELDS]
+    fields += [
+        ('text', pa.string()),
+        ('intent', pa.string()),
+        ('intent_confidence', pa.float64()),
+        ('sentiment_score', pa.float64()),
+        ('sentiment_label', pa.string()),
+        ('sentiment_confidence', pa.float64()),
+        ('topic', pa.string()),
+        ('topic_score', pa.float64())
+    ]
+    return pa.schema(fields)
+
+
+class PartWriter:
+    """Пишет колонки в Parquet-файлы частями; готовая часть появляется атомарно"""
+
+    def __init__(self, output_dir: str, part_rows: int):
+        import pyarrow.parquet  # noqa: F401 — ошибка импорта должна возникнуть до запуска воркеров
+
+        self.output_dir = output_dir
+        self.part_rows = part_rows
+        self.schema = _schema()
+        self._writer = None
+        self._tmp_path: Optional[str] = None
+        self._final_path: Optional[str] = None
+        self.rows_in_part = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, columns: Dict[str, list], part_index: int) -> bool:
+        """Дописать чанк; True, если после этого часть закрыта"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(columns, schema=self.schema)
+        if self._writer is None:
+            self._final_path = os.path.join(self.output_dir, f"part-{part_index:05d}.parquet")
+            self._tmp_path = f"{self._final_path}.tmp"
+            self._writer = pq.ParquetWriter(self._tmp_path, self.schema)
+        self._writer.write_table(table)
+        self.rows_in_part += table.num_rows
+        if self.rows_in_part >= self.part_rows:
+            self.close()
+            return True
+        return False
+
+    def close(self) -> bool:
+        if self._writer is None:
+            return False
+        self._writer.close()
+        os.replace(self._tmp_path, self._final_path)
+        self._writer = None
+        self.rows_in_part = 0
+        return True
+
+
+def _bounded_map(executor, fn, items: Iterable, window: int, *args) -> Iterator[Tuple[Any, Future]]:
+    """Как executor.map, но держит в работе не больше window задач и сохраняет порядок"""
+    pending = deque()
+    for item, payload in items:
+        pending.append((item, executor.submit(fn, payload, *args)))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+class _InlineExecutor:
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+
+def run_replay(input_path: str, output_dir: str, config: Dict[str, Any] = None,
+               resume: bool = True) -> Dict[str, Any]:
+    config = config or REPLAY_CONFIG
+    checkpoint = Checkpoint(os.path.join(output_dir, 'checkpoint.json'), input_path)
+    os.makedirs(output_dir, exist_ok=True)
+    if resume and checkpoint.load():
+        print(f"Продолжение со строки {checkpoint.next_line}, часть {checkpoint.next_part}")
+
+    writer = PartWriter(output_dir, config['part_rows'])
+    workers = config['workers']
+    if workers > 0:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker)
+    else:
+        executor = _InlineExecutor()
+
+    started = time.perf_counter()
+    rows = 0
+    position = (checkpoint.next_line, checkpoint.next_offset)
+    try:
+        chunks = iter_chunks(input_path, checkpoint.next_line, checkpoint.next_offset, config['chunk_size'])
+        window = max(1, workers) * config['chunks_in_flight']
+        for position, future in _bounded_map(executor, analyze_chunk, chunks, window, config['text_field']):
+            columns = future.result()
+            rows += len(columns['line'])
+            if writer.write(columns, checkpoint.next_part):
+                checkpoint.next_line, checkpoint.next_offset = position
+                checkpoint.next_part += 1
+                checkpoint.save()
+                elapsed = time.perf_counter() - started
+                print(f"Часть {checkpoint.next_part - 1} готова: {rows} сообщений, {rows / elapsed:.0f} сообщ./с")
+        if writer.close():
+            checkpoint.next_line, checkpoint.next_offset = position
+            checkpoint.next_part += 1
+            checkpoint.save()
+    finally:
+        executor.shutdown(wait=True)
+
+    elapsed = time.perf_counter() - started
+    return {'rows': rows, 'seconds': elapsed, 'parts': checkpoint.next_part, 'next_line': checkpoint.next_line,
+            'next_offset': checkpoint.next_offset}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Повторная разметка архива переписки текущими моделями")
+    parser.add_argument('input', help="JSONL-файл, по сообщению в строке")
+    parser.add_argument('output', help="каталог для Parquet-частей и контрольной точки")
+    parser.add_argument('--workers', type=int, default=REPLAY_CONFIG['workers'], help="0 — без отдельных процессов")
+    parser.add_argument('--chunk-size', type=int, default=REPLAY_CONFIG['chunk_size'])
+    parser.add_argument('--part-rows', type=int, default=REPLAY_CONFIG['part_rows'])
+    parser.add_argument('--text-field', default=REPLAY_CONFIG['text_field'])
+    parser.add_argument('--restart', action='store_true', help="игнорировать контрольную точку")
+    args = parser.parse_args(argv)
+
+    config = dict(REPLAY_CONFIG, workers=args.workers, chunk_size=args.chunk_size,
+                  part_rows=args.part_rows, text_field=args.text_field)
+    try:
+        result = run_replay(args.input, args.output, config, resume=not args.restart)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Ошибка: {e}")
+        return 1
+    print(f"Готово: {result['rows']} сообщений за {result['seconds']:.1f} с, частей: {result['parts']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,67 +1,175 @@
 import random
-from typing import Dict, List, Optional, Tuple
-from text_processor import TextProcessor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import SENTIMENT_CONFIG
+
+_MISSING = object()
+
+
+class SentimentLexicon:
+    """Лексикон тональности в виде отсортированного массива лемм и массива оценок"""
+
+    def __init__(self, entries: Dict[str, float], cache_size: int = 10000):
+        words = sorted(entries)
+        self.words = np.array(words) if words else np.array([''])
+        self.scores = np.array([entries[word] for word in words] or [0.0], dtype=np.float64)
+        self.size = len(words)
+        # Для одиночных сообщений поиск по массиву дороже самой оценки, поэтому
+        # встреченные леммы кэшируются; переполненный кэш сбрасывается целиком
+        self.cache_size = cache_size
+        self._cache: Dict[str, Optional[float]] = {}
+
+    @classmethod
+    def from_file(cls, path: str) -> 'SentimentLexicon':
+        """Загрузить лексикон из файла «лемма<TAB>оценка»; повторная лемма заменяет прежнюю"""
+        entries = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    word, score = line.split('\t')
+                    entries[word.strip().lower()] = float(score)
+                except ValueError:
+                    print(f"Пропущена строка {line_number} лексикона {path}: {line!r}")
+        return cls(entries)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) is not None
+
+    def get(self, word: str, default: Optional[float] = None) -> Optional[float]:
+        score = self._cache.get(word, _MISSING)
+        if score is _MISSING:
+            matched, scores = self.lookup(np.array([word]))
+            score = float(scores[0]) if matched[0] else None
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[word] = score
+        return default if score is None else score
+
+    def lookup(self, tokens: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Маска найденных токенов и их оценки (0 для отсутствующих)"""
+        if not self.size or not len(tokens):
+            return np.zeros(len(tokens), dtype=bool), np.zeros(len(tokens))
+        positions = np.minimum(np.searchsorted(self.words, tokens), self.size - 1)
+        matched = self.words[positions] == tokens
+        return matched, np.where(matched, self.scores[positions], 0.0)
+
 
 class SentimentAnalyzer:
-    def __init__(self):
-        self.text_processor = TextProcessor()
-
-        self.sentiment_dict = {
-            'хороший': 0.7, 'отличный': 0.9, 'прекрасный': 0.8, 'замечательный': 0.8,
-            'нравиться': 0.6, 'любить': 0.8, 'восхитительный': 0.9, 'классный': 0.6,
-            'красивый': 0.7, 'приятный': 0.6, 'качественный': 0.7, 'роскошный': 0.8,
-            'элегантный': 0.7, 'стильный': 0.6, 'модный': 0.5, 'популярный': 0.4,
-            'известный': 0.3, 'брендовый': 0.4, 'дорогой': 0.2, 'престижный': 0.6,
-            'соблазнительный': 0.7, 'притягательный': 0.6, 'чувственный': 0.7,
-            'свежий': 0.5, 'легкий': 0.4, 'долгий': 0.5, 'стойкий': 0.6,
-
-            'плохой': -0.7, 'ужасный': -0.9, 'отвратительный': -0.9, 'некачественный': -0.8,
-            'дешевый': -0.5, 'дорогой': -0.3, 'странный': -0.4, 'неприятный': -0.6,
-            'невкусный': -0.7, 'резкий': -0.5, 'химический': -0.6, 'искусственный': -0.4,
-            'слабый': -0.4, 'короткий': -0.3, 'не': -0.5, 'нет': -0.3,
-            'ненавидеть': -0.8, 'разочаровать': -0.6, 'расстроить': -0.5,
-
-            'обычный': 0.0, 'нормальный': 0.0, 'средний': 0.0, 'простой': 0.0,
-            'покупать': 0.1, 'выбирать': 0.0, 'искать': 0.0, 'нужный': 0.1,
-            'подходить': 0.2, 'рекомендовать': 0.3, 'советовать': 0.2
-        }
+    def __init__(self, lexicon: SentimentLexicon = None, config: Dict = None):
+        self.config = config or SENTIMENT_CONFIG
+        self.lexicon = lexicon or SentimentLexicon.from_file(self.config['lexicon_path'])
+        self.negator_set = frozenset(self.config['negators'])
+        self.negators = np.array(sorted(self.negator_set))
+        self.negation_window = self.config['negation_window']
+        self.negation_factor = self.config['negation_factor']
+
+    def _score_tokens(self, tokens: np.ndarray, doc_ids: np.ndarray,
+                      doc_starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Оценки токенов с учётом отрицаний; doc_starts — индекс первого токена каждого документа"""
+        matched, scores = self.lexicon.lookup(tokens)
+        if not len(tokens):
+            return matched, scores
+
+        is_negator = np.isin(tokens, self.negators)
+        if not is_negator.any():
+            return matched, scores
+        # Отрицание само не оценивается, а только меняет знак следующих слов
+        matched &= ~is_negator
+        if not self.negation_window:
+            return matched, scores
+        positions = np.arange(len(tokens))
+        # Позиция последнего отрицания строго до токена
+        last_negator = np.maximum.accumulate(np.where(is_negator, positions, -1))
+        last_negator = np.concatenate(([-1], last_negator[:-1]))
+        negated = (matched
+                   & (last_negator >= doc_starts[doc_ids])
+                   & (positions - last_negator <= self.negation_window))
+        scores[negated] *= self.negation_factor
+        return matched, scores
+
+    def score_batch(self, lemma_lists: List[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Средняя оценка и уверенность для каждого списка лемм, без построчного Python-цикла"""
+        lengths = np.fromiter((len(lemmas) for lemmas in lemma_lists), dtype=np.int64, count=len(lemma_lists))
+        tokens = np.array([lemma for lemmas in lemma_lists for lemma in lemmas])
+        doc_ids = np.repeat(np.arange(len(lemma_lists)), lengths)
+        doc_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+
+        matched, scores = self._score_tokens(tokens, doc_ids, doc_starts)
+        matched_docs = doc_ids[matched]
+        counts = np.bincount(matched_docs, minlength=len(lemma_lists))
+        totals = np.bincount(matched_docs, weights=scores[matched], minlength=len(lemma_lists))
+
+        has_words = counts > 0
+        averages = np.zeros(len(lemma_lists))
+        averages[has_words] = totals[has_words] / counts[has_words]
+        confidences = np.zeros(len(lemma_lists))
+        confidences[has_words] = np.minimum(counts[has_words] / lengths[has_words], 1.0)
+        return averages, confidences
+
+    def label(self, score: float) -> str:
+        if score > self.config['positive_threshold']:
+            return 'positive'
+        if score < self.config['negative_threshold']:
+            return 'negative'
+        return 'neutral'
+
+    def label_batch(self, scores: np.ndarray) -> np.ndarray:
+        return np.where(scores > self.config['positive_threshold'], 'positive',
+                        np.where(scores < self.config['negative_threshold'], 'negative', 'neutral'))
+
+    def analyze_message(self, message) -> Dict[str, float]:
+        """Тональность разобранного сообщения; отрицания остаются среди лемм, иначе их не видно"""
+        return self.analyze_sentiment_from_lemmas(message.lemmas_keeping(self.negator_set))
 
     def analyze_sentiment_from_lemmas(self, lemmas: List[str]) -> Dict[str, float]:
         if not lemmas:
             return {'score': 0.0, 'label': 'neutral', 'confidence': 0.0}
 
-        total_score = 0.0
-        word_count = 0
+        # То же правило отрицаний, что и в _score_tokens, но без накладных расходов NumPy
         sentiment_words = []
-
-        for lemma in lemmas:
-            if lemma in self.sentiment_dict:
-                score = self.sentiment_dict[lemma]
-                total_score += score
-                word_count += 1
+        last_negator = None
+        for position, lemma in enumerate(lemmas):
+            if lemma in self.negator_set:
+                # Отрицание само не оценивается, а только меняет знак следующих слов
+                last_negator = position
+                continue
+            score = self.lexicon.get(lemma)
+            if (score is not None and last_negator is not None
+                  and position - last_negator <= self.negation_window):
+                score *= self.negation_factor
+            if score is not None:
                 sentiment_words.append((lemma, score))
 
-        if word_count > 0:
-            avg_score = total_score / word_count
-            confidence = min(word_count / len(lemmas), 1.0)
+        if sentiment_words:
+            avg_score = float(sum(score for _, score in sentiment_words) / len(sentiment_words))
+            confidence = min(len(sentiment_words) / len(lemmas), 1.0)
         else:
             avg_score = 0.0
             confidence = 0.0
 
-        if avg_score > 0.1:
-            label = 'positive'
-        elif avg_score < -0.1:
-            label = 'negative'
-        else:
-            label = 'neutral'
-
         return {
             'score': avg_score,
-            'label': label,
+            'label': self.label(avg_score),
             'confidence': confidence,
             'sentiment_words': sentiment_words
         }
 
+    def analyze_batch(self, lemma_lists: Iterable[List[str]]) -> List[Dict[str, float]]:
+        """Итоговые оценки для набора сообщений без списка найденных слов"""
+        lemma_lists = list(lemma_lists)
+        scores, confidences = self.score_batch(lemma_lists)
+        labels = self.label_batch(scores)
+        return [{'score': float(score), 'label': str(label), 'confidence': float(confidence)}
+                for score, label, confidence in zip(scores, labels, confidences)]
+
     def get_emotion_response(self, sentiment: Dict[str, float], context: str = '') -> str:
         label = sentiment['label']
         score = sentiment['score']
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import SESSION_CONFIG
+from state_store import StateStore, create_state_store
+
+DEFAULT_USER_ID = '__default__'
+
+
+class UserSession:
+    """Состояние диалога одного пользователя"""
+
+    __slots__ = (
+        'user_id', 'conversation_stage', 'message_count', 'casual_message_count',
+        'casual_topics_discussed', 'offer_made', 'user_preferences', 'theme_history',
+        'last_active'
+    )
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.last_active = time.time()
+        self.reset()
+
+    def reset(self):
+        self.conversation_stage = 'casual'
+        self.message_count = 0
+        self.casual_message_count = 0
+        self.casual_topics_discussed = set()
+        self.offer_made = False
+        self.user_preferences = {}
+        self.theme_history = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'user_id': self.user_id,
+            'conversation_stage': self.conversation_stage,
+            'message_count': self.message_count,
+            'casual_message_count': self.casual_message_count,
+            'casual_topics_discussed': sorted(self.casual_topics_discussed),
+            'offer_made': self.offer_made,
+            'user_preferences': self.user_preferences,
+            'theme_history': self.theme_history,
+            'last_active': self.last_active
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'UserSession':
+        session = cls(data['user_id'])
+        session.conversation_stage = data.get('conversation_stage', 'casual')
+        session.message_count = data.get('message_count', 0)
+        session.casual_message_count = data.get('casual_message_count', 0)
+        session.casual_topics_discussed = set(data.get('casual_topics_discussed', []))
+        session.offer_made = data.get('offer_made', False)
+        session.user_preferences = data.get('user_preferences', {})
+        session.theme_history = data.get('theme_history', [])
+        session.last_active = data.get('last_active', session.last_active)
+        return session
+
+
+class SessionStore:
+    """Хранилище сессий пользователей с вытеснением по LRU и TTL.
+
+    В памяти держатся только активные сессии; состояние каждого диалога
+    сохраняется в state_store. Сессия читается оттуда при первом сообщении
+    пользователя после запуска или после вытеснения из памяти.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 snapshot_path: Optional[str] = None, state_store: Optional[StateStore] = None):
+        self.max_sessions = max_sessions or SESSION_CONFIG['max_sessions']
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else SESSION_CONFIG['ttl_seconds']
+        self.snapshot_path = snapshot_path or SESSION_CONFIG['snapshot_path']
+        self.state_store = state_store or create_state_store()
+        self._sessions: 'OrderedDict[str, UserSession]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.loaded = 0
+        if self.ttl_seconds:
+            self.state_store.purge(self.ttl_seconds)
+
+    @property
+    def persistent(self) -> bool:
+        return self.state_store.persistent
+
+    def get(self, user_id: Optional[str]) -> UserSession:
+        """Получить сессию пользователя, загрузив или создав её при необходимости"""
+        key = str(user_id) if user_id is not None else DEFAULT_USER_ID
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                session.last_active = now
+                return session
+
+        # Чтение из хранилища идёт без блокировки, чтобы не задерживать остальных пользователей
+        loaded = self._load(key, now)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = loaded
+                self._sessions[key] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(key)
+            session.last_active = now
+            return session
+
+    def _load(self, key: str, now: float) -> UserSession:
+        data = self.state_store.load(key)
+        if data and (not self.ttl_seconds or data.get('last_active', 0) >= now - self.ttl_seconds):
+            self.loaded += 1
+            return UserSession.from_dict(data)
+        return UserSession(key)
+
+    def save(self, session: UserSession):
+        """Передать состояние сессии в хранилище; запись на диск может быть отложена"""
+        self.state_store.save(session.user_id, session.to_dict())
+
+    def peek(self, user_id: Optional[str]) -> Optional[UserSession]:
+        key = str(user_id) if user_id is not None else DEFAULT_USER_ID
+        with self._lock:
+            return self._sessions.get(key)
+
+    def remove(self, user_id: Optional[str]) -> None:
+        key = str(user_id) if user_id is not None else DEFAULT_USER_ID
+        with self._lock:
+            self._sessions.pop(key, None)
+        self.state_store.delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def close(self):
+        """Дописать отложенные изменения и закрыть хранилище"""
+        self.state_store.close()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_expired(self, now: float):
+        if not self.ttl_seconds:
+            return
+        deadline = now - self.ttl_seconds
+        # Сессии упорядочены по времени последней активности, поэтому
+        # достаточно снимать устаревшие с начала словаря
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_active >= deadline:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def save_snapshot(self, path: Optional[str] = None) -> bool:
+        """Сохранить активные сессии на диск"""
+        path = path or self.snapshot_path
+        if not path:
+            return False
+        with self._lock:
+            data = [session.to_dict() for session in self._sessions.values()]
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            print(f"Ошибка сохранения сессий: {e}")
+            return False
+
+    def load_snapshot(self, path: Optional[str] = None) -> int:
+        """Восстановить сессии с диска, пропуская устаревшие"""
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Ошибка загрузки сессий: {e}")
+            return 0
+
+        sessions = sorted((UserSession.from_dict(item) for item in data), key=lambda s: s.last_active)
+        with self._lock:
+            for session in sessions:
+                self._sessions[session.user_id] = session
+                self._sessions.move_to_end(session.user_id)
+            self._evict_expired(time.time())
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return len(self._sessions)
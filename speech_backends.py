@@ -0,0 +1,181 @@
+import io
+import json
+import subprocess
+import threading
+from typing import Dict, Optional, Tuple, Type
+
+import speech_recognition as sr
+
+from audio_codec import SAMPLE_WIDTH, PCMAudio
+from config import VOICE_CONFIG
+
+
+class RecognizerBackend:
+    """Распознавание речи из PCM в памяти; возвращает (текст, статус) как VoiceProcessor"""
+
+    name = 'base'
+
+    def __init__(self, language: str = 'ru'):
+        self.language = language
+        # Частота, в которой движку удобнее всего получать звук
+        self.sample_rate = VOICE_CONFIG['sample_rate']
+
+    def load(self):
+        """Загрузить модель заранее, чтобы не платить за это на первом сообщении"""
+
+    def recognize(self, audio: PCMAudio) -> Tuple[Optional[str], str]:
+        raise NotImplementedError
+
+
+class GoogleRecognizer(RecognizerBackend):
+    """Облачное распознавание Google через SpeechRecognition"""
+
+    name = 'google'
+
+    def __init__(self, language: str = 'ru'):
+        super().__init__(language)
+        self.recognizer = sr.Recognizer()
+        self.recognizer.energy_threshold = 300
+        self.recognizer.dynamic_energy_threshold = True
+        self.recognizer.pause_threshold = 0.8
+
+    def recognize(self, audio: PCMAudio) -> Tuple[Optional[str], str]:
+        try:
+            audio_data = sr.AudioData(audio.data, audio.sample_rate, SAMPLE_WIDTH)
+            return self.recognizer.recognize_google(audio_data, language=self.language), "success"
+        except sr.UnknownValueError:
+            return None, "Не удалось распознать речь"
+        except sr.RequestError as e:
+            return None, f"Ошибка сервиса распознавания речи: {e}"
+
+
+_vosk_models: Dict[str, object] = {}
+_vosk_lock = threading.Lock()
+
+
+def _load_vosk_model(path: str):
+    """Модель Vosk загружается один раз на процесс и разделяется всеми распознавателями"""
+    with _vosk_lock:
+        model = _vosk_models.get(path)
+        if model is None:
+            import vosk
+            vosk.SetLogLevel(-1)
+            model = vosk.Model(path)
+            _vosk_models[path] = model
+        return model
+
+
+class VoskRecognizer(RecognizerBackend):
+    """Локальное распознавание моделью Vosk без обращения к сети"""
+
+    name = 'vosk'
+
+    def __init__(self, language: str = 'ru', model_path: str = None, sample_rate: int = None):
+        super().__init__(language)
+        self.model_path = model_path or VOICE_CONFIG['vosk_model_path']
+        self.sample_rate = sample_rate or VOICE_CONFIG['sample_rate']
+
+    def load(self):
+        _load_vosk_model(self.model_path)
+
+    def recognize(self, audio: PCMAudio) -> Tuple[Optional[str], str]:
+        import vosk
+        try:
+            model = _load_vosk_model(self.model_path)
+        except Exception as e:
+            return None, f"Модель распознавания не загружена: {e}"
+
+        if audio.channels != 1:
+            return None, "Ожидается моно-звук"
+        # KaldiRecognizer хранит состояние потока, поэтому он свой на каждый запрос
+        recognizer = vosk.KaldiRecognizer(model, audio.sample_rate)
+        recognizer.AcceptWaveform(audio.data)
+        text = json.loads(recognizer.FinalResult()).get('text', '').strip()
+        if not text:
+            return None, "Не удалось распознать речь"
+        return text, "success"
+
+
+BACKENDS: Dict[str, Type[RecognizerBackend]] = {
+    GoogleRecognizer.name: GoogleRecognizer,
+    VoskRecognizer.name: VoskRecognizer
+}
+
+
+def create_recognizer(name: str = None, language: str = None) -> RecognizerBackend:
+    name = name or VOICE_CONFIG['asr_backend']
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный движок распознавания: {name}. Доступны: {', '.join(BACKENDS)}")
+    return BACKENDS[name](language or VOICE_CONFIG['language'])
+
+
+class SynthesizerBackend:
+    """Синтез речи: текст в сжатый или несжатый звук формата output_format"""
+
+    name = 'base'
+    output_format = 'wav'
+
+    def __init__(self, language: str = 'ru'):
+        self.language = language
+
+    @property
+    def identity(self) -> str:
+        """Всё, от чего зависит звучание: входит в ключ кэша синтеза"""
+        return f"{self.name}:{self.language}"
+
+    def synthesize(self, text: str) -> bytes:
+        raise NotImplementedError
+
+
+class GTTSSynthesizer(SynthesizerBackend):
+    """Облачный синтез Google Translate, отдаёт mp3"""
+
+    name = 'gtts'
+    output_format = 'mp3'
+
+    def synthesize(self, text: str) -> bytes:
+        from gtts import gTTS
+        mp3_fp = io.BytesIO()
+        gTTS(text=text, lang=self.language, slow=False).write_to_fp(mp3_fp)
+        return mp3_fp.getvalue()
+
+
+class EspeakSynthesizer(SynthesizerBackend):
+    """Локальный синтез espeak-ng без обращения к сети, отдаёт WAV"""
+
+    name = 'espeak'
+    output_format = 'wav'
+
+    def __init__(self, language: str = 'ru', voice: str = None, speed: int = None):
+        super().__init__(language)
+        self.voice = voice or VOICE_CONFIG['espeak_voice'] or language
+        self.speed = speed or VOICE_CONFIG['espeak_speed']
+
+    @property
+    def identity(self) -> str:
+        return f"{self.name}:{self.voice}:{self.speed}"
+
+    def synthesize(self, text: str) -> bytes:
+        command = [VOICE_CONFIG['espeak_path'], '-v', self.voice, '-s', str(self.speed), '--stdout']
+        try:
+            # Текст передаётся через stdin, чтобы не упираться в длину командной строки
+            process = subprocess.run(command, input=text.encode('utf-8'), stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, timeout=VOICE_CONFIG['decode_timeout'])
+        except FileNotFoundError:
+            raise RuntimeError(f"espeak-ng не найден: {VOICE_CONFIG['espeak_path']}")
+        if process.returncode != 0 or not process.stdout:
+            raise RuntimeError(process.stderr.decode('utf-8', 'replace').strip() or "espeak-ng завершился с ошибкой")
+        return process.stdout
+
+
+SYNTHESIZERS: Dict[str, Type[SynthesizerBackend]] = {
+    GTTSSynthesizer.name: GTTSSynthesizer,
+    EspeakSynthesizer.name: EspeakSynthesizer
+}
+
+
+def create_synthesizer(name: str = None, language: str = None) -> SynthesizerBackend:
+    name = name or VOICE_CONFIG['tts_backend']
+    if name not in SYNTHESIZERS:
+        raise ValueError(f"Неизвестный движок синтеза: {name}. Доступны: {', '.join(SYNTHESIZERS)}")
+    return SYNTHESIZERS[name](language or VOICE_CONFIG['language'])
@@ -0,0 +1,34 @@
+import resource
+import sys
+import time
+
+
+def _rss_mb() -> float:
+    """Текущий RSS процесса в мегабайтах"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+if __name__ == "__main__":
+    print("=== Профиль холодного старта PerfumeBot ===")
+    base_rss = _rss_mb()
+    started = time.perf_counter()
+    from perfume_bot import PerfumeBot
+    imported = time.perf_counter()
+    bot = PerfumeBot()
+    constructed = time.perf_counter()
+    constructed_rss = _rss_mb()
+    bot.process_message("привет", "startup_profile")
+    first_message = time.perf_counter()
+
+    print(f"Импорт модулей:        {imported - started:.2f} с")
+    print(f"Создание PerfumeBot:   {constructed - imported:.2f} с  (RSS {constructed_rss:.0f} МБ)")
+    print(f"Первое сообщение:      {first_message - constructed:.2f} с  (RSS {_rss_mb():.0f} МБ)")
+    print(f"Итого до ответа:       {first_message - started:.2f} с, прирост RSS {_rss_mb() - base_rss:.0f} МБ")
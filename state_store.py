@@ -0,0 +1,209 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import SESSION_CONFIG
+
+
+class StateStore:
+    """Хранилище состояния диалогов: словарь сессии по идентификатору пользователя"""
+
+    # Переживает ли состояние перезапуск процесса
+    persistent = False
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save(self, user_id: str, state: Dict[str, Any]):
+        raise NotImplementedError
+
+    def delete(self, user_id: str):
+        raise NotImplementedError
+
+    def purge(self, older_than: float) -> int:
+        """Удалить состояния, неактивные дольше older_than секунд"""
+        return 0
+
+    def flush(self) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryStateStore(StateStore):
+    """Состояние в памяти процесса с вытеснением по LRU; теряется при перезапуске"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or SESSION_CONFIG['max_sessions']
+        self._states: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.saves = 0
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._states.get(user_id)
+        return json.loads(data) if data is not None else None
+
+    def save(self, user_id: str, state: Dict[str, Any]):
+        # Копия через JSON, чтобы сохранённое состояние не менялось вместе с живой сессией
+        data = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._states[user_id] = data
+            self._states.move_to_end(user_id)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+            self.saves += 1
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def purge(self, older_than: float) -> int:
+        deadline = time.time() - older_than
+        with self._lock:
+            expired = [user_id for user_id, data in self._states.items()
+                       if json.loads(data).get('last_active', 0) < deadline]
+            for user_id in expired:
+                del self._states[user_id]
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': 'memory', 'size': len(self._states), 'saves': self.saves}
+
+
+class SQLiteStateStore(StateStore):
+    """Состояние в локальной базе SQLite с отложенной записью.
+
+    save() только запоминает новое состояние в памяти; фоновый поток раз в
+    flush_interval секунд пишет все накопившиеся изменения одной транзакцией.
+    Несколько сохранений одной сессии между сбросами превращаются в одну
+    запись, а сообщение пользователя не ждёт диска. При аварийном завершении
+    теряются изменения не больше чем за один интервал.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str = None, flush_interval: float = None):
+        self.path = path or SESSION_CONFIG['state_path']
+        self.flush_interval = flush_interval or SESSION_CONFIG['flush_interval']
+        self._conn = sqlite3.connect(self.path, timeout=SESSION_CONFIG['busy_timeout'],
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+            user_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            last_active REAL NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions(last_active)')
+        # Изменения, ещё не записанные на диск: None означает удаление
+        self._pending: Dict[str, Optional[Tuple[str, float]]] = {}
+        self._lock = threading.Lock()
+        # Держится на всё время сброса, чтобы чтение не проскочило между изъятием пачки и коммитом
+        self._conn_lock = threading.Lock()
+        self._closed = threading.Event()
+        self.saves = 0
+        self.written = 0
+        self.flushes = 0
+        self._thread = threading.Thread(target=self._run, name='state-store-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if user_id in self._pending:
+                pending = self._pending[user_id]
+                return json.loads(pending[0]) if pending is not None else None
+        try:
+            with self._conn_lock:
+                row = self._conn.execute('SELECT state FROM sessions WHERE user_id = ?', (user_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Ошибка чтения сессии {user_id}: {e}")
+            return None
+
+    def save(self, user_id: str, state: Dict[str, Any]):
+        # Сериализация здесь, а не в фоновом потоке: сессия может меняться дальше
+        data = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._pending[user_id] = (data, state.get('last_active', time.time()))
+            self.saves += 1
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._pending[user_id] = None
+
+    def purge(self, older_than: float) -> int:
+        with self._conn_lock:
+            cursor = self._conn.execute('DELETE FROM sessions WHERE last_active < ?', (time.time() - older_than,))
+            return cursor.rowcount
+
+    def flush(self) -> int:
+        """Записать накопившиеся изменения одной транзакцией; возвращает число сессий"""
+        with self._conn_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            upserts = [(user_id, item[0], item[1]) for user_id, item in batch.items() if item is not None]
+            deletes = [(user_id,) for user_id, item in batch.items() if item is None]
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    self._conn.executemany('INSERT OR REPLACE INTO sessions (user_id, state, last_active) '
+                                           'VALUES (?, ?, ?)', upserts)
+                    self._conn.executemany('DELETE FROM sessions WHERE user_id = ?', deletes)
+                    self._conn.execute('COMMIT')
+                except BaseException:
+                    self._conn.execute('ROLLBACK')
+                    raise
+            except Exception as e:
+                print(f"Ошибка записи сессий: {e}")
+                # Пачка возвращается в очередь, более свежие изменения не перетираются
+                with self._lock:
+                    for user_id, item in batch.items():
+                        self._pending.setdefault(user_id, item)
+                return 0
+        self.written += len(batch)
+        self.flushes += 1
+        return len(batch)
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        with self._conn_lock:
+            self._conn.close()
+        atexit.unregister(self.close)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': 'sqlite', 'pending': len(self._pending), 'saves': self.saves,
+                'written': self.written, 'flushes': self.flushes}
+
+
+STATE_STORES = {
+    'memory': MemoryStateStore,
+    'sqlite': SQLiteStateStore
+}
+
+
+def create_state_store(name: str = None, path: str = None) -> StateStore:
+    """Хранилище по имени; path задаёт файл для хранилищ, переживающих перезапуск"""
+    name = name or SESSION_CONFIG['backend']
+    if name not in STATE_STORES:
+        raise ValueError(f"Неизвестное хранилище сессий: {name}. Доступны: {', '.join(STATE_STORES)}")
+    store_class = STATE_STORES[name]
+    return store_class(path) if store_class.persistent else store_class()
@@ -1,33 +1,83 @@
 import os
+import json
 import logging
 import traceback
+import contextvars
 from typing import Optional, List, Dict, Any
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError, TimedOut
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler,
+    Application, BaseUpdateProcessor, CommandHandler, MessageHandler,
     filters, ContextTypes
 )
 import asyncio
 
 from perfume_bot import PerfumeBot
+from session_store import SessionStore
 from voice_processor import VoiceProcessor
-from config import TELEGRAM_TOKEN, VOICE_CONFIG
-from perfumes_data import PERFUMES_CATALOG
+from message_executor import MessageExecutor, BusyError
+from voice_pipeline import VoiceJob, VoicePipeline
+from update_queue import KeyedLock, PoisonUpdate, UpdateConsumer, UpdateQueue
+from config import TELEGRAM_TOKEN, VOICE_CONFIG, EXECUTOR_CONFIG, METRICS_CONFIG, WEBHOOK_CONFIG, UPDATE_QUEUE_CONFIG
+import metrics
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+message_log = metrics.SampledLogger('perfumebot.messages')
+
+# Ошибки обработчиков текущего обновления из журнала: Application передаёт их в error_handler, а не наверх
+_update_errors: contextvars.ContextVar = contextvars.ContextVar('update_errors')
+
+
+class UpdateFailed(Exception):
+    """Обработчик обновления завершился ошибкой; ответ пользователю не гарантирован"""
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка разных чатов; обновления одного чата идут по одному в порядке прихода"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chats = KeyedLock()
+
+    @staticmethod
+    def _chat_key(update: object):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return update.effective_user.id
+            return update.update_id
+        return None
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        async with self._chats.hold(self._chat_key(update)):
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
 
 class TelegramPerfumeBot:
     """Telegram-обёртка для PerfumeBot с поддержкой текста и голоса"""
 
-    def __init__(self, token: str):
+    BUSY_MESSAGE = "Сейчас очень много запросов. Пожалуйста, повторите сообщение через минуту."
+
+    def __init__(self, token: str, executor_config: Dict[str, Any] = None, sessions: SessionStore = None):
         self.token = token
-        self.perfume_bot = PerfumeBot()
+        self.executor_config = executor_config or EXECUTOR_CONFIG
+        self.perfume_bot = PerfumeBot(sessions=sessions)
         self.voice_processor = VoiceProcessor(language=VOICE_CONFIG['language'])
-        self.user_sessions = {}
+        self.executor = MessageExecutor(self.perfume_bot, self.voice_processor, self.executor_config)
+        self.voice_pipeline = VoicePipeline(self.executor, self.voice_processor)
+        metrics.register_bot_collectors(self.perfume_bot, self.executor, self.voice_pipeline, self.voice_processor)
+        self.metrics_server: Optional[metrics.MetricsServer] = None
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Приветствие и краткая инструкция"""
@@ -83,14 +133,14 @@ class TelegramPerfumeBot:
 
     async def catalog_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать каталог с кнопками покупки"""
-        response = self.perfume_bot.process_message("покажи каталог", str(update.effective_user.id))
+        response = await self.executor.process_message("покажи каталог", str(update.effective_user.id))
         found_perfumes = self._find_perfumes_in_response(response)
         keyboard = self._make_perfume_keyboard(found_perfumes)
         await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
 
     async def prices_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать цены с кнопками покупки"""
-        response = self.perfume_bot.process_message("цены", str(update.effective_user.id))
+        response = await self.executor.process_message("цены", str(update.effective_user.id))
         found_perfumes = self._find_perfumes_in_response(response)
         keyboard = self._make_perfume_keyboard(found_perfumes)
         await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
@@ -98,6 +148,8 @@ class TelegramPerfumeBot:
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Статистика бота"""
         stats = self.perfume_bot.get_stats()
+        executor_stats = self.executor.get_stats()
+        voice_stats = self.voice_pipeline.get_stats()
         total = sum(stats.values())
         if total > 0:
             stats_text = f"""
@@ -108,6 +160,10 @@ class TelegramPerfumeBot:
 Неопознанных запросов: {stats['failure']} ({stats['failure']/total*100:.1f}%)
 
  Всего обработано сообщений: {total}
+
+Задержка event loop: макс. {executor_stats['max_lag_ms']:.0f} мс, средняя {executor_stats['avg_lag_ms']:.1f} мс
+Отклонено из-за перегрузки: {executor_stats['messages_rejected'] + executor_stats['voice_rejected'] + voice_stats['rejected']}
+Голосовых в обработке: {voice_stats['in_flight']}, до первого ответа в среднем {voice_stats['avg_first_reply_ms']:.0f} мс
             """
         else:
             stats_text = "Статистика пока пуста. Начните диалог!"
@@ -119,48 +175,57 @@ class TelegramPerfumeBot:
         user_id = str(update.effective_user.id)
         user_message = update.message.text
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='typing')
-        response = self.perfume_bot.process_message(user_message, user_id)
+        try:
+            response = await self.executor.process_message(user_message, user_id)
+        except (BusyError, asyncio.TimeoutError):
+            logger.warning(f"Message from {user_id} rejected: executor overloaded")
+            await update.message.reply_text(self.BUSY_MESSAGE)
+            return
         found_perfumes = self._find_perfumes_in_response(response)
         keyboard = self._make_perfume_keyboard(found_perfumes)
-        await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
-        logger.info(f"User {user_id}: {user_message}")
-        logger.info(f"Bot response: {response[:100]}...")
+        with metrics.timed('telegram_send'):
+            await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
+        message_log.log('text_message', user_id=user_id, text=user_message, response=response[:100])
 
     async def handle_voice_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка голосовых сообщений пользователя"""
         user_id = str(update.effective_user.id)
+        chat_id = update.effective_chat.id
+
+        async def download() -> bytes:
+            voice_file = await context.bot.get_file(update.message.voice.file_id)
+            return bytes(await voice_file.download_as_bytearray())
+
+        async def send_text_reply(job: VoiceJob):
+            # Текст уходит сразу, голос догоняет его, когда синтез закончится
+            found_perfumes = self._find_perfumes_in_response(job.response)
+            keyboard = self._make_perfume_keyboard(found_perfumes, use_slug=True)
+            with metrics.timed('telegram_send'):
+                await update.message.reply_text(job.response, parse_mode='Markdown', reply_markup=keyboard)
+            await context.bot.send_chat_action(chat_id=chat_id, action='record_voice')
+
         try:
-            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='typing')
-            voice = update.message.voice
-            voice_file = await context.bot.get_file(voice.file_id)
-            voice_data = await voice_file.download_as_bytearray()
-            recognized_text, status = self.voice_processor.recognize_speech_from_audio(bytes(voice_data), input_format='ogg')
-            if status != "success":
-                await update.message.reply_text(f"{status}")
+            await context.bot.send_chat_action(chat_id=chat_id, action='typing')
+            job = await self.voice_pipeline.process(download, user_id, send_text_reply)
+            if job.status != "success":
+                await update.message.reply_text(f"{job.status}")
                 return
-            if not recognized_text:
-                await update.message.reply_text("Не удалось распознать речь. Попробуйте еще раз.")
-                return
-            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='typing')
-            response = self.perfume_bot.process_message(recognized_text, user_id)
-            voice_response, voice_status = self.voice_processor.text_to_speech(response)
-            found_perfumes = self._find_perfumes_in_response(response)
-            keyboard = self._make_perfume_keyboard(found_perfumes, use_slug=True)
-            if voice_status == "success" and voice_response:
-                if keyboard:
-                    await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
-                await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='record_voice')
-                await context.bot.send_voice(
-                    chat_id=update.effective_chat.id,
-                    voice=voice_response
-                )
+            if job.voice_status == "success" and job.voice:
+                with metrics.timed('telegram_send_voice'):
+                    await context.bot.send_voice(chat_id=chat_id, voice=job.voice)
             else:
-                await update.message.reply_text(response, parse_mode='Markdown', reply_markup=keyboard)
-                if voice_status != "success":
-                    await update.message.reply_text(f" Не удалось сгенерировать голосовой ответ: {voice_status}")
-            logger.info(f"Voice message from {user_id}: {recognized_text}")
+                await update.message.reply_text(f" Не удалось сгенерировать голосовой ответ: {job.voice_status}")
+            message_log.log('voice_message', user_id=user_id, text=job.recognized_text,
+                            timings={stage: round(seconds, 4) for stage, seconds in job.timings.items()})
+        except (BusyError, asyncio.TimeoutError):
+            logger.warning(f"Voice message from {user_id} rejected: voice pipeline overloaded")
+            await update.message.reply_text(self.BUSY_MESSAGE)
         except Exception as e:
             logger.error(f"Error processing voice message: {e}\n{traceback.format_exc()}")
+            # Обработчик гасит ошибку сам, поэтому отмечает её для журнала: обновление будет повторено
+            errors = _update_errors.get(None)
+            if errors is not None:
+                errors.append(e)
             await update.message.reply_text(
                 "Произошла ошибка при обработке голосового сообщения. "
                 "Попробуйте отправить текстовое сообщение."
@@ -169,18 +234,28 @@ class TelegramPerfumeBot:
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Глобальный обработчик ошибок"""
         logger.error(f"Update {update} caused error {context.error}")
+        errors = _update_errors.get(None)
+        if errors is not None:
+            errors.append(context.error)
         if update and update.message:
             await update.message.reply_text(
                 "Произошла техническая ошибка. Попробуйте еще раз через несколько секунд."
             )
 
-    def run(self):
-        """Запуск Telegram-бота"""
-        if not self.token or self.token == "YOUR_TELEGRAM_BOT_TOKEN_HERE":
-            print("Ошибка: Не указан токен Telegram бота!")
-            print("Получите токен у @BotFather и укажите его в config.py")
-            return
-        app = Application.builder().token(self.token).build()
+    def build_application(self, with_updater: bool = True) -> Application:
+        """Приложение с обработчиками; без updater обновления подаются в app.update_queue извне"""
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(ChatOrderedUpdateProcessor(self.executor_config['concurrent_updates']))
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+        )
+        if WEBHOOK_CONFIG['api_base_url']:
+            builder = builder.base_url(WEBHOOK_CONFIG['api_base_url']).base_file_url(WEBHOOK_CONFIG['api_file_url'])
+        if not with_updater:
+            builder = builder.updater(None)
+        app = builder.build()
         app.add_handler(CommandHandler("start", self.start_command))
         app.add_handler(CommandHandler("help", self.help_command))
         app.add_handler(CommandHandler("catalog", self.catalog_command))
@@ -189,17 +264,139 @@ class TelegramPerfumeBot:
         app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text_message))
         app.add_handler(MessageHandler(filters.VOICE, self.handle_voice_message))
         app.add_error_handler(self.error_handler)
+        return app
+
+    def prepare(self, metrics_port: int = None):
+        """Загрузить модели и сессии до приёма первого обновления"""
+        if self.executor_config['nlp_mode'] != 'process':
+            self.perfume_bot.text_processor.resources.preload()
+        sessions = self.perfume_bot.sessions
+        # Постоянное хранилище отдаёт сессии по первому сообщению, снимок нужен только хранилищу в памяти
+        if not sessions.persistent:
+            restored = sessions.load_snapshot()
+            if restored:
+                logger.info(f"Восстановлено сессий: {restored}")
+        if METRICS_CONFIG['enabled']:
+            self.metrics_server = metrics.MetricsServer(port=metrics_port)
+            self.metrics_server.start()
+            print(f"Метрики: http://{METRICS_CONFIG['host']}:{self.metrics_server.port}/metrics")
+
+    def cleanup(self):
+        sessions = self.perfume_bot.sessions
+        if not sessions.persistent:
+            sessions.save_snapshot()
+        sessions.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def run(self):
+        """Запуск Telegram-бота"""
+        if not self.token or self.token == "YOUR_TELEGRAM_BOT_TOKEN_HERE":
+            print("Ошибка: Не указан токен Telegram бота!")
+            print("Получите токен у @BotFather и укажите его в config.py")
+            return
+        self.prepare()
         print("Бот запущен! Нажмите Ctrl+C для остановки.")
         print("Ссылка на бота: https://t.me/your_perfumer_bot")
-        app.run_polling(drop_pending_updates=True)
+        try:
+            if UPDATE_QUEUE_CONFIG['enabled']:
+                asyncio.run(self._run_polling())
+            else:
+                self.build_application().run_polling(drop_pending_updates=False)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.cleanup()
+
+    async def process_payload(self, app: Application, payload: bytes):
+        """Обработать сохранённое обновление; возвращается, когда обработчики отправили ответ.
+
+        Если обработчик упал, выбрасывает UpdateFailed, и обновление будет повторено;
+        payload, из которого не собрать Update, — PoisonUpdate.
+        """
+        try:
+            update = Update.de_json(json.loads(payload), app.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise PoisonUpdate(f"{type(e).__name__}: {e}") from e
+        if update is None:
+            raise PoisonUpdate("пустое обновление")
+        errors = []
+        token = _update_errors.set(errors)
+        try:
+            await app.process_update(update)
+        finally:
+            _update_errors.reset(token)
+        if errors:
+            raise UpdateFailed(f"{type(errors[0]).__name__}: {errors[0]}") from errors[0]
+
+    async def _poll_updates(self, app: Application, consumer: UpdateConsumer):
+        """Цикл getUpdates: offset сдвигается только после того, как пачка записана в журнал.
+
+        Telegram считает обновления доставленными, когда следующий запрос
+        приходит с большим offset. Поэтому упавший между ответом Telegram и
+        записью в журнал процесс получит ту же пачку заново, а повторы
+        журнал отбросит по update_id.
+        """
+        timeout = UPDATE_QUEUE_CONFIG['get_updates_timeout']
+        offset = None
+        retry_delay = 1.0
+        webhook_removed = False
+        while True:
+            try:
+                if not webhook_removed:
+                    # Вебхук и getUpdates взаимоисключающие; неподтверждённые обновления Telegram отдаст заново
+                    webhook_removed = await app.bot.delete_webhook(drop_pending_updates=False)
+                updates = await app.bot.get_updates(offset=offset, timeout=timeout,
+                                                    limit=UPDATE_QUEUE_CONFIG['get_updates_limit'],
+                                                    allowed_updates=Update.ALL_TYPES, read_timeout=timeout + 5)
+            except TimedOut:
+                continue
+            except TelegramError as e:
+                logger.warning(f"getUpdates не удался: {e}; повтор через {retry_delay:.0f} с")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30.0)
+                continue
+            retry_delay = 1.0
+            if updates:
+                await consumer.ingest([(update.update_id, update.to_json().encode('utf-8')) for update in updates])
+                offset = updates[-1].update_id + 1
+
+    async def _run_polling(self):
+        """Опрос getUpdates через журнал: обновление сначала сохраняется, потом обрабатывается"""
+        app = self.build_application(with_updater=False)
+        consumer = UpdateConsumer(UpdateQueue(), lambda payload: self.process_payload(app, payload),
+                                  concurrency=self.executor_config['concurrent_updates'])
+
+        async with app:
+            await app.start()
+            await self._post_init(app)
+            poll_task = asyncio.create_task(self._poll_updates(app, consumer))
+            try:
+                await consumer.run()
+            finally:
+                # Опрос останавливается между запросами: полученное, но не записанное Telegram отдаст снова
+                poll_task.cancel()
+                try:
+                    await poll_task
+                except asyncio.CancelledError:
+                    pass
+                await app.stop()
+                await self._post_shutdown(app)
+                consumer.shutdown()
+
+    async def _post_init(self, app: Application):
+        self.executor.lag_monitor.start()
+        self.voice_pipeline.start()
+
+    async def _post_shutdown(self, app: Application):
+        await self.executor.lag_monitor.stop()
+        await self.voice_pipeline.stop()
+        self.executor.shutdown(wait=False)
 
     def _find_perfumes_in_response(self, response: str) -> List[Dict[str, Any]]:
         """Поиск упомянутых в ответе парфюмов по имени"""
-        found = []
-        for perfume in PERFUMES_CATALOG.values():
-            if perfume['name'] in response:
-                found.append(perfume)
-        return found
+        return self.perfume_bot.perfume_service.find_mentioned_perfumes(response)
 
     def _make_perfume_keyboard(self, perfumes: List[Dict[str, Any]], use_slug: bool = False) -> Optional[InlineKeyboardMarkup]:
         """Генерация клавиатуры с кнопками для покупки парфюма"""
@@ -229,6 +426,10 @@ class TelegramPerfumeBot:
 
 def main():
     try:
+        if WEBHOOK_CONFIG['mode'] == 'webhook':
+            from webhook_server import run_webhook
+            run_webhook(TELEGRAM_TOKEN)
+            return
         bot = TelegramPerfumeBot(TELEGRAM_TOKEN)
         bot.run()
     except KeyboardInterrupt:
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория, а пути к данным в config.py заданы относительно него
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    return ROOT
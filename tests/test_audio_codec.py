@@ -0,0 +1,87 @@
+import struct
+
+import pytest
+
+import audio_codec
+from audio_codec import PCMAudio, get_duration
+
+
+@pytest.fixture(autouse=True)
+def no_decoding(monkeypatch):
+    # Длительность должна читаться из заголовков: ffmpeg в этих тестах не вызывается
+    def decode_to_pcm(*args, **kwargs):
+        raise AssertionError("get_duration ушёл в декодирование")
+    monkeypatch.setattr(audio_codec, 'decode_to_pcm', decode_to_pcm)
+
+
+def wav_with_chunks(chunks):
+    body = b'WAVE' + b''.join(chunk_id + struct.pack('<I', len(data)) + data + b'\0' * (len(data) & 1)
+                              for chunk_id, data in chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def ogg_page(granule, payload, serial=1, sequence=0, header_type=0):
+    assert len(payload) < 255
+    return (b'OggS' + bytes([0, header_type]) + struct.pack('<qIII', granule, serial, sequence, 0)
+            + bytes([1, len(payload)]) + payload)
+
+
+def mp3_frame(bitrate_index=9, rate_index=0, version=3, padding=0, payload=b''):
+    header = 0xFFE00000 | version << 19 | 1 << 17 | 1 << 16 | bitrate_index << 12 | rate_index << 10 | padding << 9
+    bitrate = audio_codec._MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    rate = audio_codec._MP3_SAMPLE_RATES[version][rate_index]
+    samples = 1152 if version == 3 else 576
+    length = samples // 8 * bitrate // rate + padding
+    frame = struct.pack('>I', header) + payload
+    return frame + b'\0' * (length - len(frame))
+
+
+@pytest.mark.parametrize('sample_rate, channels, seconds', [(16000, 1, 1.5), (44100, 2, 0.25), (48000, 1, 0)])
+def test_wav_duration(sample_rate, channels, seconds):
+    data = b'\0' * int(sample_rate * channels * 2 * seconds)
+    wav = PCMAudio(data, sample_rate, channels).to_wav()
+    assert get_duration(wav, 'wav') == pytest.approx(seconds)
+
+
+def test_wav_duration_skips_extra_chunks():
+    fmt = struct.pack('<HHIIHH', 1, 1, 8000, 16000, 2, 16)
+    # Чанк нечётной длины выравнивается до чётной границы
+    wav = wav_with_chunks([(b'fmt ', fmt), (b'LIST', b'odd'), (b'data', b'\0' * 32000)])
+    assert get_duration(wav, 'wav') == pytest.approx(2.0)
+
+
+def test_opus_duration_accounts_for_pre_skip():
+    head = b'OpusHead' + bytes([1, 1]) + struct.pack('<HIhB', 312, 48000, 0, 0)
+    pages = [ogg_page(0, head, header_type=2), ogg_page(0, b'OpusTags')]
+    pages += [ogg_page(960 * (n + 1), b'\0' * 100, sequence=n + 2) for n in range(200)]
+    granule = 48000 * 3 + 312
+    pages.append(ogg_page(granule, b'\0' * 10, sequence=202, header_type=4))
+    data = b''.join(pages)
+    assert get_duration(data, 'ogg') == pytest.approx(3.0)
+    assert get_duration(data, 'opus') == pytest.approx(3.0)
+
+
+def test_vorbis_duration():
+    head = b'\x01vorbis' + struct.pack('<IBI', 0, 2, 22050)
+    data = ogg_page(0, head, header_type=2) + ogg_page(22050 * 4, b'\0' * 50, sequence=1, header_type=4)
+    assert get_duration(data, 'oga') == pytest.approx(4.0)
+
+
+def test_mp3_duration_mpeg1():
+    data = b''.join(mp3_frame(padding=n % 2) for n in range(100))
+    assert get_duration(data, 'mp3') == pytest.approx(100 * 1152 / 44100)
+
+
+def test_mp3_duration_mpeg2():
+    data = b''.join(mp3_frame(bitrate_index=8, rate_index=0, version=2) for _ in range(50))
+    assert get_duration(data, 'mp3') == pytest.approx(50 * 576 / 22050)
+
+
+def test_mp3_skips_id3_xing_and_trailing_tag():
+    tag_body = b'\0' * 200
+    size = len(tag_body)
+    id3 = b'ID3' + bytes([4, 0, 0]) + bytes([size >> 21 & 0x7F, size >> 14 & 0x7F, size >> 7 & 0x7F, size & 0x7F])
+    xing = mp3_frame(payload=b'\0' * 32 + b'Xing')
+    id3v1 = b'TAG' + b'\0' * 125
+    data = id3 + tag_body + xing + b''.join(mp3_frame() for _ in range(10)) + id3v1
+    assert get_duration(data, 'mp3') == pytest.approx(10 * 1152 / 44100)
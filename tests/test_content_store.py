@@ -0,0 +1,92 @@
+import json
+import os
+import time
+
+from content_store import ContentWatcher, load_catalog, load_intents
+from intents_config import PerfumeBotConfig
+
+INTENTS = {
+    'greeting': {'examples': ['привет'], 'responses': ['Здравствуйте!']},
+    'goodbye': {'examples': ['пока'], 'responses': ['До свидания!']},
+}
+
+
+def write(path, text):
+    # Сдвиг mtime: две записи подряд могут попасть в один квант времени файловой системы
+    path.write_text(text, encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def watch_intents(tmp_path):
+    path = tmp_path / 'intents.json'
+    path.write_text(json.dumps(INTENTS), encoding='utf-8')
+    config = PerfumeBotConfig(str(path))
+    changes = []
+    config.subscribe(changes.append)
+    watcher = ContentWatcher(poll_interval=0.01)
+    watcher.watch('intents', config.path, load_intents, config.replace_intents)
+    return path, config, changes, watcher
+
+
+def test_unchanged_file_is_not_reloaded(tmp_path):
+    _, _, changes, watcher = watch_intents(tmp_path)
+    assert watcher.check() == {}
+    assert changes == []
+
+
+def test_changed_intents_are_applied_in_one_notification(tmp_path):
+    path, config, changes, watcher = watch_intents(tmp_path)
+    intents = {'greeting': INTENTS['greeting'],
+               'price': {'examples': ['сколько стоит'], 'responses': ['Цены в каталоге.']}}
+    write(path, json.dumps(intents))
+
+    assert watcher.check() == {'intents': 2}
+    assert config.intents == intents
+    assert changes == [{'goodbye': None, 'price': intents['price']}]
+    assert watcher.get_stats() == {'intents': {'version': 2, 'errors': 0}}
+
+
+def test_broken_file_keeps_previous_version(tmp_path):
+    path, config, changes, watcher = watch_intents(tmp_path)
+    write(path, '{"greeting": ')
+    assert watcher.check() == {}
+    assert config.intents == INTENTS and changes == []
+    # Тот же битый файл повторно не разбирается
+    assert watcher.check() == {}
+    assert watcher.get_stats()['intents'] == {'version': 1, 'errors': 1}
+
+    write(path, json.dumps({'greeting': INTENTS['greeting']}))
+    assert watcher.check() == {'intents': 2}
+    assert list(config.intents) == ['greeting']
+
+
+def test_invalid_structure_is_rejected(tmp_path):
+    path, config, _, watcher = watch_intents(tmp_path)
+    write(path, json.dumps({'greeting': ['привет']}))
+    assert watcher.check() == {}
+    assert config.intents == INTENTS
+
+
+def test_background_thread_picks_up_changes(tmp_path):
+    path, config, _, watcher = watch_intents(tmp_path)
+    watcher.start()
+    try:
+        write(path, json.dumps({'goodbye': INTENTS['goodbye']}))
+        deadline = time.monotonic() + 5
+        while 'greeting' in config.intents and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        watcher.stop()
+    assert list(config.intents) == ['goodbye']
+
+
+def test_catalog_module_becomes_snapshot(tmp_path):
+    path = tmp_path / 'catalog.py'
+    path.write_text(
+        "PERFUMES_CATALOG = {'test': {'name': 'Test', 'brand': 'Brand', 'price': 100}}\n"
+        "RECOMMENDATIONS = {'by_gender': {}, 'by_season': {}, 'by_occasion': {}, 'by_price': {}}\n"
+        "PROMOTIONS = {}\n", encoding='utf-8')
+    snapshot = load_catalog(str(path), version=7)
+    assert snapshot.version == 7
+    assert list(snapshot.catalog) == ['test'] and snapshot.render_cache == {}
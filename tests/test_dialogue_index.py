@@ -0,0 +1,83 @@
+import os
+
+from dialogue_index import DialogueIndex, parse_dialogues
+
+DIALOGUES = """Q: Привет
+A: Здравствуйте!
+
+Q: Какие у вас есть духи?
+А: Большой выбор ароматов.
+
+Q: Вы работаете в выходные?
+A: Да, без выходных.
+
+A: Ответ без вопроса пропускается
+"""
+
+
+def make_index(tmp_path, content=DIALOGUES, **kwargs):
+    path = tmp_path / 'dialogues.txt'
+    path.write_text(content, encoding='utf-8')
+    return DialogueIndex(str(path), ngram_size=3, top_k=5, max_postings=1000, check_interval=0, **kwargs)
+
+
+def rewrite(index, content):
+    # Новое время изменения: в пределах одной секунды mtime мог бы совпасть со старым
+    with open(index.path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    stat = os.stat(index.path)
+    os.utime(index.path, (stat.st_atime, stat.st_mtime + 10))
+
+
+def test_parse_accepts_cyrillic_answer_marker():
+    assert parse_dialogues(DIALOGUES) == [
+        ('Привет', 'Здравствуйте!'),
+        ('Какие у вас есть духи?', 'Большой выбор ароматов.'),
+        ('Вы работаете в выходные?', 'Да, без выходных.'),
+    ]
+
+
+def test_exact_match_ignores_case_and_punctuation(tmp_path):
+    index = make_index(tmp_path)
+    assert len(index) == 3
+    assert index.search('  ПРИВЕТ!!! ') == 'Здравствуйте!'
+
+
+def test_substring_and_fuzzy_matches(tmp_path):
+    index = make_index(tmp_path)
+    assert index.search('скажите, какие у вас есть духи') == 'Большой выбор ароматов.'
+    assert index.search('вы работаете в выходный') == 'Да, без выходных.'
+    assert index.search('совершенно посторонний запрос') is None
+    assert index.search('?!') is None
+
+
+def test_candidates_are_limited_to_top_k(tmp_path):
+    content = ''.join(f'Q: аромат номер {i}\nA: ответ {i}\n\n' for i in range(50))
+    index = make_index(tmp_path, content)
+    index.top_k = 3
+    candidates = index._candidates(index._data, 'аромат номер 42')
+    assert len(candidates) == 3 and 42 in candidates
+    assert index.search('аромат номер 42') == 'ответ 42'
+
+
+def test_changed_file_is_reloaded_on_search(tmp_path):
+    index = make_index(tmp_path)
+    rewrite(index, 'Q: Где магазин?\nA: В центре.\n')
+    assert index.search('где магазин') == 'В центре.'
+    assert len(index) == 1
+    assert not index.reload()
+
+
+def test_external_watcher_disables_own_checks(tmp_path):
+    index = make_index(tmp_path)
+    index.watch = False
+    rewrite(index, 'Q: Где магазин?\nA: В центре.\n')
+    assert index.search('привет') == 'Здравствуйте!'
+    assert index.reload()
+    assert index.search('привет') is None
+
+
+def test_missing_file_gives_empty_index(tmp_path):
+    index = DialogueIndex(str(tmp_path / 'absent.txt'))
+    assert len(index) == 0
+    assert index.search('привет') is None
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from intent_batcher import IntentMicroBatcher
+
+
+class FakeClassifier:
+    """Возвращает намерение по тексту; первый вызов можно задержать, чтобы накопилась очередь"""
+
+    def __init__(self, hold_first: bool = False):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold_first:
+            self.release.set()
+
+    def predict_batch(self, texts):
+        self.batches.append(list(texts))
+        self.started.set()
+        self.release.wait(5)
+        if 'сбой' in texts:
+            raise ValueError('model failed')
+        return [(f'intent_{text}', len(text) / 10) for text in texts]
+
+
+def test_requests_queued_during_a_batch_share_the_next_one():
+    classifier = FakeClassifier(hold_first=True)
+    batcher = IntentMicroBatcher(classifier, max_batch_size=64, max_delay_ms=50)
+    first = batcher.submit('a')
+    assert classifier.started.wait(5)
+    waiting = {text: batcher.submit(text) for text in ('bb', 'ccc', 'dddd')}
+    classifier.release.set()
+
+    assert first.result(5) == ('intent_a', 0.1)
+    # Каждый запрос получает свой результат, а не соседний по пачке
+    for text, future in waiting.items():
+        assert future.result(5) == (f'intent_{text}', len(text) / 10)
+    assert classifier.batches == [['a'], ['bb', 'ccc', 'dddd']]
+    assert batcher.batches == 2 and batcher.requests == 4
+
+
+def test_batch_size_is_capped():
+    classifier = FakeClassifier(hold_first=True)
+    batcher = IntentMicroBatcher(classifier, max_batch_size=2, max_delay_ms=50)
+    batcher.submit('first')
+    assert classifier.started.wait(5)
+    futures = [batcher.submit(str(i)) for i in range(5)]
+    classifier.release.set()
+
+    assert [future.result(5)[0] for future in futures] == [f'intent_{i}' for i in range(5)]
+    assert [len(batch) for batch in classifier.batches] == [1, 2, 2, 1]
+
+
+def test_model_error_fails_only_its_batch():
+    classifier = FakeClassifier(hold_first=True)
+    batcher = IntentMicroBatcher(classifier, max_batch_size=64, max_delay_ms=50)
+    batcher.submit('first')
+    assert classifier.started.wait(5)
+    failed = [batcher.submit('сбой'), batcher.submit('ok')]
+    classifier.release.set()
+
+    for future in failed:
+        with pytest.raises(ValueError):
+            future.result(5)
+    # Поток пачек переживает ошибку модели
+    assert batcher.predict('after') == ('intent_after', 0.5)
+
+
+def test_single_request_is_answered_alone():
+    batcher = IntentMicroBatcher(FakeClassifier(), max_batch_size=64, max_delay_ms=1)
+    assert batcher.predict('hi') == ('intent_hi', 0.2)
+    assert batcher.batches == 1
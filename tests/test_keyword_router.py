@@ -0,0 +1,95 @@
+import pytest
+
+from aho_corasick import AhoCorasick
+from keyword_router import KeywordRouter, KeywordRule, load_keyword_rules
+
+
+def make_router(rules, catalog=None):
+    return KeywordRouter([KeywordRule(rule_id, data) for rule_id, data in rules.items()], catalog)
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick()
+    for word in ('he', 'she', 'his', 'hers'):
+        matcher.add(word, word)
+    matches = list(matcher.iter_matches('ushers'))
+    assert matches == [(3, 'she'), (3, 'he'), (5, 'hers')]
+
+
+def test_aho_corasick_keeps_every_value_of_a_pattern():
+    matcher = AhoCorasick()
+    matcher.add('духи', 1)
+    matcher.add('духи', 2)
+    matcher.add('', 3)
+    assert matcher.pattern_count == 2
+    assert matcher.find_values('купить духи') == {1, 2}
+
+
+def test_higher_priority_wins_over_more_hits():
+    router = make_router({
+        'prices': {'priority': 10, 'patterns': ['цена', 'стоит', 'сколько'], 'responses': ['...']},
+        'purchase': {'priority': 60, 'patterns': ['купить'], 'responses': ['...']}
+    })
+    assert router.route('сколько стоит, цена, хочу купить', 'reply').rule_id == 'purchase'
+
+
+def test_equal_priority_resolved_by_distinct_hits():
+    router = make_router({
+        'male': {'priority': 20, 'patterns': ['мужчин', 'мужской'], 'responses': ['...']},
+        'female': {'priority': 20, 'patterns': ['женщин', 'женский'], 'responses': ['...']}
+    })
+    assert router.route('мужской аромат для мужчины', 'reply').rule_id == 'male'
+    # Повтор одной фразы не добавляет совпадений
+    assert router.route('женщине, женщине и мужской', 'reply') is None
+
+
+def test_exact_tie_is_ambiguous():
+    router = make_router({
+        'first': {'priority': 30, 'patterns': ['аромат'], 'responses': ['...']},
+        'second': {'priority': 30, 'patterns': ['вечер'], 'responses': ['...']}
+    })
+    match = router.match('аромат на вечер')
+    assert sorted(match.rule_ids()) == ['first', 'second']
+    assert match.best('reply') is None
+
+
+def test_groups_are_resolved_independently():
+    router = make_router({
+        'catalog': {'priority': 30, 'patterns': ['каталог'], 'responses': ['...']},
+        'brand_chanel': {'group': 'brand', 'priority': 50, 'patterns': ['шанель'], 'intent': 'chanel'}
+    })
+    match = router.match('каталог шанель')
+    assert match.best('reply').rule_id == 'catalog'
+    assert match.best('brand').rule_id == 'brand_chanel'
+    assert match.best('missing') is None
+
+
+def test_catalog_names_extend_brand_patterns():
+    catalog = {'1': {'name': 'Coco Mademoiselle', 'brand': 'Chanel'},
+               '2': {'name': 'Sauvage', 'brand': 'Dior'}}
+    router = make_router({
+        'brand_chanel': {'group': 'brand', 'patterns': ['chanel'], 'catalog_brand': 'Chanel'},
+        'brand_dior': {'group': 'brand', 'patterns': ['dior'], 'catalog_brand': 'Dior'}
+    }, catalog)
+    assert router.route('хочу coco mademoiselle', 'brand').rule_id == 'brand_chanel'
+    assert router.route('sauvage', 'brand').rule_id == 'brand_dior'
+    assert router.get_stats() == {'rules': 2, 'patterns': 4}
+
+
+def test_match_survives_router_replacement():
+    old = make_router({'catalog': {'patterns': ['каталог'], 'responses': ['...']}})
+    match = old.match('покажи каталог')
+    make_router({'other': {'patterns': ['другое'], 'responses': ['...']}})
+    assert match.best('reply').rule_id == 'catalog'
+
+
+def test_shipped_rules_load():
+    rules = load_keyword_rules('keyword_rules.json')
+    assert rules and all(rule.patterns or rule.catalog_brand for rule in rules)
+
+
+def test_reply_rule_without_response_is_rejected(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text('{"broken": {"patterns": ["x"]}}', encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_keyword_rules(str(path))
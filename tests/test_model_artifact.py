@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import MultinomialNB
+
+from config import ML_CONFIG
+from model_artifact import ArtifactError, CompiledIntentModel, export_model
+
+UNSEEN = ['посоветуй что-нибудь свежее на лето', 'сколько стоит доставка в питер',
+          'совершенно незнакомые слова', '', 'Привет! Как дела?']
+
+
+@pytest.fixture(scope='module')
+def training_data():
+    with open('intents.json', 'r', encoding='utf-8') as f:
+        intents = json.load(f)
+    texts = [example.lower() for data in intents.values() for example in data['examples']]
+    labels = [intent for intent, data in intents.items() for _ in data['examples']]
+    return texts, labels
+
+
+@pytest.mark.parametrize('classifier', [
+    MultinomialNB(),
+    LogisticRegression(max_iter=1000)
+], ids=['naive_bayes', 'logistic_regression'])
+def test_predict_proba_matches_sklearn(tmp_path, training_data, classifier):
+    texts, labels = training_data
+    vectorizer = TfidfVectorizer(**ML_CONFIG['vectorizer_params'])
+    classifier.fit(vectorizer.fit_transform(texts), labels)
+    path = str(tmp_path / 'intent_model.bin')
+    export_model(vectorizer, classifier, path)
+
+    compiled = CompiledIntentModel(path)
+    queries = texts + UNSEEN
+    assert list(compiled.classes_) == list(classifier.classes_)
+    expected_X = vectorizer.transform(queries)
+    compiled_X = compiled.transform(queries)
+    # Столбцы артефакта упорядочены по алфавиту терминов
+    columns = [vectorizer.vocabulary_[term] for term in compiled.vocabulary]
+    assert np.allclose(expected_X[:, columns].toarray(), compiled_X.toarray())
+    assert np.allclose(compiled.predict_proba(compiled_X), classifier.predict_proba(expected_X), atol=1e-10)
+
+
+def test_corrupted_artifact_is_rejected(tmp_path, training_data):
+    texts, labels = training_data
+    vectorizer = TfidfVectorizer(**ML_CONFIG['vectorizer_params'])
+    classifier = MultinomialNB().fit(vectorizer.fit_transform(texts), labels)
+    path = tmp_path / 'intent_model.bin'
+    export_model(vectorizer, classifier, str(path))
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(ArtifactError):
+        CompiledIntentModel(str(path))
+
+
+def test_other_config_is_rejected(tmp_path, training_data):
+    texts, labels = training_data
+    vectorizer = TfidfVectorizer(**ML_CONFIG['vectorizer_params'])
+    classifier = MultinomialNB().fit(vectorizer.fit_transform(texts), labels)
+    path = str(tmp_path / 'intent_model.bin')
+    export_model(vectorizer, classifier, path)
+    with pytest.raises(ArtifactError):
+        CompiledIntentModel(path, expected_config_hash='0' * 64)
@@ -0,0 +1,55 @@
+import copy
+
+from perfume_service import CatalogSnapshot, PerfumeService
+from perfumes_data import PERFUMES_CATALOG, PROMOTIONS, RECOMMENDATIONS
+
+
+def make_snapshot(version=1, **renames):
+    catalog = copy.deepcopy(PERFUMES_CATALOG)
+    for perfume_id, name in renames.items():
+        catalog[perfume_id]['name'] = name
+    return CatalogSnapshot(catalog, RECOMMENDATIONS, PROMOTIONS, version)
+
+
+def test_static_views_are_rendered_at_startup():
+    service = PerfumeService(make_snapshot())
+    misses = service.cache_misses
+    assert misses == len(service.snapshot.render_cache)
+    catalog = service.show_catalog()
+    assert service.show_catalog() is catalog
+    service.show_prices()
+    service.show_brand('Chanel')
+    service.recommend_by_gender('женский')
+    assert service.cache_misses == misses and service.cache_hits == 5
+
+
+def test_dynamic_response_is_rendered_once():
+    service = PerfumeService(make_snapshot())
+    misses = service.cache_misses
+    first = service.process_purchase_intent('хочу купить chanel no 5')
+    assert 'Chanel No. 5' in first
+    assert service.process_purchase_intent('беру chanel no 5') is first
+    assert service.cache_misses == misses + 1
+
+
+def test_loaded_snapshot_replaces_rendered_views():
+    service = PerfumeService(make_snapshot())
+    old = service.snapshot
+    old_catalog = service.show_catalog()
+
+    service.load_snapshot(make_snapshot(2, chanel_no5='Chanel Test Edition'))
+    catalog = service.show_catalog()
+    assert 'Chanel Test Edition' in catalog and 'Chanel Test Edition' not in old_catalog
+    assert service.get_cache_stats()['version'] == 2
+    # Новый снимок прогрет до подмены, а старый не изменился
+    assert service.snapshot.render_cache[('prices',)]
+    assert old.render_cache[('catalog',)] is old_catalog
+
+
+def test_invalidate_cache_picks_up_in_place_changes():
+    service = PerfumeService(make_snapshot())
+    service.catalog['chanel_no5']['name'] = 'Chanel Renamed'
+    assert 'Chanel Renamed' not in service.show_prices()
+    service.invalidate_cache()
+    assert 'Chanel Renamed' in service.show_prices()
+    assert service.snapshot.version == 2
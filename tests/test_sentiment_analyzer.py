@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from config import SENTIMENT_CONFIG
+from sentiment_analyzer import SentimentAnalyzer, SentimentLexicon
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return SentimentAnalyzer()
+
+
+def random_lemma_lists(analyzer, count=2000, seed=0):
+    rnd = random.Random(seed)
+    vocabulary = list(analyzer.lexicon.words) + list(analyzer.negator_set) + ['аромат', 'духи', 'вечер']
+    return [[rnd.choice(vocabulary) for _ in range(rnd.randint(0, 10))] for _ in range(count)] + [[]]
+
+
+def test_batch_matches_single_message(analyzer):
+    lemma_lists = random_lemma_lists(analyzer)
+    for lemmas, batch in zip(lemma_lists, analyzer.analyze_batch(lemma_lists)):
+        single = analyzer.analyze_sentiment_from_lemmas(lemmas)
+        assert batch['score'] == pytest.approx(single['score'])
+        assert batch['confidence'] == pytest.approx(single['confidence'])
+        assert batch['label'] == single['label']
+
+
+def test_batch_matches_single_with_other_window():
+    analyzer = SentimentAnalyzer(config=dict(SENTIMENT_CONFIG, negation_window=1))
+    lemma_lists = random_lemma_lists(analyzer, seed=1)
+    for lemmas, batch in zip(lemma_lists, analyzer.analyze_batch(lemma_lists)):
+        assert batch['score'] == pytest.approx(analyzer.analyze_sentiment_from_lemmas(lemmas)['score'])
+
+
+def test_negation_flips_words_inside_window(analyzer):
+    liked = analyzer.lexicon.get('нравиться')
+    assert analyzer.analyze_sentiment_from_lemmas(['нравиться'])['score'] == pytest.approx(liked)
+    assert analyzer.analyze_sentiment_from_lemmas(['не', 'нравиться'])['score'] == pytest.approx(-liked)
+    far = ['не', 'a', 'b', 'c', 'нравиться']
+    assert analyzer.analyze_sentiment_from_lemmas(far)['score'] == pytest.approx(liked)
+
+
+def test_negators_are_not_scored():
+    # Даже если отрицание попало в лексикон, само по себе оно тональность не задаёт
+    analyzer = SentimentAnalyzer(lexicon=SentimentLexicon({'не': -0.5, 'нет': -0.3, 'хороший': 0.7}))
+    for lemmas in (['не'], ['нет', 'аромат']):
+        assert analyzer.analyze_sentiment_from_lemmas(lemmas)['score'] == 0.0
+        assert analyzer.analyze_batch([lemmas])[0]['score'] == 0.0
+    single = analyzer.analyze_sentiment_from_lemmas(['не', 'хороший'])
+    assert single['sentiment_words'] == [('хороший', pytest.approx(-0.7))]
+    assert analyzer.analyze_batch([['не', 'хороший']])[0]['score'] == pytest.approx(-0.7)
+
+
+def test_shipped_lexicon_has_no_negators(analyzer):
+    assert not any(negator in analyzer.lexicon for negator in analyzer.negator_set)
@@ -0,0 +1,70 @@
+import time
+
+from session_store import SessionStore
+from state_store import MemoryStateStore
+
+
+def make_sessions(tmp_path, max_sessions=3, ttl_seconds=3600):
+    return SessionStore(max_sessions=max_sessions, ttl_seconds=ttl_seconds,
+                        snapshot_path=str(tmp_path / 'sessions.json'), state_store=MemoryStateStore())
+
+
+def test_least_recently_used_session_is_evicted(tmp_path):
+    sessions = make_sessions(tmp_path)
+    for user_id in ('a', 'b', 'c'):
+        sessions.get(user_id)
+    # Обращение к «a» делает самой старой сессию «b»
+    sessions.get('a')
+    sessions.get('d')
+    assert len(sessions) == 3 and sessions.evicted == 1
+    assert sessions.peek('b') is None
+    assert all(sessions.peek(user_id) for user_id in ('a', 'c', 'd'))
+
+
+def test_evicted_session_is_restored_from_state_store(tmp_path):
+    sessions = make_sessions(tmp_path, max_sessions=1)
+    session = sessions.get('a')
+    session.conversation_stage = 'offer'
+    session.user_preferences['brand'] = 'dior'
+    sessions.save(session)
+    sessions.get('b')
+    assert sessions.peek('a') is None
+
+    restored = sessions.get('a')
+    assert restored is not session
+    assert restored.conversation_stage == 'offer' and restored.user_preferences == {'brand': 'dior'}
+    assert sessions.loaded == 1
+
+
+def test_expired_sessions_are_dropped(tmp_path):
+    sessions = make_sessions(tmp_path, ttl_seconds=60)
+    stale = sessions.get('old')
+    stale.conversation_stage = 'offer'
+    stale.last_active = time.time() - 120
+    sessions.save(stale)
+
+    sessions.get('new')
+    assert sessions.peek('old') is None and sessions.evicted == 1
+    # Устаревшее состояние в хранилище не восстанавливается: диалог начинается заново
+    assert sessions.get('old').conversation_stage == 'casual'
+    assert sessions.loaded == 0
+
+
+def test_snapshot_skips_expired_and_keeps_newest(tmp_path):
+    sessions = make_sessions(tmp_path, max_sessions=5, ttl_seconds=60)
+    for user_id in ('a', 'b', 'c'):
+        sessions.get(user_id).message_count = 1
+    sessions.peek('a').last_active = time.time() - 120
+    assert sessions.save_snapshot()
+
+    restored = make_sessions(tmp_path, max_sessions=1, ttl_seconds=60)
+    assert restored.load_snapshot() == 1
+    assert restored.peek('a') is None and restored.peek('b') is None
+    assert restored.peek('c').message_count == 1
+
+
+def test_missing_user_id_shares_default_session(tmp_path):
+    sessions = make_sessions(tmp_path)
+    assert sessions.get(None) is sessions.get(None)
+    sessions.remove(None)
+    assert len(sessions) == 0
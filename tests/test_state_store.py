@@ -0,0 +1,108 @@
+import time
+
+from session_store import SessionStore
+from state_store import MemoryStateStore, SQLiteStateStore, create_state_store
+
+
+def make_store(tmp_path, flush_interval=60.0):
+    # Длинный интервал: сброс в тестах только явный, фоновый поток не вмешивается
+    return SQLiteStateStore(str(tmp_path / 'sessions.db'), flush_interval=flush_interval)
+
+
+def state(user_id, stage='casual', last_active=None):
+    return {'user_id': user_id, 'conversation_stage': stage,
+            'last_active': time.time() if last_active is None else last_active}
+
+
+def test_pending_state_is_readable_before_flush(tmp_path):
+    store = make_store(tmp_path)
+    store.save('u1', state('u1', 'offer'))
+    assert store.load('u1')['conversation_stage'] == 'offer'
+    store.delete('u1')
+    assert store.load('u1') is None
+    store.close()
+
+
+def test_flush_coalesces_saves_of_one_session(tmp_path):
+    store = make_store(tmp_path)
+    for stage in ('casual', 'interest', 'offer'):
+        store.save('u1', state('u1', stage))
+    store.save('u2', state('u2'))
+    assert store.flush() == 2
+    assert store.flush() == 0
+    stats = store.get_stats()
+    assert stats['saves'] == 4 and stats['written'] == 2 and stats['pending'] == 0
+    store.close()
+
+
+def test_close_flushes_and_reopen_restores(tmp_path):
+    store = make_store(tmp_path)
+    store.save('u1', state('u1', 'offer'))
+    store.save('u2', state('u2'))
+    store.flush()
+    store.delete('u2')
+    store.save('u3', {**state('u3'), 'user_preferences': {'пол': 'женский'}})
+    store.close()
+    # Повторное закрытие ничего не ломает
+    store.close()
+
+    reopened = make_store(tmp_path)
+    assert reopened.load('u1')['conversation_stage'] == 'offer'
+    assert reopened.load('u2') is None
+    assert reopened.load('u3')['user_preferences'] == {'пол': 'женский'}
+    reopened.close()
+
+
+def test_background_thread_flushes(tmp_path):
+    store = make_store(tmp_path, flush_interval=0.01)
+    store.save('u1', state('u1'))
+    deadline = time.time() + 2
+    while store.get_stats()['written'] < 1 and time.time() < deadline:
+        time.sleep(0.01)
+    assert store.get_stats()['written'] == 1
+    store.close()
+
+
+def test_purge_removes_inactive_sessions(tmp_path):
+    store = make_store(tmp_path)
+    store.save('old', state('old', last_active=time.time() - 3600))
+    store.save('new', state('new'))
+    store.flush()
+    assert store.purge(60) == 1
+    assert store.load('old') is None and store.load('new') is not None
+    store.close()
+
+
+def test_session_store_round_trip(tmp_path):
+    sessions = SessionStore(max_sessions=10, ttl_seconds=3600, state_store=make_store(tmp_path))
+    session = sessions.get('42')
+    session.conversation_stage = 'offer'
+    session.casual_topics_discussed.add('погода')
+    sessions.save(session)
+    sessions.close()
+
+    restored = SessionStore(max_sessions=10, ttl_seconds=3600, state_store=make_store(tmp_path))
+    session = restored.get('42')
+    assert session.conversation_stage == 'offer'
+    assert session.casual_topics_discussed == {'погода'}
+    assert restored.loaded == 1
+    restored.close()
+
+
+def test_memory_store_copies_state():
+    store = MemoryStateStore(max_entries=2)
+    data = state('u1')
+    store.save('u1', data)
+    data['conversation_stage'] = 'changed'
+    assert store.load('u1')['conversation_stage'] == 'casual'
+    store.save('u2', state('u2'))
+    store.save('u3', state('u3'))
+    assert store.load('u1') is None
+
+
+def test_create_state_store_passes_path(tmp_path):
+    path = str(tmp_path / 'worker.db')
+    store = create_state_store('sqlite', path)
+    assert isinstance(store, SQLiteStateStore) and store.path == path
+    store.close()
+    assert isinstance(create_state_store('memory', path), MemoryStateStore)
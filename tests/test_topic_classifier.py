@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+import pytest
+
+from topic_classifier import TopicClassifier
+
+
+class _Message:
+    """Заменяет AnalyzedMessage: классификатору нужны только готовые леммы"""
+
+    def __init__(self, lemmas):
+        self.lemmas = lemmas
+
+
+@pytest.fixture(scope='module')
+def classifier():
+    return TopicClassifier()
+
+
+@pytest.fixture(scope='module')
+def lemma_lists(classifier):
+    rnd = random.Random(0)
+    keywords = [keyword for words in classifier.topic_keywords.values() for keyword in words]
+    # Точные ключевые слова, их части и слова с ключевым внутри, плюс посторонние леммы
+    vocabulary = keywords + [keyword[:3] for keyword in keywords] + [keyword + 'ный' for keyword in keywords]
+    vocabulary += ['аромат', 'привет', 'сегодня', 'ну', 'x']
+    lists = [[rnd.choice(vocabulary) for _ in range(rnd.randint(0, 8))] for _ in range(500)]
+    return lists + [[], ['несуществующее']]
+
+
+def reference_scores(classifier, lemmas):
+    """Баллы тем по определению: точное совпадение — 1, вхождение одного в другое — 0.5"""
+    scores = np.zeros(len(classifier.topics))
+    for lemma in lemmas:
+        for topic_id, topic in enumerate(classifier.topics):
+            for keyword in classifier.topic_keywords[topic]:
+                if lemma == keyword:
+                    scores[topic_id] += 1
+                elif keyword in lemma or lemma in keyword:
+                    scores[topic_id] += 0.5
+    return scores / len(lemmas) if lemmas else scores
+
+
+def test_batch_matches_single_message(classifier, lemma_lists):
+    batch = classifier.score_batch(lemma_lists)
+    for row, lemmas in zip(batch, lemma_lists):
+        assert np.allclose(row, classifier.score_lemmas(lemmas))
+    singles = [classifier.get_main_topic_from_lemmas(lemmas) for lemmas in lemma_lists]
+    assert classifier.get_main_topics_batch(lemma_lists) == pytest.approx(singles)
+
+
+def test_scores_match_definition(classifier, lemma_lists):
+    for lemmas in lemma_lists[:100]:
+        assert np.allclose(classifier.score_lemmas(lemmas), reference_scores(classifier, lemmas))
+
+
+def test_classify_topic_agrees_with_scores(classifier, lemma_lists):
+    for lemmas in lemma_lists[:100]:
+        topics = classifier.classify_topic(_Message(lemmas))
+        scores = classifier.score_lemmas(lemmas)
+        expected = {topic: scores[topic_id] for topic_id, topic in enumerate(classifier.topics)
+                    if scores[topic_id] > 0}
+        assert {topic: data['score'] for topic, data in topics.items()} == pytest.approx(expected)
+        assert classifier.get_main_topic(_Message(lemmas)) == pytest.approx(
+            classifier.get_main_topic_from_lemmas(lemmas))
+
+
+def test_empty_input(classifier):
+    assert classifier.get_main_topics_batch([]) == []
+    assert classifier.get_main_topics_batch([[], []]) == [(None, 0.0), (None, 0.0)]
+    assert classifier.get_main_topic_from_lemmas([]) == (None, 0.0)
@@ -0,0 +1,163 @@
+import asyncio
+
+from update_queue import DONE, FAILED, PENDING, PoisonUpdate, UpdateConsumer, UpdateQueue
+
+
+def make_queue(tmp_path, max_attempts=3):
+    return UpdateQueue(str(tmp_path / 'updates.db'), max_attempts=max_attempts)
+
+
+def states(queue):
+    return dict(queue._conn.execute('SELECT update_id, state FROM updates').fetchall())
+
+
+def states_done(queue):
+    return [update_id for update_id, state in states(queue).items() if state == DONE]
+
+
+def test_duplicate_update_id_is_stored_once(tmp_path):
+    queue = make_queue(tmp_path)
+    assert queue.append_many([(1, b'a'), (2, b'b'), (1, b'a')]) == 2
+    assert not queue.append(2, b'other')
+    stats = queue.get_stats()
+    assert stats['pending'] == 2
+    assert stats['duplicates'] == 2
+    # Повтор не подменяет сохранённое обновление
+    assert [payload for _, _, payload in queue.claim(10)] == [b'a', b'b']
+
+
+def test_claim_respects_limit_and_cursor(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.append_many([(update_id, b'x') for update_id in range(10, 15)])
+    first = queue.claim(2)
+    assert [update_id for _, update_id, _ in first] == [10, 11]
+    rest = queue.claim(10, first[-1][0])
+    assert [update_id for _, update_id, _ in rest] == [12, 13, 14]
+
+
+def test_ack_and_fail_finish_updates(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.append_many([(1, b'a'), (2, b'b'), (3, b'c')])
+    queue.claim(10)
+    queue.ack([1])
+    queue.fail([2])
+    assert states(queue) == {1: DONE, 2: FAILED, 3: PENDING}
+    assert [update_id for _, update_id, _ in queue.claim(10)] == [3]
+
+
+def test_unacked_update_is_poisoned_after_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=2)
+    queue.append_many([(1, b'poison'), (2, b'ok')])
+    assert [update_id for _, update_id, _ in queue.claim(10)] == [1, 2]
+    queue.ack([2])
+    # Каждая выдача без подтверждения — как падение процесса посреди обработки
+    assert [update_id for _, update_id, _ in queue.claim(10)] == [1]
+    assert queue.claim(10) == []
+    assert states(queue) == {1: FAILED, 2: DONE}
+
+
+def test_pending_updates_survive_reopen(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.append_many([(1, b'a'), (2, b'b')])
+    queue.claim(10)
+    queue.ack([1])
+    queue.close()
+    reopened = make_queue(tmp_path)
+    assert [update_id for _, update_id, _ in reopened.claim(10)] == [2]
+
+
+def run_consumer(queue, handle, done, retry_delay=0.01, **kwargs):
+    async def main():
+        consumer = UpdateConsumer(queue, handle, poll_interval=0.01, retry_delay=retry_delay, **kwargs)
+        task = asyncio.create_task(consumer.run())
+        while not done():
+            await asyncio.sleep(0.01)
+        consumer.stop()
+        await task
+        consumer.shutdown()
+        return consumer.get_stats()
+
+    return asyncio.run(main())
+
+
+def test_consumer_retries_transient_failures(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=3)
+    queue.append_many([(1, b'ok'), (2, b'flaky'), (3, b'broken')])
+    handled = []
+
+    async def handle(payload: bytes):
+        handled.append(payload)
+        if payload == b'broken' or (payload == b'flaky' and handled.count(b'flaky') < 2):
+            raise RuntimeError('reply failed')
+
+    stats = run_consumer(queue, handle, lambda: handled.count(b'broken') == 3 and 2 in states_done(queue),
+                         concurrency=3)
+    assert handled.count(b'flaky') == 2 and handled.count(b'broken') == 3
+    assert stats['processed'] == 2 and stats['retries'] == 3 and stats['errors'] == 1
+    assert states(queue) == {1: DONE, 2: DONE, 3: FAILED}
+
+
+def test_consumer_fails_poison_update_without_retry(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.append_many([(1, b'{'), (2, b'ok')])
+    handled = []
+
+    async def handle(payload: bytes):
+        handled.append(payload)
+        if payload == b'{':
+            raise PoisonUpdate('bad json')
+
+    stats = run_consumer(queue, handle, lambda: len(handled) == 2, concurrency=2)
+    assert handled.count(b'{') == 1
+    assert stats['retries'] == 0 and stats['errors'] == 1
+    assert states(queue) == {1: FAILED, 2: DONE}
+
+
+def test_failed_update_stays_pending_on_stop(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=5)
+    queue.append(1, b'down')
+    handled = []
+
+    async def handle(payload: bytes):
+        handled.append(payload)
+        raise RuntimeError('network down')
+
+    # Остановка посреди паузы перед повтором: запись ждёт следующего запуска
+    run_consumer(queue, handle, lambda: len(handled) == 1, retry_delay=60)
+    assert states(queue) == {1: PENDING}
+    assert [update_id for _, update_id, _ in queue.claim(10)] == [1]
+
+
+def test_consumer_keeps_order_within_chat(tmp_path):
+    queue = make_queue(tmp_path)
+    # Два чата вперемешку: внутри чата порядок обязателен, между чатами допустим параллелизм
+    queue.append_many([(i, f'{i % 2}:{i}'.encode()) for i in range(1, 9)])
+    running = {}
+    peak = []
+    log = []
+
+    async def handle(payload: bytes):
+        chat, update_id = payload.decode().split(':')
+        assert not running.get(chat)
+        running[chat] = True
+        peak.append(sum(running.values()))
+        await asyncio.sleep(0.01)
+        log.append((chat, int(update_id)))
+        running[chat] = False
+
+    async def main():
+        consumer = UpdateConsumer(queue, handle, concurrency=8, poll_interval=0.01,
+                                  key=lambda payload: payload.split(b':')[0])
+        task = asyncio.create_task(consumer.run())
+        while len(log) < 8:
+            await asyncio.sleep(0.01)
+        consumer.stop()
+        await task
+        consumer.shutdown()
+        return consumer.get_stats()
+
+    stats = asyncio.run(main())
+    assert stats['errors'] == 0 and stats['chats'] == 0
+    for chat in ('0', '1'):
+        assert [i for c, i in log if c == chat] == sorted(i for c, i in log if c == chat)
+    assert max(peak) == 2
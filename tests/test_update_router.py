@@ -0,0 +1,55 @@
+import pytest
+
+from config import UPDATE_QUEUE_CONFIG
+from update_queue import chat_key, payload_chat_key
+from webhook_server import UpdateRouter, queue_path
+
+
+def message(update_id, chat_id, sender_id=None):
+    return {'update_id': update_id,
+            'message': {'message_id': 1, 'chat': {'id': chat_id, 'type': 'private'},
+                        'from': {'id': sender_id or chat_id}, 'text': 'привет'}}
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    monkeypatch.setitem(UPDATE_QUEUE_CONFIG, 'path', str(tmp_path / 'updates.db'))
+    router = UpdateRouter('123:abc', workers=3)
+    yield router
+    router._db.shutdown(wait=True)
+    for update_queue in router.queues:
+        update_queue.close()
+
+
+def test_chat_key_prefers_chat_then_sender():
+    assert chat_key(message(1, -100500, sender_id=42)) == -100500
+    callback = {'update_id': 2, 'callback_query': {'id': 'q', 'from': {'id': 42},
+                                                   'message': {'chat': {'id': 7}}}}
+    assert chat_key(callback) == 7
+    assert chat_key({'update_id': 3, 'inline_query': {'id': 'q', 'from': {'id': 42}, 'query': ''}}) == 42
+    assert chat_key({'update_id': 4, 'poll': {'id': 'p'}}) == 4
+
+
+def test_broken_payload_gets_shared_key():
+    assert payload_chat_key(b'{"update_id": 5, "edited_message": {"chat": {"id": 9}}}') == 9
+    assert payload_chat_key(b'not json') == payload_chat_key(b'[]') == 0
+
+
+def test_updates_of_one_chat_go_to_one_worker(router):
+    edited = {'update_id': 11, 'edited_message': message(0, 1001)['message']}
+    callback = {'update_id': 12, 'callback_query': {'id': 'q', 'from': {'id': 5},
+                                                    'message': {'chat': {'id': 1001}}}}
+    workers = {router.worker_for(update) for update in (message(10, 1001), edited, callback)}
+    assert workers == {1001 % 3}
+
+
+def test_chats_are_spread_over_workers(router):
+    workers = [router.worker_for(message(i, chat_id)) for i, chat_id in enumerate(range(-6, 6))]
+    assert all(0 <= worker < 3 for worker in workers)
+    assert sorted(workers.count(index) for index in range(3)) == [4, 4, 4]
+
+
+def test_each_worker_has_its_own_journal(router, tmp_path):
+    assert [update_queue.path for update_queue in router.queues] == [
+        str(tmp_path / f'updates.{index}.db') for index in range(3)]
+    assert queue_path(2) == str(tmp_path / 'updates.2.db')
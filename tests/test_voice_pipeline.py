@@ -0,0 +1,150 @@
+import asyncio
+import threading
+
+import pytest
+
+from voice_pipeline import VoicePipeline, _Stage
+
+CONFIG = {'max_in_flight': 4, 'stage_queue_size': 4, 'decode_workers': 1, 'asr_workers': 1,
+          'nlp_workers': 1, 'tts_workers': 1, 'job_timeout': 5.0}
+
+
+class FakeVoiceProcessor:
+    ASR_UNAVAILABLE = 'asr unavailable'
+
+    def __init__(self):
+        self.asr_available = True
+        self.tts_release = threading.Event()
+        self.tts_release.set()
+
+    def decode(self, data, input_format):
+        return data.decode(), "success"
+
+    def recognize_pcm(self, pcm):
+        return pcm, "success"
+
+    def text_to_speech(self, text):
+        self.tts_release.wait(5)
+        return b'voice', "success"
+
+
+class FakeExecutor:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    async def process_message(self, text, user_id=None):
+        await asyncio.sleep(self.delay)
+        return f'ответ: {text}'
+
+
+def run_job(pipeline, audio=b'hello', on_reply=None, downloads=None):
+    async def download():
+        if downloads is not None:
+            downloads.append(audio)
+        return audio
+
+    async def reply(job):
+        pass
+
+    async def main():
+        try:
+            return await pipeline.process(download, 'u1', on_reply or reply)
+        finally:
+            await pipeline.stop()
+
+    return asyncio.run(main())
+
+
+def test_text_reply_is_sent_before_voice_is_ready():
+    processor = FakeVoiceProcessor()
+    processor.tts_release.clear()
+    pipeline = VoicePipeline(FakeExecutor(), processor, CONFIG)
+    replies = []
+
+    async def on_reply(job):
+        replies.append((job.response, job.voice))
+        processor.tts_release.set()
+
+    job = run_job(pipeline, on_reply=on_reply)
+    assert replies == [('ответ: hello', None)]
+    assert job.voice == b'voice' and job.voice_status == "success"
+    assert list(job.timings) == ['download', 'decode', 'asr', 'nlp', 'first_reply', 'tts']
+    assert pipeline.completed == 1 and pipeline.slots.in_flight == 0
+
+
+def test_job_timeout_releases_slot():
+    pipeline = VoicePipeline(FakeExecutor(delay=1.0), FakeVoiceProcessor(), {**CONFIG, 'job_timeout': 0.05})
+    with pytest.raises(asyncio.TimeoutError):
+        run_job(pipeline)
+    assert pipeline.slots.in_flight == 0 and pipeline.completed == 0
+
+
+def test_failed_text_reply_abandons_synthesis():
+    pipeline = VoicePipeline(FakeExecutor(), FakeVoiceProcessor(), CONFIG)
+
+    async def on_reply(job):
+        raise RuntimeError('send failed')
+
+    with pytest.raises(RuntimeError):
+        run_job(pipeline, on_reply=on_reply)
+    assert pipeline.replied == 0 and pipeline.completed == 0
+
+
+def test_unavailable_asr_skips_download():
+    processor = FakeVoiceProcessor()
+    processor.asr_available = False
+    downloads = []
+    job = run_job(VoicePipeline(FakeExecutor(), processor, CONFIG), downloads=downloads)
+    assert job.status == processor.ASR_UNAVAILABLE and downloads == []
+
+
+def test_stage_skips_jobs_cancelled_while_queued():
+    started = []
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def handler(name):
+            started.append(name)
+            await gate.wait()
+            return name
+
+        stage = _Stage('test', handler, workers=1, queue_size=4)
+        stage.start()
+        first = asyncio.ensure_future(stage.submit('first'))
+        await asyncio.sleep(0)
+        # Второе задание ждёт в очереди, пока единственный обработчик занят, и снимается по таймауту
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(stage.submit('second'), 0.05)
+        gate.set()
+        assert await first == 'first'
+        await asyncio.sleep(0.01)
+        stats = stage.get_stats()
+        await stage.stop()
+        return stats
+
+    stats = asyncio.run(main())
+    assert started == ['first']
+    assert stats['processed'] == 1 and stats['queued'] == 0
+
+
+def test_stage_counts_failures_and_stop_cancels_running_job():
+    async def main():
+        async def handler(value):
+            if value == 'bad':
+                raise ValueError(value)
+            await asyncio.sleep(10)
+
+        stage = _Stage('test', handler, workers=1, queue_size=4)
+        stage.start()
+        with pytest.raises(ValueError):
+            await stage.submit('bad')
+        running = asyncio.ensure_future(stage.submit('slow'))
+        await asyncio.sleep(0.01)
+        await stage.stop()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        return stage.get_stats()
+
+    stats = asyncio.run(main())
+    assert stats['failed'] == 1 and stats['processed'] == 0 and stats['busy'] == 0
@@ -1,22 +1,17 @@
 import re
-from typing import List
-from natasha import (
-    Segmenter,
-    MorphVocab,
-    NewsEmbedding,
-    NewsMorphTagger,
-    Doc
-)
-import pymorphy2
+from typing import Dict, FrozenSet, List, Tuple
+from natasha import Doc
 
-class TextProcessor:
-    def __init__(self):
-        self.segmenter = Segmenter()
-        self.morph_vocab = MorphVocab()
-        self.emb = NewsEmbedding()
-        self.morph_tagger = NewsMorphTagger(self.emb)
+from analyzed_message import AnalyzedMessage, ParsedToken
+from nlp_resources import NLPResources, get_nlp_resources
+from lru_cache import LRUCache
+from config import TEXT_CACHE_CONFIG
 
-        self.morph = pymorphy2.MorphAnalyzer()
+class TextProcessor:
+    def __init__(self, resources: NLPResources = None):
+        self.resources = resources or get_nlp_resources()
+        self.lemma_cache = LRUCache(TEXT_CACHE_CONFIG['lemma_cache_size'])
+        self.normal_form_cache = LRUCache(TEXT_CACHE_CONFIG['normal_form_cache_size'])
 
         self.alphabet = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя- '
 
@@ -26,6 +21,26 @@ class TextProcessor:
             'нет', 'это', 'то', 'же', 'ли', 'бы', 'был', 'была', 'было', 'были'
         }
 
+    @property
+    def segmenter(self):
+        return self.resources.segmenter
+
+    @property
+    def morph_vocab(self):
+        return self.resources.morph_vocab
+
+    @property
+    def emb(self):
+        return self.resources.embedding
+
+    @property
+    def morph_tagger(self):
+        return self.resources.morph_tagger
+
+    @property
+    def morph(self):
+        return self.resources.morph
+
     def clear_phrase(self, phrase: str) -> str:
         if not phrase:
             return ""
@@ -38,48 +53,75 @@ class TextProcessor:
 
         return result
 
+    def analyze(self, text: str) -> AnalyzedMessage:
+        """Сообщение, которое очищается и разбирается один раз для всех классификаторов"""
+        return AnalyzedMessage(text, self)
+
     def lemmatize_text(self, text: str) -> List[str]:
-        text = self.clear_phrase(text)
+        return self.lemmatize_cleaned(self.clear_phrase(text))
+
+    def lemmatize_cleaned(self, text: str) -> List[str]:
+        """Лемматизация уже очищенного clear_phrase текста с кэшированием результата"""
+        return self.select_lemmas(self.parse_cleaned(text))
+
+    def select_lemmas(self, parsed: Tuple[ParsedToken, ...], keep: FrozenSet[str] = frozenset()) -> List[str]:
+        """Значимые леммы разбора: без стоп-слов и коротких слов, кроме слов из keep"""
+        return [lemma for token, lemma, _ in parsed
+                if len(token) > 1 and (lemma in keep or (lemma not in self.stop_words and len(lemma) > 2))]
+
+    def parse_cleaned(self, text: str) -> Tuple[ParsedToken, ...]:
+        """Токены очищенного текста с леммами и частями речи; результат кэшируется по тексту"""
         if not text:
-            return []
+            return ()
+
+        cached = self.lemma_cache.get(text)
+        if cached is not None:
+            return cached
 
+        parsed = self._parse(text)
+        self.lemma_cache.put(text, parsed)
+        return parsed
+
+    def _parse(self, text: str) -> Tuple[ParsedToken, ...]:
         try:
             doc = Doc(text)
             doc.segment(self.segmenter)
             doc.tag_morph(self.morph_tagger)
 
-            lemmas = []
+            parsed = []
             for token in doc.tokens:
-                if token.text and len(token.text) > 1:
-                    if hasattr(token, 'lemma') and token.lemma:
-                        lemma = token.lemma.lower()
-                    else:
-                        parsed = self.morph.parse(token.text)[0]
-                        lemma = parsed.normal_form.lower()
-
-                    if lemma not in self.stop_words and len(lemma) > 2:
-                        lemmas.append(lemma)
-
-            return lemmas
+                if not token.text:
+                    continue
+                if len(token.text) < 2:
+                    # Однобуквенные токены в леммы не попадают, разбирать их незачем
+                    lemma = token.text
+                elif hasattr(token, 'lemma') and token.lemma:
+                    lemma = token.lemma.lower()
+                else:
+                    lemma = self.normal_form(token.text)
+                parsed.append((token.text, lemma, token.pos))
+
+            return tuple(parsed)
 
         except Exception as e:
             print(f"Ошибка лемматизации с Natasha: {e}")
-            return self._lemmatize_with_pymorphy(text)
-
-    def _lemmatize_with_pymorphy(self, text: str) -> List[str]:
-        words = text.split()
-        lemmas = []
+            return self._parse_with_pymorphy(text)
 
-        for word in words:
-            if len(word) > 2:
-                parsed = self.morph.parse(word)[0]
-                lemma = parsed.normal_form.lower()
-                if lemma not in self.stop_words:
-                    lemmas.append(lemma)
+    def _parse_with_pymorphy(self, text: str) -> Tuple[ParsedToken, ...]:
+        return tuple((word, self.normal_form(word) if len(word) > 1 else word, None) for word in text.split())
 
-        return lemmas
+    def normal_form(self, word: str) -> str:
+        lemma = self.normal_form_cache.get(word)
+        if lemma is None:
+            lemma = self.morph.parse(word)[0].normal_form.lower()
+            self.normal_form_cache.put(word, lemma)
+        return lemma
 
     def preprocess_for_ml(self, text: str) -> str:
-        text = self.clear_phrase(text)
-        lemmas = self.lemmatize_text(text)
-        return ' '.join(lemmas)
+        return ' '.join(self.lemmatize_text(text))
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            'lemma': self.lemma_cache.stats(),
+            'normal_form': self.normal_form_cache.stats()
+        }
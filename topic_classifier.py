@@ -1,10 +1,17 @@
 import random
 from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
 from text_processor import TextProcessor
+from nlp_resources import get_text_processor
+from aho_corasick import AhoCorasick
+from lru_cache import LRUCache
+from config import TEXT_CACHE_CONFIG
 
 class TopicClassifier:
-    def __init__(self):
-        self.text_processor = TextProcessor()
+    def __init__(self, text_processor: TextProcessor = None):
+        self.text_processor = text_processor or get_text_processor()
 
         self.topic_keywords = {
             'greeting': ['привет', 'здравствовать', 'добрый', 'день', 'утро', 'вечер', 'салют'],
@@ -20,77 +27,129 @@ class TopicClassifier:
             'complaint': ['жалоба', 'проблема', 'не работать', 'плохой', 'ужасный', 'некачественный'],
             'compliment': ['спасибо', 'благодарить', 'отличный', 'хороший', 'замечательный', 'помочь']
         }
+        self.compile()
+
+    def compile(self):
+        """Собрать таблицу ключевых слов в матрицу весов и автоматы подстрок"""
+        self.topics = list(self.topic_keywords)
+        keywords = list(dict.fromkeys(k for words in self.topic_keywords.values() for k in words))
+        self._keyword_ids = {keyword: i for i, keyword in enumerate(keywords)}
+
+        # Строка k: сколько раз ключевое слово k встречается в списке каждой темы
+        self._keyword_topics = np.zeros((len(keywords), len(self.topics)))
+        for topic_id, topic in enumerate(self.topics):
+            for keyword in self.topic_keywords[topic]:
+                self._keyword_topics[self._keyword_ids[keyword], topic_id] += 1
+
+        # Ключевые слова внутри леммы ищет автомат, а лемму внутри ключевого
+        # слова — словарь всех подстрок ключевых слов
+        self._keyword_matcher = AhoCorasick()
+        self._keyword_substrings: Dict[str, set] = {}
+        for keyword, keyword_id in self._keyword_ids.items():
+            self._keyword_matcher.add(keyword, keyword_id)
+            for start in range(len(keyword)):
+                for end in range(start + 1, len(keyword) + 1):
+                    self._keyword_substrings.setdefault(keyword[start:end], set()).add(keyword_id)
+        self._keyword_matcher.build()
+        self._lemma_cache = LRUCache(TEXT_CACHE_CONFIG['topic_lemma_cache_size'])
+        self._empty = (np.zeros(len(self.topics)), np.zeros(len(self.topics)))
+
+    def _lemma_scores(self, lemma: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Вклад леммы в баллы тем и число совпавших ключевых слов по темам"""
+        cached = self._lemma_cache.get(lemma)
+        if cached is not None:
+            return cached
+
+        exact_id = self._keyword_ids.get(lemma)
+        partial = self._keyword_matcher.find_values(lemma)
+        partial |= self._keyword_substrings.get(lemma, set())
+        partial.discard(exact_id)
+
+        if exact_id is None and not partial:
+            result = self._empty
+        else:
+            hits = self._keyword_topics[list(partial)].sum(axis=0) if partial else np.zeros(len(self.topics))
+            scores = hits * 0.5
+            if exact_id is not None:
+                scores = scores + self._keyword_topics[exact_id]
+                hits = hits + self._keyword_topics[exact_id]
+            result = (scores, hits)
+        self._lemma_cache.put(lemma, result)
+        return result
+
+    def score_lemmas(self, lemmas: List[str]) -> np.ndarray:
+        """Нормированные баллы всех тем (в порядке self.topics) за один проход"""
+        if not lemmas:
+            return np.zeros(len(self.topics))
+        total = np.zeros(len(self.topics))
+        for lemma in lemmas:
+            total += self._lemma_scores(lemma)[0]
+        return total / len(lemmas)
+
+    def score_batch(self, lemma_lists: List[List[str]]) -> np.ndarray:
+        """Матрица баллов тем для списка сообщений, строка на сообщение"""
+        scores = np.zeros((len(lemma_lists), len(self.topics)))
+        lengths = np.array([len(lemmas) for lemmas in lemma_lists])
+        flat = [lemma for lemmas in lemma_lists for lemma in lemmas]
+        if not flat:
+            return scores
+        per_lemma = np.stack([self._lemma_scores(lemma)[0] for lemma in flat])
+        non_empty = lengths > 0
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[non_empty]
+        scores[non_empty] = np.add.reduceat(per_lemma, starts, axis=0) / lengths[non_empty, None]
+        return scores
+
+    def _main_topic(self, scores: np.ndarray) -> Tuple[Optional[str], float]:
+        if not len(scores):
+            return None, 0.0
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None, 0.0
+        return self.topics[best], float(scores[best])
 
-    def classify_topic(self, text: str) -> Dict[str, float]:
+    def get_main_topics_batch(self, lemma_lists: List[List[str]]) -> List[Tuple[Optional[str], float]]:
+        return [self._main_topic(row) for row in self.score_batch(lemma_lists)]
+
+    def _lemmas(self, text) -> List[str]:
+        # Принимается и строка, и уже разобранное сообщение, чтобы не лемматизировать текст повторно
+        if isinstance(text, str):
+            return self.text_processor.lemmatize_text(text)
+        return text.lemmas
+
+    def classify_topic(self, text) -> Dict[str, float]:
+        """Баллы и совпавшие ключевые слова тем; text — строка или AnalyzedMessage"""
         if not text:
             return {}
 
-        lemmas = self.text_processor.lemmatize_text(text)
+        lemmas = self._lemmas(text)
 
         if not lemmas:
             return {}
 
-        topic_scores = {}
+        scores = np.zeros(len(self.topics))
+        matched: Dict[int, List[str]] = {}
+        for lemma in lemmas:
+            lemma_scores, hits = self._lemma_scores(lemma)
+            scores += lemma_scores
+            for topic_id in np.flatnonzero(hits):
+                matched.setdefault(int(topic_id), []).extend([lemma] * int(hits[topic_id]))
 
-        for topic, keywords in self.topic_keywords.items():
-            score = 0
-            matched_keywords = []
-
-            for lemma in lemmas:
-                for keyword in keywords:
-                    if lemma == keyword:
-                        score += 1.0
-                        matched_keywords.append(lemma)
-                    elif keyword in lemma or lemma in keyword:
-                        score += 0.5
-                        matched_keywords.append(lemma)
-
-            if score > 0:
-                normalized_score = score / len(lemmas)
+        topic_scores = {}
+        for topic_id, topic in enumerate(self.topics):
+            if scores[topic_id] > 0:
                 topic_scores[topic] = {
-                    'score': normalized_score,
-                    'matched_keywords': matched_keywords
+                    'score': scores[topic_id] / len(lemmas),
+                    'matched_keywords': matched.get(topic_id, [])
                 }
 
         return topic_scores
 
-    def get_main_topic(self, text: str) -> Tuple[Optional[str], float]:
-        topic_scores = self.classify_topic(text)
-
-        if not topic_scores:
+    def get_main_topic(self, text) -> Tuple[Optional[str], float]:
+        if not text:
             return None, 0.0
-
-        main_topic = max(topic_scores.items(), key=lambda x: x[1]['score'])
-        return main_topic[0], main_topic[1]['score']
+        return self.get_main_topic_from_lemmas(self._lemmas(text))
 
     def get_main_topic_from_lemmas(self, lemmas: List[str]) -> Tuple[Optional[str], float]:
         if not lemmas:
             return None, 0.0
-
-        topic_scores = {}
-
-        for topic, keywords in self.topic_keywords.items():
-            score = 0
-            matched_keywords = []
-
-            for lemma in lemmas:
-                for keyword in keywords:
-                    if lemma == keyword:
-                        score += 1.0
-                        matched_keywords.append(lemma)
-                    elif keyword in lemma or lemma in keyword:
-                        score += 0.5
-                        matched_keywords.append(lemma)
-
-            if score > 0:
-                normalized_score = score / len(lemmas)
-                topic_scores[topic] = {
-                    'score': normalized_score,
-                    'matched_keywords': matched_keywords
-                }
-
-        if not topic_scores:
-            return None, 0.0
-
-        main_topic = max(topic_scores.items(), key=lambda x: x[1]['score'])
-        return main_topic[0], main_topic[1]['score']
\ No newline at end of file
+        return self._main_topic(self.score_lemmas(lemmas))
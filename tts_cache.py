@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from audio_codec import AudioDecodeError, encode, encode_opus
+from config import VOICE_CONFIG
+from speech_backends import SynthesizerBackend, create_synthesizer
+
+
+class TTSCache:
+    """Кэш синтезированной речи на диске с адресацией по содержимому.
+
+    Ключ — хэш текста, движка синтеза и формата, поэтому смена голоса или
+    формата не отдаёт старый звук. Файлы раскладываются по подкаталогам
+    из первых символов ключа; при превышении max_bytes удаляются давно
+    не использованные. Порядок использования хранится во времени изменения
+    файлов и переживает перезапуск.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None, stale_tmp_seconds: float = None):
+        self.directory = directory or VOICE_CONFIG['tts_cache_dir']
+        self.max_bytes = max_bytes or VOICE_CONFIG['tts_cache_max_bytes']
+        self.stale_tmp_seconds = (stale_tmp_seconds if stale_tmp_seconds is not None
+                                  else VOICE_CONFIG['tts_cache_stale_tmp_seconds'])
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._scan()
+
+    @staticmethod
+    def make_key(text: str, identity: str, audio_format: str) -> str:
+        payload = '\0'.join((identity, audio_format, text.strip()))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan(self):
+        """Восстановить индекс по файлам на диске, от давно использованных к свежим"""
+        found = []
+        stale_before = time.time() - self.stale_tmp_seconds
+        if os.path.isdir(self.directory):
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.tmp'):
+                        # Кэш общий для нескольких процессов: свежий .tmp может дописываться прямо сейчас,
+                        # удаляются только давно брошенные файлы прерванных процессов
+                        try:
+                            if entry.stat().st_mtime < stale_before:
+                                os.remove(entry.path)
+                        except OSError:
+                            pass
+                        continue
+                    stat = entry.stat()
+                    found.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # Файл удалён вытеснением в другом потоке или вручную
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._total_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+class CachedSynthesizer:
+    """Синтез речи с перекодированием в формат ответа и кэшем готового звука"""
+
+    def __init__(self, backend: SynthesizerBackend = None, cache: Optional[TTSCache] = None,
+                 output_format: str = None):
+        self.backend = backend or create_synthesizer()
+        self.cache = cache
+        self.output_format = output_format or VOICE_CONFIG['tts_format']
+
+    def key(self, text: str) -> str:
+        return TTSCache.make_key(text, self.backend.identity, self.output_format)
+
+    def is_cached(self, text: str) -> bool:
+        return self.cache is not None and self.key(text) in self.cache
+
+    def _render(self, text: str) -> Tuple[bytes, bool]:
+        """Звук в формате ответа; второй элемент — удалось ли привести его к этому формату"""
+        audio = self.backend.synthesize(text)
+        if self.output_format == self.backend.output_format:
+            return audio, True
+        try:
+            if self.output_format == 'opus':
+                return encode_opus(audio, self.backend.output_format), True
+            return encode(audio, self.backend.output_format, self.output_format), True
+        except AudioDecodeError as e:
+            # Без ffmpeg отдаём звук как есть, но не кэшируем его под чужим форматом
+            print(f"Не удалось перекодировать синтезированную речь в {self.output_format}: {e}")
+            return audio, False
+
+    def synthesize(self, text: str) -> Tuple[Optional[bytes], str]:
+        if not text or not text.strip():
+            return None, "Пустой текст"
+        key = self.key(text) if self.cache is not None else None
+        if key:
+            audio = self.cache.get(key)
+            if audio is not None:
+                return audio, "success"
+        try:
+            audio, converted = self._render(text)
+        except Exception as e:
+            return None, f"Ошибка синтеза речи: {e}"
+        if key and converted:
+            try:
+                self.cache.put(key, audio)
+            except OSError as e:
+                print(f"Не удалось сохранить речь в кэш: {e}")
+        return audio, "success"
@@ -0,0 +1,361 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from config import UPDATE_QUEUE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+PENDING, DONE, FAILED = 0, 1, 2
+
+
+class PoisonUpdate(Exception):
+    """Обновление нельзя обработать ни с какой попытки (битый payload); повторять бессмысленно"""
+
+# Ключи обновления, в которых лежит объект с чатом или отправителем
+_CHAT_SOURCES = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query',
+                 'my_chat_member', 'chat_member', 'chat_join_request', 'inline_query',
+                 'chosen_inline_result', 'shipping_query', 'pre_checkout_query', 'poll_answer')
+
+
+def chat_key(update: Dict[str, Any]) -> int:
+    """Идентификатор чата, по которому обновление закрепляется за воркером"""
+    for source in _CHAT_SOURCES:
+        item = update.get(source)
+        if not isinstance(item, dict):
+            continue
+        chat = item.get('chat') or (item.get('message') or {}).get('chat')
+        if chat and 'id' in chat:
+            return int(chat['id'])
+        sender = item.get('from') or item.get('user')
+        if sender and 'id' in sender:
+            return int(sender['id'])
+    return int(update.get('update_id', 0))
+
+
+def payload_chat_key(payload: bytes) -> int:
+    """chat_key для сохранённого обновления; битый JSON получает общий ключ"""
+    try:
+        return chat_key(json.loads(payload))
+    except (ValueError, TypeError, AttributeError):
+        return 0
+
+
+class KeyedLock:
+    """Задачи с одним ключом выполняются по одной в порядке прихода, с разными — параллельно"""
+
+    def __init__(self):
+        # Блокировка и число задач, которые её держат или ждут
+        self._locks: Dict[Hashable, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        lock, users = self._locks.get(key, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class UpdateQueue:
+    """Журнал входящих обновлений Telegram в SQLite (WAL).
+
+    Обновление записывается до того, как Telegram получит подтверждение
+    доставки, и помечается обработанным только после ответа пользователю.
+    update_id служит ключом идемпотентности: повторная доставка того же
+    обновления не создаёт второй записи. Очередь обхода — порядок вставки.
+    """
+
+    def __init__(self, path: str = None, max_attempts: int = None):
+        self.path = path or UPDATE_QUEUE_CONFIG['path']
+        self.max_attempts = max_attempts or UPDATE_QUEUE_CONFIG['max_attempts']
+        self._conn = sqlite3.connect(self.path, timeout=UPDATE_QUEUE_CONFIG['busy_timeout'],
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f"PRAGMA synchronous={UPDATE_QUEUE_CONFIG['synchronous']}")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS updates (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            update_id INTEGER NOT NULL UNIQUE,
+            payload BLOB NOT NULL,
+            state INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            received REAL NOT NULL,
+            finished REAL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS updates_state ON updates(state, seq)')
+        self._lock = threading.Lock()
+        self.appended = 0
+        self.duplicates = 0
+
+    def append_many(self, items: Iterable[Tuple[int, bytes]]) -> int:
+        """Записать пачку (update_id, payload) одной транзакцией; возвращает число новых"""
+        rows = [(update_id, payload, time.time()) for update_id, payload in items]
+        if not rows:
+            return 0
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO updates (update_id, payload, received) VALUES (?, ?, ?)', rows)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            added = self._conn.total_changes - before
+        self.appended += added
+        self.duplicates += len(rows) - added
+        return added
+
+    def append(self, update_id: int, payload: bytes) -> bool:
+        return self.append_many([(update_id, payload)]) == 1
+
+    def claim(self, limit: int, after_seq: int = 0) -> List[Tuple[int, int, bytes]]:
+        """Следующие необработанные записи после after_seq: (seq, update_id, payload).
+
+        Каждая выдача увеличивает счётчик попыток. Запись, которая уже
+        max_attempts раз выдавалась и так и не была подтверждена (например,
+        роняла процесс), помечается как FAILED и больше не выдаётся.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    'SELECT seq, update_id, payload, attempts FROM updates '
+                    'WHERE state = ? AND seq > ? ORDER BY seq LIMIT ?', (PENDING, after_seq, limit)).fetchall()
+                poisoned = [(FAILED, time.time(), seq) for seq, _, _, attempts in rows
+                            if attempts >= self.max_attempts]
+                if poisoned:
+                    self._conn.executemany('UPDATE updates SET state = ?, finished = ? WHERE seq = ?', poisoned)
+                self._conn.executemany('UPDATE updates SET attempts = attempts + 1 WHERE seq = ?',
+                                       [(seq,) for seq, _, _, attempts in rows if attempts < self.max_attempts])
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        claimed = []
+        for seq, update_id, payload, attempts in rows:
+            if attempts < self.max_attempts:
+                claimed.append((seq, update_id, payload))
+            else:
+                logger.error(f"Обновление {update_id} не обработано за {self.max_attempts} попыток и пропущено")
+        return claimed
+
+    def retry(self, update_id: int) -> bool:
+        """Засчитать ещё одну попытку упавшей записи.
+
+        Возвращает False, если попытки исчерпаны: тогда запись помечается FAILED.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._conn.execute(
+                    'UPDATE updates SET attempts = attempts + 1 WHERE update_id = ? AND state = ? AND attempts < ?',
+                    (update_id, PENDING, self.max_attempts))
+                allowed = cursor.rowcount == 1
+                if not allowed:
+                    self._conn.execute('UPDATE updates SET state = ?, finished = ? WHERE update_id = ? AND state = ?',
+                                       (FAILED, time.time(), update_id, PENDING))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return allowed
+
+    def _finish(self, update_ids: Iterable[int], state: int):
+        rows = [(state, time.time(), update_id) for update_id in update_ids]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany('UPDATE updates SET state = ?, finished = ? WHERE update_id = ?', rows)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def ack(self, update_ids: Iterable[int]):
+        self._finish(update_ids, DONE)
+
+    def fail(self, update_ids: Iterable[int]):
+        self._finish(update_ids, FAILED)
+
+    def purge(self, older_than: float = None) -> int:
+        """Удалить завершённые записи старше older_than секунд"""
+        older_than = older_than if older_than is not None else UPDATE_QUEUE_CONFIG['retention_seconds']
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM updates WHERE state != ? AND finished < ?',
+                                        (PENDING, time.time() - older_than))
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute('SELECT state, COUNT(*) FROM updates GROUP BY state').fetchall())
+        return {'pending': counts.get(PENDING, 0), 'done': counts.get(DONE, 0), 'failed': counts.get(FAILED, 0),
+                'appended': self.appended, 'duplicates': self.duplicates}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class UpdateConsumer:
+    """Читает очередь пачками и обрабатывает обновления параллельно.
+
+    Параллельно идут только обновления разных чатов: обновления одного чата
+    (ключ key, по умолчанию payload_chat_key) обрабатываются по одному в
+    порядке очереди, чтобы ответы не перемешивались. Упавшее обновление
+    повторяется с паузой, пока не исчерпаны max_attempts; сразу в FAILED
+    уходят только битые (PoisonUpdate). При старте заново выдаются все неподтверждённые записи, оставшиеся от
+    прошлого запуска. Подтверждения копятся и пишутся одной транзакцией на
+    итерацию, чтобы запись в базу не стала узким местом.
+    """
+
+    def __init__(self, update_queue: UpdateQueue, handle: Callable[[bytes], Awaitable[Any]],
+                 concurrency: int = None, batch_size: int = None, poll_interval: float = None,
+                 key: Callable[[bytes], Hashable] = None, retry_delay: float = None):
+        self.queue = update_queue
+        self.handle = handle
+        self.key = key or payload_chat_key
+        self.concurrency = concurrency or UPDATE_QUEUE_CONFIG['concurrency']
+        self.batch_size = batch_size or UPDATE_QUEUE_CONFIG['batch_size']
+        self.poll_interval = poll_interval or UPDATE_QUEUE_CONFIG['poll_interval']
+        self.retry_delay = retry_delay if retry_delay is not None else UPDATE_QUEUE_CONFIG['retry_delay']
+        self.processed = 0
+        self.errors = 0
+        self.retries = 0
+        self._db = ThreadPoolExecutor(max_workers=1, thread_name_prefix='update-queue')
+        self._wake = asyncio.Event()
+        self._halt = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._acks: List[int] = []
+        self._failures: List[int] = []
+        self._tasks: Set[asyncio.Task] = set()
+        self._chats = KeyedLock()
+        self._stopping = False
+
+    def notify(self):
+        """Сообщить о новых записях; можно вызывать из любого потока"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _db_call(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db, func, *args)
+
+    async def ingest(self, items: List[Tuple[int, bytes]]) -> int:
+        """Записать обновления в очередь из того же процесса и сразу разбудить чтение"""
+        added = await self._db_call(self.queue.append_many, items)
+        self._wake.set()
+        return added
+
+    async def _attempt(self, update_id: int, payload: bytes) -> bool:
+        """Одна попытка обработки; True — запись завершена (подтверждена или отброшена)"""
+        try:
+            await self.handle(payload)
+        except PoisonUpdate as e:
+            self.errors += 1
+            self._failures.append(update_id)
+            logger.error(f"Битое обновление {update_id} пропущено: {e}")
+        except Exception as e:
+            if self._stopping:
+                # Запись остаётся PENDING и будет выдана заново после перезапуска
+                logger.warning(f"Обновление {update_id} не обработано до остановки: {e}")
+                return True
+            if not await self._db_call(self.queue.retry, update_id):
+                self.errors += 1
+                logger.error(f"Обновление {update_id} не обработано за {self.queue.max_attempts} попыток: {e}")
+                return True
+            self.retries += 1
+            logger.warning(f"Обновление {update_id} будет повторено: {e}")
+            return False
+        else:
+            self.processed += 1
+            self._acks.append(update_id)
+        return True
+
+    async def _process(self, update_id: int, payload: bytes):
+        # Задачи создаются в порядке seq, а блокировка честная: порядок внутри чата сохраняется.
+        # Повторы идут под той же блокировкой, чтобы следующие сообщения чата не обогнали упавшее
+        try:
+            async with self._chats.hold(self.key(payload)):
+                delay = self.retry_delay
+                while not await self._attempt(update_id, payload):
+                    try:
+                        await asyncio.wait_for(self._halt.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    if self._stopping:
+                        # Запись остаётся PENDING и будет выдана заново после перезапуска
+                        break
+                    delay *= 2
+        finally:
+            self._wake.set()
+
+    async def _flush(self):
+        acks, self._acks = self._acks, []
+        failures, self._failures = self._failures, []
+        if acks:
+            await self._db_call(self.queue.ack, acks)
+        if failures:
+            await self._db_call(self.queue.fail, failures)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        purged = await self._db_call(self.queue.purge)
+        replay = (await self._db_call(self.queue.get_stats))['pending']
+        if replay:
+            logger.info(f"Повторная обработка после перезапуска: {replay} обновлений")
+        if purged:
+            logger.info(f"Удалено старых записей очереди: {purged}")
+        last_seq = 0
+        try:
+            while not self._stopping:
+                self._wake.clear()
+                # Берётся не больше записей, чем свободных мест: остальные ждут в базе, а не в памяти
+                free = self.concurrency - len(self._tasks)
+                rows = await self._db_call(self.queue.claim, min(self.batch_size, free), last_seq) if free else []
+                for seq, update_id, payload in rows:
+                    last_seq = seq
+                    task = self._loop.create_task(self._process(update_id, payload))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                await self._flush()
+                if len(rows) < self.batch_size or not free:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._flush()
+
+    def stop(self):
+        """Дообработать выданные записи и завершить run(); можно вызывать из любого потока"""
+        self._stopping = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._halt.set)
+        self.notify()
+
+    def shutdown(self):
+        self._db.shutdown(wait=True)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'in_flight': len(self._tasks), 'chats': len(self._chats), 'processed': self.processed,
+                'retries': self.retries, 'errors': self.errors}
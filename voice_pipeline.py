@@ -0,0 +1,203 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+from config import EXECUTOR_CONFIG, VOICE_PIPELINE_CONFIG
+from message_executor import _Slots
+
+
+class VoiceJob:
+    """Состояние одного голосового сообщения по мере прохождения стадий"""
+
+    def __init__(self, user_id: str, input_format: str = 'ogg'):
+        self.user_id = user_id
+        self.input_format = input_format
+        self.status = "success"
+        self.recognized_text: Optional[str] = None
+        self.response: Optional[str] = None
+        self.voice: Optional[bytes] = None
+        self.voice_status: Optional[str] = None
+        self.started = time.perf_counter()
+        # Секунды от начала обработки до завершения каждой стадии
+        self.timings: Dict[str, float] = {}
+
+    def mark(self, stage: str):
+        self.timings[stage] = time.perf_counter() - self.started
+
+
+class _Stage:
+    """Стадия конвейера: ограниченная очередь и фиксированное число обработчиков"""
+
+    def __init__(self, name: str, handler: Callable[..., Awaitable], workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, *args) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        # Полная очередь задерживает предыдущую стадию, а не растёт без предела
+        await self._queue.put((args, future))
+        return await future
+
+    async def _work(self):
+        while True:
+            args, future = await self._queue.get()
+            if future.done():
+                # Задание отменено по таймауту, пока стояло в очереди
+                continue
+            self.busy += 1
+            started = time.perf_counter()
+            try:
+                result = await self.handler(*args)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.processed += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.busy -= 1
+                self.busy_time += elapsed
+                metrics.observe(self.name, elapsed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'workers': self.workers, 'queued': self._queue.qsize() if self._queue else 0,
+                'busy': self.busy, 'processed': self.processed, 'failed': self.failed,
+                'busy_time_s': self.busy_time}
+
+
+class VoicePipeline:
+    """Конвейер голосовых сообщений: декодирование → распознавание → ответ → синтез.
+
+    У каждой стадии своя очередь и свои обработчики, поэтому сообщения из
+    всплеска идут по стадиям параллельно, а не друг за другом. Текстовый ответ
+    отправляется сразу после стадии ответа, пока голос ещё синтезируется.
+    """
+
+    def __init__(self, executor, voice_processor, config: Dict[str, Any] = None):
+        self.config = config or VOICE_PIPELINE_CONFIG
+        self.executor = executor
+        self.voice_processor = voice_processor
+        self.slots = _Slots(self.config['max_in_flight'], EXECUTOR_CONFIG['queue_timeout'])
+        self.timeout = self.config['job_timeout']
+
+        decode_workers = self.config['decode_workers'] or os.cpu_count() or 1
+        self._pools = {
+            'decode': ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix='voice-decode'),
+            'asr': ThreadPoolExecutor(max_workers=self.config['asr_workers'], thread_name_prefix='voice-asr'),
+            'tts': ThreadPoolExecutor(max_workers=self.config['tts_workers'], thread_name_prefix='voice-tts')
+        }
+        queue_size = self.config['stage_queue_size']
+        self.decode = _Stage('decode', self._in_pool('decode', voice_processor.decode), decode_workers, queue_size)
+        self.asr = _Stage('asr', self._in_pool('asr', voice_processor.recognize_pcm),
+                          self.config['asr_workers'], queue_size)
+        # Анализ текста уже распределяется по пулам MessageExecutor, стадия лишь ограничивает число заданий
+        self.nlp = _Stage('reply', executor.process_message, self.config['nlp_workers'], queue_size)
+        self.tts = _Stage('tts', self._in_pool('tts', voice_processor.text_to_speech),
+                          self.config['tts_workers'], queue_size)
+        self.stages = [self.decode, self.asr, self.nlp, self.tts]
+        self._started = False
+        self.replied = 0
+        self.first_reply_total = 0.0
+        self.completed = 0
+
+    def _in_pool(self, pool_name: str, func: Callable) -> Callable[..., Awaitable]:
+        async def run(*args):
+            return await asyncio.get_running_loop().run_in_executor(self._pools[pool_name], func, *args)
+        return run
+
+    def start(self):
+        if not self._started:
+            for stage in self.stages:
+                stage.start()
+            self._started = True
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+        self._started = False
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+
+    async def process(self, download: Callable[[], Awaitable[bytes]], user_id: str,
+                      on_reply: Callable[[VoiceJob], Awaitable[None]], input_format: str = 'ogg') -> VoiceJob:
+        """Обработать голосовое сообщение; on_reply вызывается с готовым текстом ответа до синтеза голоса.
+
+        Если лимит сообщений в работе исчерпан, выбрасывает BusyError.
+        """
+        self.start()
+        job = VoiceJob(user_id, input_format)
+        async with self.slots.acquire():
+            await asyncio.wait_for(self._process(job, download, on_reply), self.timeout)
+        return job
+
+    async def _process(self, job: VoiceJob, download: Callable[[], Awaitable[bytes]],
+                       on_reply: Callable[[VoiceJob], Awaitable[None]]):
+        if not self.voice_processor.asr_available:
+            # Модель не загрузилась при старте: файл не скачивается и не декодируется зря
+            job.status = self.voice_processor.ASR_UNAVAILABLE
+            return
+        data = await download()
+        job.mark('download')
+        pcm, job.status = await self.decode.submit(data, job.input_format)
+        job.mark('decode')
+        if pcm is None:
+            return
+        job.recognized_text, job.status = await self.asr.submit(pcm)
+        job.mark('asr')
+        if job.status != "success":
+            return
+        if not job.recognized_text:
+            job.status = "Не удалось распознать речь. Попробуйте еще раз."
+            return
+
+        job.response = await self.nlp.submit(job.recognized_text, job.user_id)
+        job.mark('nlp')
+        synthesis = asyncio.ensure_future(self.tts.submit(job.response))
+        try:
+            await on_reply(job)
+        except BaseException:
+            synthesis.cancel()
+            raise
+        job.mark('first_reply')
+        self.replied += 1
+        self.first_reply_total += job.timings['first_reply']
+        job.voice, job.voice_status = await synthesis
+        job.mark('tts')
+        self.completed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': self.slots.in_flight,
+            'rejected': self.slots.rejected,
+            'completed': self.completed,
+            'avg_first_reply_ms': self.first_reply_total / self.replied * 1000 if self.replied else 0.0,
+            'stages': {stage.name: stage.get_stats() for stage in self.stages}
+        }
@@ -1,87 +1,68 @@
 import speech_recognition as sr
-import pydub
-from gtts import gTTS
-import io
-import os
-import tempfile
+import threading
 from typing import Optional, Tuple
 
+from audio_codec import AudioBuffer, AudioDecodeError, PCMAudio, decode_to_pcm, encode, get_duration
+from config import VOICE_CONFIG
+from speech_backends import RecognizerBackend, SynthesizerBackend, create_recognizer, create_synthesizer
+from tts_cache import CachedSynthesizer, TTSCache
+
 class VoiceProcessor:
-    def __init__(self, language='ru'):
+    ASR_UNAVAILABLE = "Распознавание речи недоступно. Попробуйте отправить текстовое сообщение."
+
+    def __init__(self, language='ru', backend: RecognizerBackend = None, max_concurrency: int = None,
+                 synthesizer: SynthesizerBackend = None):
         self.language = language
-        self.recognizer = sr.Recognizer()
+        self.backend = backend or create_recognizer(language=language)
+        # Без модели распознавания бот работает дальше, голосовые получают статус ошибки
+        self.asr_error: Optional[str] = None
+        try:
+            self.backend.load()
+        except Exception as e:
+            self.asr_error = str(e)
+            print(f"Распознавание речи недоступно ({self.backend.name}): {e}")
+        self.tts_cache = TTSCache() if VOICE_CONFIG['tts_cache_enabled'] else None
+        self.synthesizer = CachedSynthesizer(synthesizer or create_synthesizer(language=language), self.tts_cache)
+        self._asr_slots = threading.BoundedSemaphore(max_concurrency or VOICE_CONFIG['asr_max_concurrency'])
         self.microphone = sr.Microphone()
 
-        self.recognizer.energy_threshold = 300
-        self.recognizer.dynamic_energy_threshold = True
-        self.recognizer.pause_threshold = 0.8
-
-    def recognize_speech_from_audio(self, audio_data: bytes, input_format: str = 'ogg') -> Tuple[Optional[str], str]:
+    def decode(self, audio_data: AudioBuffer, input_format: str = 'ogg') -> Tuple[Optional[PCMAudio], str]:
+        """Декодировать голосовое сообщение в PCM с частотой движка распознавания"""
         try:
-            if input_format != 'wav':
-                wav_data = self.convert_audio_format(audio_data, input_format, 'wav')
-                if not wav_data:
-                    return None, "Ошибка конвертации аудио в WAV. Проверьте формат файла."
-            else:
-                wav_data = audio_data
-
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_file.write(wav_data)
-                tmp_file_path = tmp_file.name
-
-            try:
-                with sr.AudioFile(tmp_file_path) as source:
-                    audio = self.recognizer.record(source)
-                text = self.recognizer.recognize_google(audio, language=self.language)
-                return text, "success"
-            except sr.UnknownValueError:
-                return None, "Не удалось распознать речь"
-            except sr.RequestError as e:
-                return None, f"Ошибка сервиса распознавания речи: {e}"
-            finally:
-                if os.path.exists(tmp_file_path):
-                    os.unlink(tmp_file_path)
+            return decode_to_pcm(audio_data, input_format, self.backend.sample_rate), "success"
+        except AudioDecodeError as e:
+            print(f"Ошибка декодирования аудио: {e}")
+            return None, "Ошибка конвертации аудио. Проверьте формат файла."
         except Exception as e:
             return None, f"Ошибка обработки аудио: {e}"
 
+    @property
+    def asr_available(self) -> bool:
+        return self.asr_error is None
 
-    def text_to_speech(self, text: str) -> Tuple[Optional[bytes], str]:
-        """Преобразование текста в речь"""
-        if not text or not text.strip():
-            return None, "Пустой текст"
-
+    def recognize_pcm(self, pcm: PCMAudio) -> Tuple[Optional[str], str]:
+        if self.asr_error is not None:
+            return None, self.ASR_UNAVAILABLE
         try:
-            tts = gTTS(text=text, lang=self.language, slow=False)
-
-            mp3_fp = io.BytesIO()
-            tts.write_to_fp(mp3_fp)
-            mp3_fp.seek(0)
-
-            return mp3_fp.read(), "success"
-
+            with self._asr_slots:
+                return self.backend.recognize(pcm)
         except Exception as e:
-            return None, f"Ошибка синтеза речи: {e}"
-
-    def convert_audio_format(self, audio_data: bytes, input_format: str, output_format: str = 'wav') -> Optional[bytes]:
-        try:
-            with tempfile.NamedTemporaryFile(suffix=f'.{input_format}', delete=False) as input_file:
-                input_file.write(audio_data)
-                input_file_path = input_file.name
-
-            audio = pydub.AudioSegment.from_file(input_file_path, format=input_format)
-
-            with tempfile.NamedTemporaryFile(suffix=f'.{output_format}', delete=False) as output_file:
-                output_file_path = output_file.name
+            return None, f"Ошибка обработки аудио: {e}"
 
-            audio.export(output_file_path, format=output_format)
+    def recognize_speech_from_audio(self, audio_data: AudioBuffer, input_format: str = 'ogg') -> Tuple[Optional[str], str]:
+        pcm, status = self.decode(audio_data, input_format)
+        if pcm is None:
+            return None, status
+        return self.recognize_pcm(pcm)
 
-            with open(output_file_path, 'rb') as f:
-                result = f.read()
 
-            os.unlink(input_file_path)
-            os.unlink(output_file_path)
+    def text_to_speech(self, text: str) -> Tuple[Optional[bytes], str]:
+        """Преобразование текста в речь; готовые ответы берутся из кэша без синтеза"""
+        return self.synthesizer.synthesize(text)
 
-            return result
+    def convert_audio_format(self, audio_data: AudioBuffer, input_format: str, output_format: str = 'wav') -> Optional[bytes]:
+        try:
+            return encode(audio_data, input_format, output_format)
 
         except Exception as e:
             print(f"Ошибка конвертации аудио: {e}")
@@ -96,19 +77,9 @@ class VoiceProcessor:
             print(f"Ошибка сохранения аудио: {e}")
             return False
 
-    def get_audio_duration(self, audio_data: bytes, format: str = 'mp3') -> Optional[float]:
+    def get_audio_duration(self, audio_data: AudioBuffer, format: str = 'mp3') -> Optional[float]:
         try:
-            with tempfile.NamedTemporaryFile(suffix=f'.{format}', delete=False) as tmp_file:
-                tmp_file.write(audio_data)
-                tmp_file_path = tmp_file.name
-
-            try:
-                audio = pydub.AudioSegment.from_file(tmp_file_path, format=format)
-                duration = len(audio) / 1000.0
-                return duration
-            finally:
-                os.unlink(tmp_file_path)
-
+            return get_duration(audio_data, format)
         except Exception as e:
             print(f"Ошибка получения длительности аудио: {e}")
             return None
@@ -0,0 +1,60 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from config import KEYWORD_ROUTER_CONFIG, VOICE_CONFIG
+from intents_config import IntentsConfig
+from keyword_router import load_keyword_rules
+from perfume_service import PerfumeService
+from speech_backends import SYNTHESIZERS, create_synthesizer
+from tts_cache import CachedSynthesizer, TTSCache
+
+
+def collect_canned_responses(intents_path: str = 'intents.json') -> List[str]:
+    """Все ответы бота, текст которых известен заранее, без повторов"""
+    config = IntentsConfig(intents_path)
+    texts = [response for data in config.intents.values() for response in data.get('responses', [])]
+    texts.extend(config.failure_phrases)
+    texts.extend(response for rule in load_keyword_rules(KEYWORD_ROUTER_CONFIG['rules_path'])
+                 for response in rule.responses)
+
+    service = PerfumeService()
+    texts.extend(service.snapshot.render_cache.values())
+    # Шаблоны с подстановками озвучиваются только в составе готовых представлений каталога
+    texts.extend(template for template in service.RESPONSE_TEMPLATES.values() if '{' not in template)
+    return list(dict.fromkeys(text for text in texts if text and text.strip()))
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Заранее синтезировать голосовые версии готовых ответов бота")
+    parser.add_argument('--backend', default=VOICE_CONFIG['tts_backend'], choices=list(SYNTHESIZERS))
+    parser.add_argument('--intents', default='intents.json')
+    parser.add_argument('--cache-dir', default=VOICE_CONFIG['tts_cache_dir'])
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    cache = TTSCache(args.cache_dir)
+    synthesizer = CachedSynthesizer(create_synthesizer(args.backend), cache)
+    texts = collect_canned_responses(args.intents)
+    missing = [text for text in texts if not synthesizer.is_cached(text)]
+    print(f"Готовых ответов: {len(texts)}, уже в кэше: {len(texts) - len(missing)}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(synthesizer.synthesize, missing))
+    failed = [(text, status) for text, (_, status) in zip(missing, results) if status != "success"]
+    for text, status in failed[:10]:
+        print(f"Не удалось озвучить «{text[:40]}»: {status}")
+
+    stats = cache.get_stats()
+    print(f"Синтезировано: {len(missing) - len(failed)} за {time.perf_counter() - started:.1f} с, "
+          f"ошибок: {len(failed)}")
+    print(f"Кэш: {stats['entries']} файлов, {stats['bytes'] / 1024 / 1024:.1f} МБ")
+    if stats['evictions']:
+        print(f"Внимание: вытеснено {stats['evictions']} записей, увеличьте tts_cache_max_bytes")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
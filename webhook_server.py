@@ -0,0 +1,248 @@
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from config import EXECUTOR_CONFIG, METRICS_CONFIG, SESSION_CONFIG, UPDATE_QUEUE_CONFIG, WEBHOOK_CONFIG
+from update_queue import UpdateConsumer, UpdateQueue, chat_key
+
+logger = logging.getLogger(__name__)
+
+def _indexed_path(path: str, index: int) -> str:
+    base, extension = os.path.splitext(path)
+    return f"{base}.{index}{extension}"
+
+
+def queue_path(index: int) -> str:
+    return _indexed_path(UPDATE_QUEUE_CONFIG['path'], index)
+
+
+def state_path(index: int) -> str:
+    return _indexed_path(SESSION_CONFIG['state_path'], index)
+
+
+def _worker_main(index: int, wake: multiprocessing.Event, stop: multiprocessing.Event, token: str):
+    logging.basicConfig(format=f'%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s',
+                        level=logging.INFO)
+    try:
+        asyncio.run(_serve_worker(index, wake, stop, token))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve_worker(index: int, wake: multiprocessing.Event, stop: multiprocessing.Event, token: str):
+    """Воркер: свой бот, свои модели и сессии; обновления его чатов читаются из его журнала"""
+    from telegram_bot import TelegramPerfumeBot
+    from session_store import SessionStore
+    from state_store import create_state_store
+
+    # Чаты закреплены за воркером, поэтому и база сессий, и снимок у каждого свои
+    sessions = SessionStore(snapshot_path=f"{SESSION_CONFIG['snapshot_path']}.{index}",
+                            state_store=create_state_store(path=state_path(index)))
+    bot = TelegramPerfumeBot(token, {**EXECUTOR_CONFIG, 'nlp_mode': WEBHOOK_CONFIG['worker_nlp_mode']},
+                             sessions=sessions)
+    app = bot.build_application(with_updater=False)
+    bot.prepare(metrics_port=METRICS_CONFIG['port'] + 1 + index)
+    consumer = UpdateConsumer(UpdateQueue(queue_path(index)), lambda payload: bot.process_payload(app, payload),
+                              concurrency=bot.executor_config['concurrent_updates'])
+
+    def wait_for_updates():
+        # Маршрутизатор будит воркер после каждой записи в журнал
+        while not stop.is_set():
+            if wake.wait(consumer.poll_interval):
+                wake.clear()
+                consumer.notify()
+        consumer.stop()
+
+    async with app:
+        await app.start()
+        await bot._post_init(app)
+        waiter = threading.Thread(target=wait_for_updates, name='update-waiter', daemon=True)
+        logger.info("Воркер готов к приёму обновлений")
+        try:
+            consumer_task = asyncio.create_task(consumer.run())
+            waiter.start()
+            await consumer_task
+        finally:
+            await app.stop()
+            await bot._post_shutdown(app)
+            bot.cleanup()
+            consumer.shutdown()
+
+
+class UpdateRouter:
+    """Принимает вебхук Telegram на одном порту и раздаёт обновления процессам-воркерам.
+
+    Воркер выбирается по идентификатору чата, так что сессия пользователя
+    всегда живёт в одном процессе. Обновление сначала попадает в журнал
+    воркера на диске и только потом подтверждается Telegram, поэтому
+    перезапуск воркера или всего сервера не теряет сообщений. Упавший
+    воркер перезапускается с растущей паузой и дочитывает свой журнал.
+    """
+
+    def __init__(self, token: str, workers: int = None):
+        self.token = token
+        self.worker_count = workers or WEBHOOK_CONFIG['workers']
+        self.secret_token = WEBHOOK_CONFIG['secret_token']
+        self._context = multiprocessing.get_context('spawn')
+        self.queues = [UpdateQueue(queue_path(index)) for index in range(self.worker_count)]
+        self.wake_events = [self._context.Event() for _ in range(self.worker_count)]
+        self.stop_event = self._context.Event()
+        # Записи, ждущие общей транзакции: несколько запросов фиксируются одним коммитом
+        self._pending: List[List[Tuple[int, bytes, asyncio.Future]]] = [[] for _ in range(self.worker_count)]
+        self._flushing = [False] * self.worker_count
+        self._db = ThreadPoolExecutor(max_workers=self.worker_count, thread_name_prefix='update-journal')
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * self.worker_count
+        self._started_at = [0.0] * self.worker_count
+        self._failures = [0] * self.worker_count
+        self.routed = [0] * self.worker_count
+        self.rejected = 0
+        self.restarts = 0
+        self._supervisor: Optional[asyncio.Task] = None
+
+    def worker_for(self, update: Dict[str, Any]) -> int:
+        return chat_key(update) % self.worker_count
+
+    def _spawn(self, index: int):
+        process = self._context.Process(target=_worker_main,
+                                        args=(index, self.wake_events[index], self.stop_event, self.token),
+                                        name=f'bot-worker-{index}', daemon=True)
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(1.0)
+            for index, process in enumerate(self.processes):
+                if process is None or process.is_alive():
+                    continue
+                # Воркер, упавший сразу после старта, перезапускается всё реже
+                if time.monotonic() - self._started_at[index] < 60:
+                    self._failures[index] += 1
+                else:
+                    self._failures[index] = 0
+                delay = min(2 ** self._failures[index], 60) if self._failures[index] else 0
+                logger.warning(f"Воркер {index} завершился с кодом {process.exitcode}, перезапуск через {delay} с")
+                self.processes[index] = None
+                asyncio.get_running_loop().call_later(delay, self._restart, index)
+
+    def _restart(self, index: int):
+        # Убитый процесс мог оставить захваченной блокировку события; журнал на диске остаётся прежним
+        self.wake_events[index] = self._context.Event()
+        self.restarts += 1
+        self._spawn(index)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token:
+            received = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(received, self.secret_token):
+                return web.Response(status=403)
+        payload = await request.read()
+        try:
+            update = json.loads(payload)
+        except ValueError:
+            return web.Response(status=400)
+        update_id = update.get('update_id')
+        if not isinstance(update_id, int):
+            return web.Response(status=400)
+        index = self.worker_for(update)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[index].append((update_id, payload, future))
+        if not self._flushing[index]:
+            self._flushing[index] = True
+            asyncio.get_running_loop().create_task(self._flush(index))
+        try:
+            await future
+        except Exception as e:
+            # Без записи в журнал подтверждать нельзя: Telegram повторит доставку позже
+            logger.error(f"Не удалось сохранить обновление {update_id}: {e}")
+            self.rejected += 1
+            return web.Response(status=503)
+        self.routed[index] += 1
+        return web.Response()
+
+    async def _flush(self, index: int):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending[index]:
+                batch, self._pending[index] = self._pending[index], []
+                try:
+                    await loop.run_in_executor(self._db, self.queues[index].append_many,
+                                               [(update_id, payload) for update_id, payload, _ in batch])
+                except Exception as e:
+                    for _, _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for _, _, future in batch:
+                    future.set_result(None)
+                self.wake_events[index].set()
+        finally:
+            self._flushing[index] = False
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'workers': [process is not None and process.is_alive() for process in self.processes],
+            'pending': [updates.get_stats()['pending'] for updates in self.queues],
+            'duplicates': sum(updates.duplicates for updates in self.queues),
+            'routed': self.routed,
+            'rejected': self.rejected,
+            'restarts': self.restarts
+        })
+
+    async def _on_startup(self, app: web.Application):
+        for index in range(self.worker_count):
+            self._spawn(index)
+        self._supervisor = asyncio.get_running_loop().create_task(self._supervise())
+        if WEBHOOK_CONFIG['public_url']:
+            await self._set_webhook()
+
+    async def _set_webhook(self):
+        from telegram import Bot, Update
+        bot = Bot(self.token, base_url=WEBHOOK_CONFIG['api_base_url'] or 'https://api.telegram.org/bot')
+        async with bot:
+            await bot.set_webhook(url=WEBHOOK_CONFIG['public_url'].rstrip('/') + WEBHOOK_CONFIG['path'],
+                                  secret_token=self.secret_token or None,
+                                  allowed_updates=Update.ALL_TYPES,
+                                  drop_pending_updates=False)
+        logger.info("Вебхук зарегистрирован в Telegram")
+
+    async def _on_cleanup(self, app: web.Application):
+        if self._supervisor:
+            self._supervisor.cancel()
+        self.stop_event.set()
+        for process in self.processes:
+            if process is not None:
+                await asyncio.get_running_loop().run_in_executor(None, process.join, 30)
+        self._db.shutdown(wait=True)
+        for updates in self.queues:
+            updates.close()
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(WEBHOOK_CONFIG['path'], self.handle_update)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def run_webhook(token: str, workers: int = None):
+    router = UpdateRouter(token, workers)
+    print(f"Вебхук: {WEBHOOK_CONFIG['listen']}:{WEBHOOK_CONFIG['port']}{WEBHOOK_CONFIG['path']}, "
+          f"воркеров: {router.worker_count}")
+    web.run_app(router.make_app(), host=WEBHOOK_CONFIG['listen'], port=WEBHOOK_CONFIG['port'], print=None)
+
+
+if __name__ == "__main__":
+    from config import TELEGRAM_TOKEN
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    run_webhook(TELEGRAM_TOKEN)